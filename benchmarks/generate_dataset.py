@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+import asyncpg
+
+from src.config import config
+from src.database import async_session_maker, engine
+
+from src.coil.models import Coil
+from src.coil.rollup import rebuild_coil_daily_rollup
+
+
+COPY_CHUNK_SIZE = 50_000
+
+
+def generate_coils(amount: int, from_date: datetime, to_date: datetime, deleted_ratio: float, seed: int):
+    # arrivals: uniform over the period, denser during the working day (06:00-22:00)
+    # dwell time: log-normal around ~2 weeks, deleted coils never leave in the future
+    rng = random.Random(seed)
+    span = (to_date - from_date).total_seconds()
+    now = datetime.utcnow()
+
+    for _ in range(amount):
+        created_at = from_date + timedelta(seconds=rng.uniform(0, span))
+        if rng.random() < 0.8:
+            created_at = created_at.replace(hour=rng.randint(6, 21))
+
+        deleted_at = None
+        if rng.random() < deleted_ratio:
+            deleted_at = created_at + timedelta(hours=rng.lognormvariate(5.8, 1.0))
+            if deleted_at > now:
+                deleted_at = None
+
+        length = max(1, int(rng.gauss(500, 150)))
+        weight = max(1, int(length * rng.uniform(8, 12)))
+
+        yield length, weight, created_at, deleted_at
+
+async def load_dataset(args: argparse.Namespace) -> None:
+    connection = await asyncpg.connect(
+        host=config.db.HOST, port=config.db.PORT, user=config.db.USER,
+        password=config.db.PASSWORD, database=config.db.NAME,
+    )
+    started_at = time.perf_counter()
+
+    try:
+        if args.truncate:
+            await connection.execute(f"TRUNCATE TABLE {Coil.__tablename__} RESTART IDENTITY")
+
+        # monthly partitions up front, otherwise COPY fills coil_coils_default
+        await connection.execute(
+            "SELECT coil_create_partitions($1, $2)", args.from_date.date(), datetime.utcnow().date()
+        )
+
+        coils = generate_coils(args.amount, args.from_date, args.to_date, args.deleted_ratio, args.seed)
+        loaded = 0
+        while loaded < args.amount:
+            chunk = [coil for _, coil in zip(range(COPY_CHUNK_SIZE), coils)]
+            await connection.copy_records_to_table(
+                Coil.__tablename__, records=chunk, columns=["length", "weight", "created_at", "deleted_at"]
+            )
+            loaded += len(chunk)
+            print(f"loaded {loaded}/{args.amount} coils", flush=True)
+
+        await connection.execute(f"ANALYZE {Coil.__tablename__}")
+    finally:
+        await connection.close()
+
+    async with async_session_maker() as session:
+        await rebuild_coil_daily_rollup(session)
+        await session.commit()
+    await engine.dispose()
+
+    print(f"done in {time.perf_counter() - started_at:.1f}s")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk-load a synthetic coil dataset with COPY")
+    parser.add_argument("--amount", type=int, default=1_000_000)
+    parser.add_argument("--from-date", type=datetime.fromisoformat, default=datetime(2020, 1, 1))
+    parser.add_argument("--to-date", type=datetime.fromisoformat, default=datetime(2023, 12, 31))
+    parser.add_argument("--deleted-ratio", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="empty coil_coils before loading")
+
+    asyncio.run(load_dataset(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Callable
+
+import httpx
+
+
+def percentile(sorted_values: list[float], rank: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(rank / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def random_period(rng: random.Random, from_date: date, to_date: date, max_days: int) -> tuple[date, date]:
+    start = from_date + timedelta(days=rng.randint(0, (to_date - from_date).days))
+    return start, min(to_date, start + timedelta(days=rng.randint(0, max_days)))
+
+def build_scenarios(args: argparse.Namespace) -> dict[str, Callable]:
+    def create_coil(client: httpx.AsyncClient, rng: random.Random):
+        return client.post("/api/coil", json={"length": rng.randint(100, 900), "weight": rng.randint(1000, 9000)})
+
+    def get_coil_by_id(client: httpx.AsyncClient, rng: random.Random):
+        from_id = rng.randint(1, args.max_id)
+        return client.get("/api/coil", params={"from_id": from_id, "to_id": from_id + 100})
+
+    def get_coil_by_created_at(client: httpx.AsyncClient, rng: random.Random):
+        start, end = random_period(rng, args.from_date, args.to_date, 7)
+        return client.get("/api/coil", params={"from_created_at": start, "to_created_at": end})
+
+    def get_coil_combined(client: httpx.AsyncClient, rng: random.Random):
+        start, end = random_period(rng, args.from_date, args.to_date, 30)
+        weight = rng.randint(1000, 8000)
+        return client.get("/api/coil", params={
+            "from_created_at": start, "to_created_at": end,
+            "from_weight": weight, "to_weight": weight + 500,
+            "from_length": 100, "to_length": 600,
+        })
+
+    def delete_coil(client: httpx.AsyncClient, rng: random.Random):
+        return client.delete(f"/api/coil/{rng.randint(1, args.max_id)}")
+
+    def get_stats(client: httpx.AsyncClient, rng: random.Random):
+        start, end = random_period(rng, args.from_date, args.to_date, 90)
+        return client.get("/api/coil/stats", params={"from_date": start, "to_date": end})
+
+    scenarios = {
+        "create": create_coil,
+        "get_by_id": get_coil_by_id,
+        "get_by_created_at": get_coil_by_created_at,
+        "get_combined": get_coil_combined,
+        "delete": delete_coil,
+        "stats": get_stats,
+    }
+    return {name: scenarios[name] for name in args.scenarios}
+
+async def run_scenario(client: httpx.AsyncClient, request: Callable, concurrency: int, requests: int, seed: int) -> dict:
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + worker_id)
+        for _ in remaining:
+            started_at = time.perf_counter()
+            try:
+                response = await request(client, rng)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker(worker_id) for worker_id in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": {str(code): amount for code, amount in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+async def run(args: argparse.Namespace) -> dict:
+    report = {"base_url": args.base_url, "seed": args.seed, "requests": args.requests, "scenarios": {}}
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        for name, request in build_scenarios(args).items():
+            report["scenarios"][name] = {}
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, request, concurrency, args.requests, args.seed)
+                report["scenarios"][name][str(concurrency)] = result
+                print(f"{name} x{concurrency}: {result}", flush=True)
+
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive the coil API at fixed concurrency levels and report latencies")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--scenarios", nargs="+", default=["create", "get_by_id", "get_by_created_at", "get_combined", "delete", "stats"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario and concurrency level")
+    parser.add_argument("--from-date", type=date.fromisoformat, default=date(2020, 1, 1))
+    parser.add_argument("--to-date", type=date.fromisoformat, default=date(2023, 12, 31))
+    parser.add_argument("--max-id", type=int, default=1_000_000)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+
+    args = parser.parse_args()
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 #!/bin/bash
 
 alembic upgrade head
+python -m src.coil.commands create-partitions --months-ahead 3
 
-gunicorn src.main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
+# shared between gunicorn workers so /metrics reports all of them
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+gunicorn src.main:app --config docker/gunicorn.conf.py --workers ${GUNICORN_WORKERS:-4} --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
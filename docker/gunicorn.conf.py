@@ -0,0 +1,6 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # drop the live gauges of a dead worker from the shared PROMETHEUS_MULTIPROC_DIR
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,50 @@
+"""Coil range indexes
+
+Revision ID: 9c2590a67438
+Revises: 0af47fc70513
+Create Date: 2026-10-18 01:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2590a67438'
+down_revision: Union[str, None] = '0af47fc70513'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps coil_coils writable while the indexes are built
+    with op.get_context().autocommit_block():
+        op.create_index('ix_coil_coils_created_at', 'coil_coils', ['created_at'], postgresql_concurrently=True)
+        op.create_index('ix_coil_coils_deleted_at', 'coil_coils', ['deleted_at'], postgresql_concurrently=True)
+        op.create_index('ix_coil_coils_weight', 'coil_coils', ['weight'], postgresql_concurrently=True)
+        op.create_index('ix_coil_coils_length', 'coil_coils', ['length'], postgresql_concurrently=True)
+        op.create_index(
+            'ix_coil_coils_created_at_brin', 'coil_coils', ['created_at'],
+            postgresql_using='brin', postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_coil_coils_created_date', 'coil_coils', [sa.text('date(created_at)')],
+            postgresql_include=['created_at', 'weight'], postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_coil_coils_on_hand', 'coil_coils', ['created_at'],
+            postgresql_where=sa.text('deleted_at IS NULL'), postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_coil_coils_on_hand', table_name='coil_coils', postgresql_concurrently=True)
+        op.drop_index('ix_coil_coils_created_date', table_name='coil_coils', postgresql_concurrently=True)
+        op.drop_index('ix_coil_coils_created_at_brin', table_name='coil_coils', postgresql_concurrently=True)
+        op.drop_index('ix_coil_coils_length', table_name='coil_coils', postgresql_concurrently=True)
+        op.drop_index('ix_coil_coils_weight', table_name='coil_coils', postgresql_concurrently=True)
+        op.drop_index('ix_coil_coils_deleted_at', table_name='coil_coils', postgresql_concurrently=True)
+        op.drop_index('ix_coil_coils_created_at', table_name='coil_coils', postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""Coil daily rollup
+
+Revision ID: f3be3eb67ff1
+Revises: 9c2590a67438
+Create Date: 2026-10-18 02:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3be3eb67ff1'
+down_revision: Union[str, None] = '9c2590a67438'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('coil_daily_rollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('deleted_amount', sa.Integer(), nullable=False),
+    sa.Column('total_length', sa.BigInteger(), nullable=False),
+    sa.Column('total_weight', sa.BigInteger(), nullable=False),
+    sa.Column('max_length', sa.Integer(), nullable=False),
+    sa.Column('min_length', sa.Integer(), nullable=False),
+    sa.Column('max_weight', sa.Integer(), nullable=False),
+    sa.Column('min_weight', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    # initial backfill; later rebuilds: python -m src.coil.commands backfill-rollup
+    op.execute("""
+        INSERT INTO coil_daily_rollup
+        SELECT date(created_at), count(*), count(*) FILTER (WHERE deleted_at IS NOT NULL),
+               sum(length), sum(weight), max(length), min(length), max(weight), min(weight)
+        FROM coil_coils
+        WHERE created_at IS NOT NULL
+        GROUP BY date(created_at)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('coil_daily_rollup')
@@ -0,0 +1,107 @@
+"""Partition coil_coils by month of created_at
+
+Revision ID: 5b1e7d2c9a40
+Revises: f3be3eb67ff1
+Create Date: 2026-10-18 03:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.coil.partitions import PARTITIONS_FUNCTION
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7d2c9a40'
+down_revision: Union[str, None] = 'f3be3eb67ff1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = (
+    "CREATE INDEX ix_coil_coils_id ON coil_coils (id)",
+    "CREATE INDEX ix_coil_coils_created_at ON coil_coils (created_at)",
+    "CREATE INDEX ix_coil_coils_deleted_at ON coil_coils (deleted_at)",
+    "CREATE INDEX ix_coil_coils_weight ON coil_coils (weight)",
+    "CREATE INDEX ix_coil_coils_length ON coil_coils (length)",
+    "CREATE INDEX ix_coil_coils_created_at_brin ON coil_coils USING brin (created_at)",
+    "CREATE INDEX ix_coil_coils_created_date ON coil_coils (date(created_at)) INCLUDE (created_at, weight)",
+    "CREATE INDEX ix_coil_coils_on_hand ON coil_coils (created_at) WHERE deleted_at IS NULL",
+)
+
+def swap_out_coil_table(new_name: str) -> None:
+    # the old table keeps its rows under new_name; its constraint and index names are freed
+    op.execute(f"ALTER TABLE coil_coils RENAME TO {new_name}")
+    op.execute(f"ALTER TABLE {new_name} DROP CONSTRAINT coil_coils_pkey")
+    for index in INDEXES:
+        op.execute(f"DROP INDEX {index.split()[2]}")
+    op.execute(f"ALTER TABLE {new_name} ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE coil_coils_id_seq OWNED BY NONE")
+
+
+def upgrade() -> None:
+    # coil_coils is locked for the copy, run it in a maintenance window on big tables
+    op.execute("LOCK TABLE coil_coils IN ACCESS EXCLUSIVE MODE")
+    swap_out_coil_table("coil_coils_unpartitioned")
+
+    op.execute("""
+        CREATE TABLE coil_coils (
+            id integer NOT NULL DEFAULT nextval('coil_coils_id_seq'),
+            length integer NOT NULL,
+            weight integer NOT NULL,
+            created_at timestamp without time zone NOT NULL,
+            deleted_at timestamp without time zone,
+            CONSTRAINT coil_coils_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE coil_coils_id_seq OWNED BY coil_coils.id")
+    op.execute("CREATE TABLE coil_coils_default PARTITION OF coil_coils DEFAULT")
+    # the same function the models install, so the command and the tests run what the migration created
+    op.execute(PARTITIONS_FUNCTION)
+
+    # partitions for every month with data and three months ahead; later ones are created by
+    # python -m src.coil.commands create-partitions
+    op.execute("""
+        SELECT coil_create_partitions(
+            coalesce((SELECT min(created_at) FROM coil_coils_unpartitioned), now())::date,
+            (now() + interval '3 months')::date
+        )
+    """)
+
+    # created_at was nullable and can not be a partition key value; such rows get the epoch
+    op.execute("""
+        INSERT INTO coil_coils (id, length, weight, created_at, deleted_at)
+        SELECT id, length, weight, coalesce(created_at, 'epoch'), deleted_at
+        FROM coil_coils_unpartitioned
+    """)
+    for index in INDEXES:
+        op.execute(index)
+
+    op.drop_table('coil_coils_unpartitioned')
+    op.execute("ANALYZE coil_coils")
+
+
+def downgrade() -> None:
+    op.execute("LOCK TABLE coil_coils IN ACCESS EXCLUSIVE MODE")
+    swap_out_coil_table("coil_coils_partitioned")
+
+    op.create_table('coil_coils',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('coil_coils_id_seq')"), nullable=False),
+    sa.Column('length', sa.Integer(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=True),
+    sa.Column('deleted_at', sa.TIMESTAMP(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE coil_coils_id_seq OWNED BY coil_coils.id")
+    op.execute("""
+        INSERT INTO coil_coils (id, length, weight, created_at, deleted_at)
+        SELECT id, length, weight, created_at, deleted_at FROM coil_coils_partitioned
+    """)
+    for index in INDEXES:
+        op.execute(index)
+
+    op.execute("DROP TABLE coil_coils_partitioned")
+    op.execute("DROP FUNCTION coil_create_partitions(date, date)")
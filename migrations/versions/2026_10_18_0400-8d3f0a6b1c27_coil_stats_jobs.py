@@ -0,0 +1,44 @@
+"""Coil stats jobs
+
+Revision ID: 8d3f0a6b1c27
+Revises: 5b1e7d2c9a40
+Create Date: 2026-10-18 04:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f0a6b1c27'
+down_revision: Union[str, None] = '5b1e7d2c9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('coil_stats_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('from_date', sa.TIMESTAMP(), nullable=False),
+    sa.Column('to_date', sa.TIMESTAMP(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('finished_at', sa.TIMESTAMP(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_coil_stats_jobs_in_flight', 'coil_stats_jobs', ['from_date', 'to_date'], unique=True,
+        postgresql_where=sa.text("status IN ('pending', 'running')")
+    )
+    op.create_index('ix_coil_stats_jobs_finished_at', 'coil_stats_jobs', ['finished_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_coil_stats_jobs_finished_at', table_name='coil_stats_jobs')
+    op.drop_index('ix_coil_stats_jobs_in_flight', table_name='coil_stats_jobs')
+    op.drop_table('coil_stats_jobs')
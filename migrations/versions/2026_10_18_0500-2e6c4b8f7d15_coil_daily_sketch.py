@@ -0,0 +1,43 @@
+"""Coil daily sketch
+
+Revision ID: 2e6c4b8f7d15
+Revises: 8d3f0a6b1c27
+Create Date: 2026-10-18 05:00:00.000000
+
+"""
+import math
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e6c4b8f7d15'
+down_revision: Union[str, None] = '8d3f0a6b1c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('coil_daily_sketch',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('metric', sa.String(length=16), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'metric', 'bucket')
+    )
+    # initial backfill with gamma = 1.01 / 0.99 (1% relative accuracy, see src/coil/sketch.py),
+    # divided by the same double as the application; later rebuilds: python -m src.coil.commands backfill-rollup
+    op.execute(f"""
+        INSERT INTO coil_daily_sketch
+        SELECT date(created_at), metric, bucket, count(*)
+        FROM coil_coils,
+             LATERAL (VALUES ('length', length), ('weight', weight)) AS metrics(metric, value),
+             LATERAL (SELECT CAST(ceil(ln(greatest(value, 1)) / {math.log(1.01 / 0.99)!r}) AS INTEGER) AS bucket) AS buckets
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('coil_daily_sketch')
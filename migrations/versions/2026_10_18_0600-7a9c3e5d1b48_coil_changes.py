@@ -0,0 +1,38 @@
+"""Coil changes feed
+
+Revision ID: 7a9c3e5d1b48
+Revises: 2e6c4b8f7d15
+Create Date: 2026-10-18 06:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a9c3e5d1b48'
+down_revision: Union[str, None] = '2e6c4b8f7d15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('coil_changes',
+    sa.Column('seq', sa.BigInteger(), sa.Identity(always=False), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('coil_id', sa.Integer(), nullable=False),
+    sa.Column('length', sa.Integer(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('deleted_at', sa.TIMESTAMP(), nullable=True),
+    sa.Column('changed_at', sa.TIMESTAMP(), nullable=False),
+    sa.PrimaryKeyConstraint('seq')
+    )
+    op.create_index(op.f('ix_coil_changes_changed_at'), 'coil_changes', ['changed_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_coil_changes_changed_at'), table_name='coil_changes')
+    op.drop_table('coil_changes')
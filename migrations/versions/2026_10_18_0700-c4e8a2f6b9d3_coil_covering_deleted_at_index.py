@@ -0,0 +1,44 @@
+"""Covering coil deleted_at index
+
+Revision ID: c4e8a2f6b9d3
+Revises: 7a9c3e5d1b48
+Create Date: 2026-10-18 07:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a2f6b9d3'
+down_revision: Union[str, None] = '7a9c3e5d1b48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def replace_deleted_at_index(name: str, columns: str) -> None:
+    # a partitioned index can not be built CONCURRENTLY: the new one starts invalid on the parent, the
+    # partitions are indexed one by one without blocking writes and attached, the last attach makes it valid
+    op.execute(f"CREATE INDEX {name} ON ONLY coil_coils {columns}")
+    partitions = op.get_bind().execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'coil_coils'::regclass"
+    )).scalars().all()
+
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            partition_index = f"{partition}_{name.removeprefix('ix_coil_coils_')}"
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} {columns}")
+            op.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+    op.execute("DROP INDEX ix_coil_coils_deleted_at")
+    op.execute(f"ALTER INDEX {name} RENAME TO ix_coil_coils_deleted_at")
+
+
+def upgrade() -> None:
+    replace_deleted_at_index("ix_coil_coils_deleted_at_covering", "(deleted_at) INCLUDE (created_at, id, length, weight)")
+
+
+def downgrade() -> None:
+    replace_deleted_at_index("ix_coil_coils_deleted_at_plain", "(deleted_at)")
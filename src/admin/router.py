@@ -0,0 +1,46 @@
+import os
+
+from fastapi import APIRouter, HTTPException
+
+from src.database import engine, read_replica_router, replica_engine, slow_query_log
+
+from src.admin.schemas import PoolMetricsSchema, ReplicaStatusSchema, SlowQuerySchema
+
+
+router = APIRouter(
+    prefix='/api/admin',
+    tags=["Admin"]
+)
+
+@router.get("/db/pool")
+async def get_pool_metrics() -> PoolMetricsSchema:
+    # numbers are per gunicorn worker, pid tells the workers apart
+    return PoolMetricsSchema(
+        pid=os.getpid(),
+        replica=replica_engine.pool.metrics() if replica_engine is not None else None,
+        **engine.pool.metrics(),
+    )
+
+@router.get("/db/replica")
+async def get_replica_status() -> ReplicaStatusSchema:
+    configured = read_replica_router.replica is not None
+    if configured:
+        await read_replica_router.check()
+
+    return ReplicaStatusSchema(
+        pid=os.getpid(),
+        configured=configured,
+        healthy=configured and read_replica_router.healthy,
+        lag_seconds=read_replica_router.lag,
+        max_lag_seconds=read_replica_router.max_lag,
+    )
+
+@router.get("/db/slow-queries")
+async def get_slow_queries() -> list[SlowQuerySchema]:
+    if slow_query_log is None:
+        raise HTTPException(status_code=404, detail={
+            "msg": "slow query log is disabled, set DB_SLOW_QUERY_THRESHOLD_MS to enable it"
+        })
+
+    # newest first, per gunicorn worker like the pool metrics
+    return [SlowQuerySchema(pid=os.getpid(), **entry) for entry in reversed(slow_query_log.entries)]
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class PoolSchema(BaseModel):
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    max_overflow: int
+    checkouts: int
+    timeouts: int
+    wait_total_seconds: float
+    wait_max_seconds: float
+
+class PoolMetricsSchema(PoolSchema):
+    pid: int
+    # pool of the read replica engine, when one is configured
+    replica: PoolSchema | None = None
+
+class ReplicaStatusSchema(BaseModel):
+    pid: int
+    configured: bool
+    healthy: bool
+    lag_seconds: float | None
+    max_lag_seconds: float
+
+class SlowQuerySchema(BaseModel):
+    pid: int
+    at: datetime
+    database: str
+    duration_ms: float
+    route: str | None
+    source: str
+    statement: str
+    parameters: str
+    plan: list[str] | None
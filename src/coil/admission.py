@@ -0,0 +1,145 @@
+import asyncio
+from dataclasses import dataclass
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from src.database import apply_statement_timeout, statement_timeout
+from src.metrics import ADMISSION_REJECTIONS, track_queries
+
+from src.coil.models import Coil
+from src.coil.schemas import CoilSchemaGetParams, DateRangeSchema
+from src.coil.servises import get_coil_filters, get_date_range_filter
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+@track_queries
+async def estimate_rows(query: Select, session: AsyncSession) -> int:
+    # planner estimate from the table statistics, the query itself is not run
+    plan = await session.scalar(Explain(query))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+async def estimate_coil_rows(range_params: CoilSchemaGetParams, session: AsyncSession) -> int:
+    return await estimate_rows(select(Coil.id).where(get_coil_filters(range_params)), session)
+
+async def estimate_coil_range_rows(date_range: DateRangeSchema, session: AsyncSession) -> int:
+    # the raw parts of the stats queries read the coils created within the range; the filter on the
+    # partition key keeps the estimate itself cheap
+    return await estimate_rows(select(Coil.id).where(get_date_range_filter(Coil, date_range)), session)
+
+
+@dataclass
+class RouteLimits:
+    max_concurrency: int
+    queue_size: int
+    queue_timeout: float
+    # seconds, 0 turns the timeout off like in Postgres
+    statement_timeout: float
+    # estimated coils a request may read, 0 for no limit
+    max_rows: int
+
+class RouteLimiter:
+    # at most max_concurrency requests of a route query the database at once, up to queue_size
+    # more wait for at most queue_timeout seconds and the rest are turned away right away
+    def __init__(self, route: str, limits: RouteLimits):
+        self.route = route
+        self.limits = limits
+        self.running = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limits.max_concurrency)
+
+    def full(self) -> bool:
+        return self._semaphore.locked() and self.waiting >= self.limits.queue_size
+
+    def check_queue(self, msg: str) -> None:
+        # for work acquiring the limiter after the response, like the stats jobs: turned away up front
+        if self.full():
+            ADMISSION_REJECTIONS.labels(self.route, "queue_full").inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={"msg": msg},
+                headers={"Retry-After": "60"},
+            )
+
+    async def acquire(self) -> bool:
+        if self.full():
+            ADMISSION_REJECTIONS.labels(self.route, "queue_full").inc()
+            return False
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.limits.queue_timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTIONS.labels(self.route, "queue_timeout").inc()
+            return False
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        return True
+
+    def release(self) -> None:
+        self.running -= 1
+        self._semaphore.release()
+
+class AdmissionControl:
+    # one limiter per route, with the limits of its kind
+    def __init__(self, limits: dict[str, RouteLimits]):
+        self.limits = limits
+        self.limiters: dict[str, RouteLimiter] = {}
+
+    def get_limiter(self, kind: str, route: str) -> RouteLimiter:
+        if (limiter := self.limiters.get(route)) is None:
+            limiter = self.limiters[route] = RouteLimiter(route, self.limits[kind])
+        return limiter
+
+# Admission of one request. Routes enter it right before their heavy queries, so cache hits,
+# 304s and the in-memory store do not wait behind them; the slot is released when the response,
+# streamed bodies included, is done.
+class RouteAdmission:
+    def __init__(self, limiter: RouteLimiter):
+        self.limiter = limiter
+        self.admitted = False
+        self._token = None
+
+    def check_rows(self, estimated_rows: int, hint: str) -> None:
+        max_rows = self.limiter.limits.max_rows
+        if max_rows and estimated_rows > max_rows:
+            ADMISSION_REJECTIONS.labels(self.limiter.route, "too_large").inc()
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail={"msg": f"The query would read about {estimated_rows} coils, more than {max_rows}; {hint}"},
+            )
+
+    async def enter(self, session: AsyncSession | None = None) -> None:
+        # session: one the route has already queried, its open transaction gets the timeout too
+        if self.admitted:
+            return
+        if not await self.limiter.acquire():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={"msg": "Too many heavy queries are running, retry later"},
+                headers={"Retry-After": "1"},
+            )
+        self.admitted = True
+        self._token = statement_timeout.set(self.limiter.limits.statement_timeout)
+        if session is not None and session.in_transaction():
+            await apply_statement_timeout(session, self.limiter.limits.statement_timeout)
+
+    def release(self) -> None:
+        if self.admitted:
+            statement_timeout.reset(self._token)
+            self.limiter.release()
+            self.admitted = False
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.coil.cache import StatsCache
+from src.coil.schemas import CoilSchemaCreate
+from src.coil.servises import create_coils
+
+
+logger = logging.getLogger(__name__)
+
+
+class CoilWriteQueueFull(Exception):
+    pass
+
+class CoilWriteRequest:
+    def __init__(self, coil: CoilSchemaCreate):
+        self.coil = coil
+        self.future: asyncio.Future[Row] = asyncio.get_running_loop().create_future()
+
+# Group commit for single-coil POSTs of one worker: coils submitted within `max_delay` seconds of the
+# first one (at most `max_size` of them) go into one multi-row INSERT ... RETURNING and one commit,
+# so a burst of scanners costs one transaction and one connection instead of one per coil.
+class CoilWriteBatcher:
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        stats_cache: StatsCache,
+        max_size: int,
+        max_delay: float,
+        queue_size: int,
+    ):
+        self.session_maker = session_maker
+        self.stats_cache = stats_cache
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue[CoilWriteRequest] = asyncio.Queue(queue_size)
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # the coils already accepted are written before the task goes away
+        self._closing = True
+        if self._task is not None:
+            await self._queue.join()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def submit(self, coil: CoilSchemaCreate) -> Row:
+        # returns the (id, length, weight, created_at) row of the coil once its batch is committed
+        if self._closing:
+            raise CoilWriteQueueFull
+        self.start()
+
+        request = CoilWriteRequest(coil)
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            raise CoilWriteQueueFull from None
+        # a client that goes away does not take the coil out of its batch
+        return await asyncio.shield(request.future)
+
+    async def _collect(self) -> list[CoilWriteRequest]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+        while len(batch) < self.max_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list[CoilWriteRequest]) -> None:
+        try:
+            async with self.session_maker() as session:
+                coils = await create_coils([request.coil for request in batch], session)
+                await session.commit()
+        except Exception as error:
+            # the whole batch is rolled back, every caller gets the error of its own request
+            logger.warning("coil write batch of %d failed", len(batch), exc_info=True)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(error)
+            return
+
+        self.stats_cache.invalidate(coil.created_at for coil in coils)
+        # RETURNING keeps the input order, so each caller gets its own id
+        for request, coil in zip(batch, coils):
+            if not request.future.done():
+                request.future.set_result(coil)
@@ -0,0 +1,73 @@
+import bisect
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+from src.coil.schemas import CoilStatsSchema
+
+
+# stats with the etag they were served with
+CachedStats = tuple[CoilStatsSchema, str]
+
+@dataclass
+class StatsCacheEntry:
+    value: CachedStats
+    expires_at: float
+
+# LRU + TTL cache of /stats results keyed on the normalized (from_date, to_date) range.
+# Writes invalidate every entry whose range contains the creation time of an affected coil.
+class StatsCache:
+    def __init__(self, max_size: int, ttl: float, long_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.long_ttl = long_ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._entries: OrderedDict[tuple[datetime, datetime], StatsCacheEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple[datetime, datetime]) -> CachedStats | None:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: tuple[datetime, datetime], value: CachedStats, long_lived: bool, version: int) -> None:
+        # a write that happened while the value was computed may have made it stale
+        if version != self.version or self.max_size <= 0:
+            return
+
+        ttl = self.long_ttl if long_lived else self.ttl
+        self._entries[key] = StatsCacheEntry(value=value, expires_at=time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, moments: Iterable[datetime]) -> None:
+        moments = sorted(moments)
+        if not moments:
+            return
+
+        self.version += 1
+        for from_date, to_date in list(self._entries):
+            index = bisect.bisect_left(moments, from_date)
+            if index < len(moments) and moments[index] <= to_date:
+                del self._entries[(from_date, to_date)]
+
+    def clear(self) -> None:
+        self.version += 1
+        self._entries.clear()
+
+    def info(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
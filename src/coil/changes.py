@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, Sequence
+
+import asyncpg
+from sqlalchemy import Row, cast, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import REGCLASS
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config import DBConfig
+from src.metrics import track_queries
+
+from src.coil.cache import StatsCache
+from src.coil.models import CoilChange
+
+
+logger = logging.getLogger(__name__)
+
+CHANGES_CHANNEL = "coil_changes"
+# key of the transaction-level advisory lock that makes change seqs commit in increasing order
+CHANGES_LOCK_KEY = 0x636F696C
+# and of the one that lets a single worker prune the feed at a time
+CHANGES_PRUNE_LOCK_KEY = 0x636F696D
+# the last seq handed out by the identity, NULL before the first change; it survives the pruning of every
+# change, so the feed neither starts over nor loses track of what its clients missed
+CHANGES_LAST_SEQ = func.pg_sequence_last_value(
+    cast(func.pg_get_serial_sequence(CoilChange.__tablename__, "seq"), REGCLASS)
+)
+
+
+@track_queries
+async def record_coil_changes(kind: str, coils: Sequence[Row], session: AsyncSession) -> None:
+    # coils: rows of (id, length, weight, created_at[, deleted_at]) in the caller's transaction
+    if not coils:
+        return
+
+    # held until commit, so a reader that has seen seq N never misses a smaller seq committed later;
+    # it is taken last in the transaction and only serializes the commits of coil writes
+    await session.execute(select(func.pg_advisory_xact_lock(CHANGES_LOCK_KEY)))
+    await session.execute(insert(CoilChange), [
+        {
+            "kind": kind, "coil_id": coil.id, "length": coil.length, "weight": coil.weight,
+            "created_at": coil.created_at, "deleted_at": coil._mapping.get("deleted_at"),
+        }
+        for coil in coils
+    ])
+    # delivered on commit and dropped on rollback; identical notifications of a transaction are folded
+    await session.execute(select(func.pg_notify(CHANGES_CHANNEL, "")))
+
+@track_queries
+async def get_coil_changes(after: int, limit: int, session: AsyncSession) -> list[CoilChange]:
+    query = select(CoilChange).where(CoilChange.seq > after).order_by(CoilChange.seq).limit(limit)
+    return list(await session.scalars(query))
+
+@track_queries
+async def get_coil_changes_bounds(session: AsyncSession) -> tuple[int | None, int]:
+    # (oldest kept seq, last seq); with every change pruned the oldest kept one is the next to come,
+    # both are None and 0 for a feed that never had a change
+    bounds = (await session.execute(select(
+        func.coalesce(func.min(CoilChange.seq), CHANGES_LAST_SEQ + 1),
+        func.coalesce(func.max(CoilChange.seq), CHANGES_LAST_SEQ, 0),
+    ))).first()
+    return bounds[0], bounds[1]
+
+@track_queries
+async def get_coil_changes_watermark(session: AsyncSession) -> int:
+    # moves with every coil write made through the api, a cheap version of coil_coils
+    return await session.scalar(select(func.coalesce(func.max(CoilChange.seq), CHANGES_LAST_SEQ, 0)))
+
+@track_queries
+async def prune_coil_changes(session: AsyncSession, keep_days: int) -> int:
+    result = await session.execute(
+        delete(CoilChange).where(CoilChange.changed_at < datetime.utcnow() - timedelta(days=keep_days))
+    )
+    return result.rowcount
+
+
+class CoilChangeSubscription:
+    def __init__(self, buffer_size: int):
+        self.queue: asyncio.Queue[CoilChange] = asyncio.Queue(buffer_size)
+        self.overflowed = False
+
+# One LISTEN connection per worker. A notification triggers a single read of the new changes, which
+# is fanned out to the subscribers' queues and invalidates the worker's stats cache, so writes made
+# through other workers do not leave stale /stats entries behind. With retention_days set, the feed
+# also deletes the changes older than that every prune_interval seconds.
+class CoilChangeFeed:
+    PAGE_SIZE = 1000
+
+    def __init__(
+        self,
+        db_config: DBConfig,
+        session_maker: async_sessionmaker[AsyncSession],
+        stats_cache: StatsCache,
+        buffer_size: int,
+        poll_interval: float = 5,
+        retention_days: int | None = None,
+        prune_interval: float = 3600,
+    ):
+        self.db_config = db_config
+        self.session_maker = session_maker
+        self.stats_cache = stats_cache
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.pruned_at = float("-inf")
+        self.last_seq: int | None = None
+        self._subscribers: set[CoilChangeSubscription] = set()
+        self._wakeup = asyncio.Event()
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._ready.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _connect(self) -> asyncpg.Connection:
+        # LISTEN needs a session of its own, so it bypasses pgbouncer when DB_LISTEN_HOST is set
+        return await asyncpg.connect(
+            host=self.db_config.LISTEN_HOST or self.db_config.HOST,
+            port=self.db_config.LISTEN_PORT or self.db_config.PORT,
+            user=self.db_config.USER,
+            password=self.db_config.PASSWORD,
+            database=self.db_config.NAME,
+        )
+
+    def _notify(self, connection, pid, channel, payload) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                connection = await self._connect()
+                try:
+                    await connection.add_listener(CHANGES_CHANNEL, self._notify)
+                    # read after LISTEN: later commits either are above last_seq or wake the feed up
+                    if self.last_seq is None:
+                        async with self.session_maker() as session:
+                            _, self.last_seq = await get_coil_changes_bounds(session)
+                    self._ready.set()
+
+                    # after a reconnect the first pass catches up on the changes missed meanwhile
+                    while not connection.is_closed():
+                        await self._dispatch()
+                        await self._prune()
+                        try:
+                            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                        except asyncio.TimeoutError:
+                            pass
+                        self._wakeup.clear()
+                finally:
+                    await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("coil change feed lost its connection, reconnecting", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _dispatch(self) -> None:
+        while True:
+            async with self.session_maker() as session:
+                changes = await get_coil_changes(self.last_seq, self.PAGE_SIZE, session)
+            if not changes:
+                return
+
+            self.last_seq = changes[-1].seq
+            self.stats_cache.invalidate(change.created_at for change in changes)
+
+            for subscription in list(self._subscribers):
+                for change in changes:
+                    try:
+                        subscription.queue.put_nowait(change)
+                    except asyncio.QueueFull:
+                        # a slow subscriber goes back to reading the table instead of holding memory
+                        subscription.overflowed = True
+                        self._subscribers.discard(subscription)
+                        break
+
+            if len(changes) < self.PAGE_SIZE:
+                return
+
+    async def _prune(self) -> None:
+        if self.retention_days is None or time.monotonic() - self.pruned_at < self.prune_interval:
+            return
+        self.pruned_at = time.monotonic()
+
+        try:
+            async with self.session_maker() as session:
+                # the feeds of all workers get here, one of them prunes
+                if not await session.scalar(select(func.pg_try_advisory_xact_lock(CHANGES_PRUNE_LOCK_KEY))):
+                    return
+                pruned = await prune_coil_changes(session, self.retention_days)
+                await session.commit()
+        except Exception:
+            logger.warning("could not prune the coil change feed", exc_info=True)
+            return
+        if pruned:
+            logger.info("coil change feed: pruned %d change(s)", pruned)
+
+    async def _read_changes(self, after: int) -> AsyncGenerator[CoilChange, None]:
+        while True:
+            async with self.session_maker() as session:
+                changes = await get_coil_changes(after, self.PAGE_SIZE, session)
+            for change in changes:
+                yield change
+            if len(changes) < self.PAGE_SIZE:
+                return
+            after = changes[-1].seq
+
+    async def subscribe(self, after: int | None, heartbeat: float) -> AsyncGenerator[CoilChange | None, None]:
+        # yields the changes with seq > after (only the new ones when after is None) in seq order,
+        # and None after every `heartbeat` idle seconds
+        self.start()
+        await self._ready.wait()
+
+        while True:
+            # registered before reading the table, so nothing falls between the two; overlaps are skipped
+            subscription = CoilChangeSubscription(self.buffer_size)
+            self._subscribers.add(subscription)
+            try:
+                if after is None:
+                    async with self.session_maker() as session:
+                        _, after = await get_coil_changes_bounds(session)
+
+                async for change in self._read_changes(after):
+                    yield change
+                    after = change.seq
+
+                while not (subscription.overflowed and subscription.queue.empty()):
+                    try:
+                        change = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+                    except asyncio.TimeoutError:
+                        yield None
+                        continue
+                    if change.seq > after:
+                        yield change
+                        after = change.seq
+            finally:
+                self._subscribers.discard(subscription)
+
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+from datetime import date
+
+from src.config import config
+from src.database import async_session_maker
+
+from src.coil.changes import prune_coil_changes
+from src.coil.partitions import add_months, create_coil_partitions
+from src.coil.rollup import rebuild_coil_daily_rollup
+
+
+async def backfill_rollup(from_day: date | None, to_day: date | None) -> None:
+    async with async_session_maker() as session:
+        days = await rebuild_coil_daily_rollup(session, from_day, to_day)
+        await session.commit()
+
+    print(f"coil_daily_rollup: rebuilt {days} day(s)")
+
+async def create_partitions(months_ahead: int) -> None:
+    current_month = date.today().replace(day=1)
+    async with async_session_maker() as session:
+        created = await create_coil_partitions(session, current_month, add_months(current_month, months_ahead))
+        await session.commit()
+
+    print(f"coil_coils: created {created} partition(s)")
+
+async def prune_changes(keep_days: int) -> None:
+    async with async_session_maker() as session:
+        pruned = await prune_coil_changes(session, keep_days)
+        await session.commit()
+
+    print(f"coil_changes: pruned {pruned} change(s)")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Coil maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill-rollup", help="Recompute coil_daily_rollup from coil_coils")
+    backfill.add_argument("--from-date", type=date.fromisoformat, default=None)
+    backfill.add_argument("--to-date", type=date.fromisoformat, default=None)
+
+    partitions = commands.add_parser(
+        "create-partitions", help="Create the monthly coil_coils partitions ahead of time"
+    )
+    partitions.add_argument("--months-ahead", type=int, default=3)
+
+    prune = commands.add_parser("prune-changes", help="Delete the change feed events older than --keep-days")
+    prune.add_argument("--keep-days", type=int, default=config.coil.CHANGES_RETENTION_DAYS)
+
+    args = parser.parse_args()
+
+    if args.command == "backfill-rollup":
+        asyncio.run(backfill_rollup(args.from_date, args.to_date))
+    elif args.command == "create-partitions":
+        asyncio.run(create_partitions(args.months_ahead))
+    elif args.command == "prune-changes":
+        asyncio.run(prune_changes(args.keep_days))
+
+if __name__ == "__main__":
+    main()
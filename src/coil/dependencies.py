@@ -0,0 +1,38 @@
+from typing import AsyncGenerator
+
+from fastapi import Request
+
+from src.coil.admission import RouteAdmission, RouteLimiter
+from src.coil.batcher import CoilWriteBatcher
+from src.coil.cache import StatsCache
+from src.coil.changes import CoilChangeFeed
+from src.coil.memory import CoilColumnStore
+
+
+def get_stats_cache(request: Request) -> StatsCache:
+    return request.app.state.stats_cache
+
+def get_change_feed(request: Request) -> CoilChangeFeed:
+    return request.app.state.change_feed
+
+def get_coil_store(request: Request) -> CoilColumnStore | None:
+    coil_store = request.app.state.coil_store
+    return coil_store if coil_store is not None and coil_store.ready else None
+
+def get_write_batcher(request: Request) -> CoilWriteBatcher | None:
+    return request.app.state.write_batcher
+
+def get_stats_job_limiter(request: Request) -> RouteLimiter:
+    # background stats jobs of the worker, bounded apart from the requests of the stats routes
+    return request.app.state.admission.get_limiter("jobs", request.scope["route"].path)
+
+def admit(kind: str):
+    # admission of the request to a heavy route of the given kind ("stats", "list")
+    async def get_route_admission(request: Request) -> AsyncGenerator[RouteAdmission, None]:
+        admission = RouteAdmission(request.app.state.admission.get_limiter(kind, request.scope["route"].path))
+        try:
+            yield admission
+        finally:
+            admission.release()
+
+    return get_route_admission
@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.database import statement_timeout
+from src.metrics import track_queries
+
+from src.coil.admission import RouteLimiter
+from src.coil.models import CoilStatsJob
+from src.coil.schemas import DateRangeSchema
+from src.coil.servises import get_coil_stats_summary, make_coil_stats
+
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT_STATUSES = ("pending", "running")
+
+
+@track_queries
+async def expire_stats_jobs(session: AsyncSession, result_ttl: float, timeout: float) -> None:
+    now = datetime.utcnow()
+    # jobs of a worker that died never finish, they stop blocking new ones after the timeout
+    await session.execute(
+        update(CoilStatsJob)
+        .where(CoilStatsJob.status.in_(IN_FLIGHT_STATUSES), CoilStatsJob.created_at < now - timedelta(seconds=timeout))
+        .values(status="failed", error="timed out", finished_at=now)
+    )
+    await session.execute(
+        delete(CoilStatsJob).where(CoilStatsJob.finished_at < now - timedelta(seconds=result_ttl))
+    )
+
+@track_queries
+async def create_stats_job(
+    date_range: DateRangeSchema, session: AsyncSession, result_ttl: float
+) -> tuple[CoilStatsJob, bool]:
+    # returns the job for the range and whether it was just created; an in-flight job
+    # or a finished one that is still kept is shared by identical requests
+    reusable = select(CoilStatsJob).where(
+        CoilStatsJob.from_date == date_range.from_date,
+        CoilStatsJob.to_date == date_range.to_date,
+        or_(
+            CoilStatsJob.status.in_(IN_FLIGHT_STATUSES),
+            (CoilStatsJob.status == "done")
+            & (CoilStatsJob.finished_at >= datetime.utcnow() - timedelta(seconds=result_ttl)),
+        )
+    ).order_by(CoilStatsJob.id.desc()).limit(1)
+
+    if (job := await session.scalar(reusable)) is not None:
+        return job, False
+
+    # the unique partial index settles a race between two workers
+    query = pg_insert(CoilStatsJob).values(
+        from_date=date_range.from_date, to_date=date_range.to_date, status="pending", created_at=datetime.utcnow()
+    ).on_conflict_do_nothing(
+        index_elements=[CoilStatsJob.from_date, CoilStatsJob.to_date],
+        index_where=CoilStatsJob.status.in_(IN_FLIGHT_STATUSES),
+    ).returning(CoilStatsJob)
+
+    if (job := await session.scalar(query)) is not None:
+        return job, True
+
+    return await session.scalar(reusable), False
+
+@track_queries
+async def get_stats_job(id: int, session: AsyncSession, result_ttl: float) -> CoilStatsJob | None:
+    query = select(CoilStatsJob).where(
+        CoilStatsJob.id == id,
+        or_(
+            CoilStatsJob.finished_at.is_(None),
+            CoilStatsJob.finished_at >= datetime.utcnow() - timedelta(seconds=result_ttl),
+        )
+    )
+    return await session.scalar(query)
+
+@track_queries
+async def run_stats_job(
+    id: int,
+    date_range: DateRangeSchema,
+    session_maker: async_sessionmaker[AsyncSession],
+    read_session_maker: async_sessionmaker[AsyncSession],
+    limiter: RouteLimiter,
+) -> None:
+    async def finish(**values):
+        async with session_maker() as session:
+            await session.execute(update(CoilStatsJob).where(CoilStatsJob.id == id).values(**values))
+            await session.commit()
+
+    # the job stays pending until it gets a slot of the jobs limiter
+    if not await limiter.acquire():
+        return await finish(status="failed", error="too many stats jobs were queued", finished_at=datetime.utcnow())
+
+    token = statement_timeout.set(limiter.limits.statement_timeout)
+    try:
+        await finish(status="running")
+
+        try:
+            coil_stats = await get_coil_stats_summary(date_range, read_session_maker)
+        except Exception:
+            logger.exception("stats job %s failed", id)
+            return await finish(status="failed", error="stats computation failed", finished_at=datetime.utcnow())
+
+        if coil_stats["amount"] == 0:
+            return await finish(
+                status="failed",
+                error=f"No data was found between {date_range.from_date} and {date_range.to_date}",
+                finished_at=datetime.utcnow(),
+            )
+
+        await finish(
+            status="done", result=make_coil_stats(coil_stats).model_dump(mode="json"), finished_at=datetime.utcnow()
+        )
+    finally:
+        statement_timeout.reset(token)
+        limiter.release()
@@ -0,0 +1,429 @@
+import asyncio
+import logging
+from collections import namedtuple
+from datetime import date, datetime
+from typing import AsyncIterator
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.coil.changes import CoilChangeFeed, get_coil_changes_watermark
+from src.coil.models import Coil, CoilChange
+from src.coil.schemas import CoilSchemaGetParams, DateRangeSchema
+from src.coil.servises import COIL_READ_FIELDS, summarize_occupancy
+
+
+logger = logging.getLogger(__name__)
+
+CoilRow = namedtuple("CoilRow", COIL_READ_FIELDS)
+
+NAT = int(np.datetime64("NaT").view(np.int64))
+
+OCCUPANCY_UNITS = {
+    "day": "datetime64[D]",
+    "hour": "datetime64[h]",
+}
+
+
+def get_epoch_microseconds(column):
+    # integers load far faster than datetime objects, both on the asyncpg and on the numpy side
+    return func.coalesce(cast(func.extract("epoch", column) * 1_000_000, BigInteger), NAT)
+
+def to_datetime64(value: date | datetime) -> np.datetime64:
+    return np.datetime64(value, "us")
+
+def get_gaps(moments: np.ndarray) -> tuple:
+    # (max, min) gap between neighbouring sorted moments, like max()/min() over LAG() in SQL
+    if len(moments) < 2:
+        return None, None
+    gaps = np.diff(moments)
+    return gaps.max().item(), gaps.min().item()
+
+class ColumnBuffer:
+    # numpy array with spare room at the end: appends do not copy what is already there, and the arrays
+    # handed out before stay as they were
+    def __init__(self, values: np.ndarray):
+        self._data = values
+        self.size = len(values)
+        # values handed out to a reader that outlives the merge, e.g. a streamed response
+        self.shared = False
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self.size]
+
+    def append(self, values: np.ndarray) -> None:
+        if self.size + len(values) > len(self._data):
+            data = np.empty(max(2 * len(self._data), self.size + len(values), 1024), dtype=self._data.dtype)
+            data[:self.size] = self.values
+            self._data = data
+        self._data[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def replace(self, values: np.ndarray) -> None:
+        self._data = values
+        self.size = len(values)
+        self.shared = False
+
+    def detach(self) -> None:
+        # before changing values in place
+        if self.shared:
+            self._data = self._data.copy()
+            self.shared = False
+
+def shift_positions(positions: np.ndarray, inserted_at: np.ndarray) -> np.ndarray:
+    # positions after np.insert(..., inserted_at, ...) on the array they point into
+    return positions + np.searchsorted(inserted_at, positions, "right")
+
+def find_ids(ids: np.ndarray, sorted_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # positions of ids in sorted_ids and whether each one is there
+    positions = np.searchsorted(sorted_ids, ids)
+    found = positions < len(sorted_ids)
+    found[found] = sorted_ids[positions[found]] == ids[found]
+    return positions, found
+
+# Columnar copy of coil_coils in the worker's memory: numpy arrays sorted by id plus created_at and
+# deleted_at permutations for binary searches. It is loaded from one snapshot together with the change
+# watermark and then follows the change feed, so its data is the table as of `applied_seq`.
+# Applied changes are buffered and merged into the arrays by the first read after them. New coils and
+# deletions almost always come last in id, created_at and deleted_at order, so a merge appends to the
+# arrays; the rest is put in place with binary searches, nothing is sorted again.
+class CoilColumnStore:
+    def __init__(
+        self,
+        session_maker: async_sessionmaker[AsyncSession],
+        change_feed: CoilChangeFeed,
+        heartbeat: float = 15,
+        retry_interval: float = 5,
+    ):
+        self.session_maker = session_maker
+        self.change_feed = change_feed
+        self.heartbeat = heartbeat
+        self.retry_interval = retry_interval
+        self.applied_seq: int | None = None
+        self._set_columns([], [], [], [], [])
+        self._created: list[tuple] = []
+        self._deleted: dict[int, datetime] = {}
+        self._applied = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.applied_seq is not None
+
+    def __len__(self) -> int:
+        self._merge()
+        return len(self.id)
+
+    def _set_columns(self, ids, lengths, weights, created_at, deleted_at) -> None:
+        self._buffers = {
+            "id": ColumnBuffer(np.asarray(ids, dtype=np.int64)),
+            "length": ColumnBuffer(np.asarray(lengths, dtype=np.int64)),
+            "weight": ColumnBuffer(np.asarray(weights, dtype=np.int64)),
+            "created_at": ColumnBuffer(np.asarray(created_at, dtype="datetime64[us]")),
+            "deleted_at": ColumnBuffer(np.asarray(deleted_at, dtype="datetime64[us]")),
+        }
+        self._index()
+
+    def _index(self) -> None:
+        created_order = np.argsort(self._buffers["created_at"].values, kind="stable")
+        # live coils are left out, a deletion range never matches NaT
+        deleted_at = self._buffers["deleted_at"].values
+        deleted_order = np.flatnonzero(~np.isnat(deleted_at))
+        deleted_order = deleted_order[np.argsort(deleted_at[deleted_order], kind="stable")]
+        self._buffers.update({
+            "created_order": ColumnBuffer(created_order),
+            "created_sorted": ColumnBuffer(self._buffers["created_at"].values[created_order]),
+            "deleted_order": ColumnBuffer(deleted_order),
+            "deleted_sorted": ColumnBuffer(deleted_at[deleted_order]),
+        })
+        self._publish()
+
+    def _publish(self) -> None:
+        self.id, self.length, self.weight, self.created_at, self.deleted_at = (
+            self._buffers[field].values for field in COIL_READ_FIELDS
+        )
+        self._created_order = self._buffers["created_order"].values
+        self._created_sorted = self._buffers["created_sorted"].values
+        self._deleted_order = self._buffers["deleted_order"].values
+        self._deleted_sorted = self._buffers["deleted_sorted"].values
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        return {
+            "id": self.id, "length": self.length, "weight": self.weight,
+            "created_at": self.created_at, "deleted_at": self.deleted_at,
+        }
+
+    async def load(self) -> None:
+        # the rows and the watermark come from one snapshot: the changes after it are exactly the missing ones
+        async with self.session_maker() as session:
+            await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            watermark = await get_coil_changes_watermark(session)
+            # the arrays are allocated once and filled a partition at a time
+            size = await session.scalar(select(func.count()).select_from(Coil))
+            columns = np.empty((len(COIL_READ_FIELDS), size), dtype=np.int64)
+
+            # no ORDER BY: a merge of every partition costs more than the argsort below
+            query = select(
+                Coil.id, Coil.length, Coil.weight,
+                get_epoch_microseconds(Coil.created_at), get_epoch_microseconds(Coil.deleted_at),
+            )
+            result = await session.stream(query.execution_options(yield_per=50_000))
+            loaded = 0
+            async for rows in result.partitions():
+                columns[:, loaded:loaded + len(rows)] = np.array(rows, dtype=np.int64).T
+                loaded += len(rows)
+
+        # sorted a column at a time, so the copy of one column is all that is needed on top
+        order = np.argsort(columns[0], kind="stable")
+        for column in columns:
+            column[:] = column[order]
+        ids, lengths, weights, created_at, deleted_at = columns
+        self._set_columns(
+            ids, lengths, weights, created_at.view("datetime64[us]"), deleted_at.view("datetime64[us]")
+        )
+        self._created.clear()
+        self._deleted.clear()
+        self.applied_seq = watermark
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self.ready:
+                    await self.load()
+                    await self._notify_applied()
+                async for change in self.change_feed.subscribe(self.applied_seq, self.heartbeat):
+                    if change is not None:
+                        self.apply(change)
+                        await self._notify_applied()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("coil column store stopped following the changes, retrying", exc_info=True)
+                await asyncio.sleep(self.retry_interval)
+
+    async def _notify_applied(self) -> None:
+        async with self._applied:
+            self._applied.notify_all()
+
+    async def sync(self, session: AsyncSession, timeout: float = 1) -> bool:
+        # waits for the changes committed so far, so a client reads its own writes through this worker
+        watermark = await get_coil_changes_watermark(session)
+        try:
+            async with self._applied:
+                await asyncio.wait_for(
+                    self._applied.wait_for(lambda: self.ready and self.applied_seq >= watermark), timeout
+                )
+        except asyncio.TimeoutError:
+            logger.warning("coil column store is behind change %s", watermark)
+            return False
+        return True
+
+    def apply(self, change: CoilChange) -> None:
+        if change.kind == "created":
+            self._created.append(
+                (change.coil_id, change.length, change.weight, change.created_at, change.deleted_at)
+            )
+        else:
+            self._deleted[change.coil_id] = change.deleted_at
+        self.applied_seq = change.seq
+
+    def _merge(self) -> None:
+        if not self._created and not self._deleted:
+            return
+
+        if self._created:
+            created = [
+                np.asarray(values, dtype=self._buffers[field].values.dtype)
+                for field, values in zip(COIL_READ_FIELDS, zip(*self._created))
+            ]
+            # a creation replayed after a reload is already in the arrays
+            _, found = find_ids(created[0], self.id)
+            _, first = np.unique(created[0][~found], return_index=True)
+            self._add_coils([values[~found][first] for values in created])
+
+        if self._deleted:
+            ids = np.fromiter(self._deleted.keys(), dtype=np.int64, count=len(self._deleted))
+            deleted_at = np.asarray(list(self._deleted.values()), dtype="datetime64[us]")
+            positions, found = find_ids(ids, self.id)
+            positions, deleted_at = positions[found], deleted_at[found]
+            current = self.deleted_at[positions]
+            changed = current != deleted_at
+            buffer = self._buffers["deleted_at"]
+            buffer.detach()
+            buffer.values[positions[changed]] = deleted_at[changed]
+            if np.isnat(current[changed]).all():
+                self._add_to_order("deleted", positions[changed], deleted_at[changed])
+            else:
+                # a deleted coil with another deletion time, not written by the api
+                self._index()
+
+        self._created.clear()
+        self._deleted.clear()
+        self._publish()
+
+    def _add_coils(self, columns: list[np.ndarray]) -> None:
+        # columns of the new coils, sorted by id
+        ids = columns[0]
+        if not len(ids):
+            return
+
+        size = len(self.id)
+        if not size or ids[0] > self.id[-1]:
+            for field, values in zip(COIL_READ_FIELDS, columns):
+                self._buffers[field].append(values)
+            positions = np.arange(size, size + len(ids))
+        else:
+            # ids committed out of order: the later coils move up, so do their positions in the orders
+            inserted_at = np.searchsorted(self.id, ids)
+            for field, values in zip(COIL_READ_FIELDS, columns):
+                self._buffers[field].replace(np.insert(self._buffers[field].values, inserted_at, values))
+            for order in ("created_order", "deleted_order"):
+                self._buffers[order].replace(shift_positions(self._buffers[order].values, inserted_at))
+            positions = inserted_at + np.arange(len(ids))
+        self._publish()
+
+        self._add_to_order("created", positions, columns[3])
+        deleted = ~np.isnat(columns[4])
+        self._add_to_order("deleted", positions[deleted], columns[4][deleted])
+
+    def _add_to_order(self, name: str, positions: np.ndarray, values: np.ndarray) -> None:
+        if not len(positions):
+            return
+
+        order, sorted_values = self._buffers[f"{name}_order"], self._buffers[f"{name}_sorted"]
+        new_order = np.argsort(values, kind="stable")
+        positions, values = positions[new_order], values[new_order]
+        if not sorted_values.size or values[0] >= sorted_values.values[-1]:
+            order.append(positions)
+            sorted_values.append(values)
+        else:
+            inserted_at = np.searchsorted(sorted_values.values, values, "right")
+            order.replace(np.insert(order.values, inserted_at, positions))
+            sorted_values.replace(np.insert(sorted_values.values, inserted_at, values))
+
+    def _get_positions(self, range_params: CoilSchemaGetParams) -> np.ndarray:
+        # positions, in id order, of the coils inside every range; binary searches on the sorted columns
+        # narrow the candidates, vectorized masks check the remaining ranges
+        self._merge()
+        params: dict = range_params.model_dump(exclude_none=True)
+        ranges = {
+            from_field.replace("from_", "", 1): (params[from_field], params[to_field])
+            for from_field, to_field in CoilSchemaGetParams.dependant_fields.items() if params.get(from_field)
+        }
+        for field in ("created_at", "deleted_at"):
+            if field in ranges:
+                ranges[field] = tuple(map(to_datetime64, ranges[field]))
+
+        low, high = 0, len(self.id)
+        if "id" in ranges:
+            low, high = np.searchsorted(self.id, ranges["id"][0]), np.searchsorted(self.id, ranges["id"][1], "right")
+        if range_params.limit:
+            low = max(low, np.searchsorted(self.id, range_params.after_id, "right"))
+        candidates = np.arange(low, high)
+
+        for field, order, values in (
+            ("created_at", self._created_order, self._created_sorted),
+            ("deleted_at", self._deleted_order, self._deleted_sorted),
+        ):
+            if field not in ranges:
+                continue
+            start, stop = np.searchsorted(values, ranges[field][0]), np.searchsorted(values, ranges[field][1], "right")
+            if stop - start < len(candidates):
+                positions = np.sort(order[start:stop])
+                candidates = positions[(positions >= low) & (positions < high)]
+
+        mask = np.ones(len(candidates), dtype=bool)
+        for field, (from_value, to_value) in ranges.items():
+            values = self.columns[field][candidates]
+            mask &= (values >= from_value) & (values <= to_value)
+
+        return candidates[mask]
+
+    def _get_rows(self, positions: np.ndarray, columns: dict[str, np.ndarray] | None = None) -> list[CoilRow]:
+        columns = columns or self.columns
+        return list(map(CoilRow, *(columns[field][positions].tolist() for field in COIL_READ_FIELDS)))
+
+    def get_coils(self, range_params: CoilSchemaGetParams, lookahead: int = 0) -> list[CoilRow]:
+        positions = self._get_positions(range_params)
+        if range_params.limit:
+            positions = positions[:range_params.limit + lookahead]
+        return self._get_rows(positions)
+
+    async def stream_coil_rows(self, range_params: CoilSchemaGetParams, chunk_size: int) -> AsyncIterator[list[CoilRow]]:
+        # the arrays of the first chunk are kept, later merges replace them instead of changing them
+        positions, columns = self._get_positions(range_params), self.columns
+        for field in COIL_READ_FIELDS:
+            self._buffers[field].shared = True
+        if range_params.limit:
+            positions = positions[:range_params.limit]
+        for start in range(0, len(positions), chunk_size):
+            yield self._get_rows(positions[start:start + chunk_size], columns)
+
+    def get_occupancy(self, date_range: DateRangeSchema, bucket: str) -> list[dict]:
+        # opening balance at from_date + running sum of the per-bucket creations and deletions
+        self._merge()
+        unit = OCCUPANCY_UNITS[bucket]
+        from_date, to_date = to_datetime64(date_range.from_date), to_datetime64(date_range.to_date)
+        first_bucket = from_date.astype(unit)
+        buckets = np.arange(first_bucket, to_date.astype(unit) + 1)
+
+        created_before = self._created_order[:np.searchsorted(self._created_sorted, from_date)]
+        deleted_at = self.deleted_at[created_before]
+        in_stock = created_before[np.isnat(deleted_at) | (deleted_at >= from_date)]
+
+        def get_deltas(order: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            start, stop = np.searchsorted(values, from_date), np.searchsorted(values, to_date, "right")
+            index = (values[start:stop].astype(unit) - first_bucket).astype(np.int64)
+            amounts, weights = np.zeros(len(buckets), np.int64), np.zeros(len(buckets), np.int64)
+            np.add.at(amounts, index, 1)
+            np.add.at(weights, index, self.weight[order[start:stop]])
+            return amounts, weights
+
+        created_amounts, created_weights = get_deltas(self._created_order, self._created_sorted)
+        deleted_amounts, deleted_weights = get_deltas(self._deleted_order, self._deleted_sorted)
+        amounts = len(in_stock) + np.cumsum(created_amounts - deleted_amounts)
+        weights = int(self.weight[in_stock].sum()) + np.cumsum(created_weights - deleted_weights)
+
+        return [
+            {"bucket": moment, "amount": amount, "total_weight": weight}
+            for moment, amount, weight in zip(
+                buckets.astype("datetime64[us]").tolist(), amounts.tolist(), weights.tolist()
+            )
+        ]
+
+    def get_stats_summary(self, date_range: DateRangeSchema) -> dict:
+        # the same fields as get_coil_stats_summary
+        self._merge()
+        start = np.searchsorted(self._created_sorted, to_datetime64(date_range.from_date))
+        stop = np.searchsorted(self._created_sorted, to_datetime64(date_range.to_date), "right")
+        positions = self._created_order[start:stop]
+        lengths, weights = self.length[positions], self.weight[positions]
+        deleted_at = np.sort(self.deleted_at[positions])
+        deleted_at = deleted_at[~np.isnat(deleted_at)]
+
+        summary = {"amount": len(positions), "deleted_amount": len(deleted_at)}
+        for name, values in (("length", lengths), ("weight", weights)):
+            summary.update({
+                f"total_{name}": int(values.sum()) if len(values) else None,
+                f"max_{name}": int(values.max()) if len(values) else None,
+                f"min_{name}": int(values.min()) if len(values) else None,
+            })
+
+        summary["creation_max_time_gap"], summary["creation_min_time_gap"] = get_gaps(self._created_sorted[start:stop])
+        summary["deletion_max_time_gap"], summary["deletion_min_time_gap"] = get_gaps(deleted_at)
+        summary["last_deleted_at"] = deleted_at[-1].item() if len(deleted_at) else None
+
+        return {**summary, **summarize_occupancy(self.get_occupancy(date_range, "day"))}
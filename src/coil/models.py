@@ -1,15 +1,104 @@
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, TIMESTAMP
+from sqlalchemy import BigInteger, Column, Date, Identity, Index, Integer, String, TIMESTAMP, Text, event, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 
 from src.database import Base
 
+from src.coil.partitions import CREATE_DEFAULT_PARTITION, CREATE_PARTITIONS_FUNCTION
+
 
 class Coil(Base):
     __tablename__ = "coil_coils"
 
-    id: int = Column(Integer, primary_key=True, index=True)
+    # the partition key has to be part of the primary key
+    id: int = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    length = Column(Integer, nullable=False)
+    weight = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP, primary_key=True, default=datetime.utcnow)
+    deleted_at = Column(TIMESTAMP)
+
+    __table_args__ = (
+        # range filters of GET /api/coil and the stats date ranges
+        Index("ix_coil_coils_created_at", created_at),
+        # covering, so that the inventory snapshots of GET /api/coil/snapshot are index-only scans
+        Index("ix_coil_coils_deleted_at", deleted_at, postgresql_include=["created_at", "id", "length", "weight"]),
+        Index("ix_coil_coils_weight", weight),
+        Index("ix_coil_coils_length", length),
+        # created_at grows with the table, so a BRIN index stays tiny for wide ranges
+        Index("ix_coil_coils_created_at_brin", created_at, postgresql_using="brin"),
+        # index-only scans for the daily GROUP BY date(created_at)
+        Index(
+            "ix_coil_coils_created_date",
+            func.date(created_at),
+            postgresql_include=["created_at", "weight"],
+        ),
+        # coils currently on hand
+        Index("ix_coil_coils_on_hand", created_at, postgresql_where=text("deleted_at IS NULL")),
+        # monthly partitions, see src/coil/partitions.py
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+event.listen(Coil.__table__, "after_create", CREATE_DEFAULT_PARTITION)
+event.listen(Coil.__table__, "after_create", CREATE_PARTITIONS_FUNCTION)
+
+
+class CoilDailyRollup(Base):
+    __tablename__ = "coil_daily_rollup"
+
+    # aggregates of the coils created on `day`; deleted_amount counts those of them deleted since
+    day = Column(Date, primary_key=True)
+    amount = Column(Integer, nullable=False, default=0)
+    deleted_amount = Column(Integer, nullable=False, default=0)
+    total_length = Column(BigInteger, nullable=False, default=0)
+    total_weight = Column(BigInteger, nullable=False, default=0)
+    max_length = Column(Integer, nullable=False)
+    min_length = Column(Integer, nullable=False)
+    max_weight = Column(Integer, nullable=False)
+    min_weight = Column(Integer, nullable=False)
+
+
+class CoilDailySketch(Base):
+    __tablename__ = "coil_daily_sketch"
+
+    # per-day log-bucket histograms of length and weight of the coils created on `day`, see src/coil/sketch.py
+    day = Column(Date, primary_key=True)
+    metric = Column(String(16), primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    amount = Column(Integer, nullable=False)
+
+
+class CoilStatsJob(Base):
+    __tablename__ = "coil_stats_jobs"
+
+    # status: pending -> running -> done | failed
+    id: int = Column(Integer, primary_key=True)
+    from_date = Column(TIMESTAMP, nullable=False)
+    to_date = Column(TIMESTAMP, nullable=False)
+    status = Column(String(16), nullable=False, default="pending")
+    result = Column(JSONB)
+    error = Column(Text)
+    created_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    finished_at = Column(TIMESTAMP)
+
+    __table_args__ = (
+        # one in-flight job per date range, identical requests join it
+        Index(
+            "ix_coil_stats_jobs_in_flight", from_date, to_date, unique=True,
+            postgresql_where=text("status IN ('pending', 'running')"),
+        ),
+        Index("ix_coil_stats_jobs_finished_at", finished_at),
+    )
+
+class CoilChange(Base):
+    __tablename__ = "coil_changes"
+
+    # append-only feed of coil creations and deletions, seq is the event id clients resume from
+    seq = Column(BigInteger, Identity(), primary_key=True)
+    kind = Column(String(16), nullable=False)
+    coil_id = Column(Integer, nullable=False)
     length = Column(Integer, nullable=False)
     weight = Column(Integer, nullable=False)
-    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    created_at = Column(TIMESTAMP, nullable=False)
     deleted_at = Column(TIMESTAMP)
+    changed_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow, index=True)
@@ -0,0 +1,52 @@
+from datetime import date
+
+from sqlalchemy import DDL, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# coil_coils is range-partitioned by month of created_at; rows outside of the existing
+# monthly partitions land in coil_coils_default until their month gets a partition
+CREATE_DEFAULT_PARTITION = DDL("CREATE TABLE coil_coils_default PARTITION OF coil_coils DEFAULT")
+
+PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION coil_create_partitions(from_month date, to_month date) RETURNS integer AS $$
+DECLARE
+    partition_start date := date_trunc('month', from_month);
+    partition_end date;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    WHILE partition_start <= to_month LOOP
+        partition_end := partition_start + interval '1 month';
+        partition_name := format('coil_coils_%s', to_char(partition_start, 'YYYY_MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE coil_coils INCLUDING DEFAULTS)', partition_name);
+            -- rows of this month written before the partition existed
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM coil_coils_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                partition_start, partition_end, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE coil_coils ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, partition_start, partition_end
+            );
+            created := created + 1;
+        END IF;
+        partition_start := partition_end;
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql
+"""
+# DDL applies %-formatting to its statement
+CREATE_PARTITIONS_FUNCTION = DDL(PARTITIONS_FUNCTION.replace("%", "%%"))
+
+def add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+async def create_coil_partitions(session: AsyncSession, from_month: date, to_month: date) -> int:
+    # creates the missing monthly partitions between the two months, inclusive
+    query = select(func.coil_create_partitions(from_month, to_month))
+    return await session.scalar(query)
@@ -0,0 +1,138 @@
+from collections import Counter
+from datetime import date, datetime
+from typing import Iterable, Sequence
+
+from sqlalchemy import (Date, Integer, Row, Select, cast, column, delete, func, insert, literal, select, text,
+                        union_all, update)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.metrics import track_queries
+
+from src.coil.models import Coil, CoilDailyRollup, CoilDailySketch
+from src.coil.sketch import sketch_bucket
+
+
+def get_sketch_rows_query(day, length, weight, *filters) -> Select:
+    # (day, metric, bucket, amount) rows of the length and weight sketches of the selected coils
+    parts = []
+    for metric, value in (("length", length), ("weight", weight)):
+        bucket = sketch_bucket(value)
+        parts.append(
+            select(day.label("day"), literal(metric).label("metric"), bucket.label("bucket"), func.count().label("amount"))
+            .where(*filters)
+            .group_by(day, bucket)
+        )
+    rows = union_all(*parts).subquery("sketch_rows")
+
+    return select(rows).order_by(rows.c.day, rows.c.metric, rows.c.bucket)
+
+@track_queries
+async def record_coil_creations(coils: Sequence[Row], session: AsyncSession) -> None:
+    # coils: rows of (id, length, weight, created_at) in the caller's transaction
+    daily: dict[date, dict] = {}
+    for coil in coils:
+        day = daily.setdefault(coil.created_at.date(), {
+            "day": coil.created_at.date(), "amount": 0, "deleted_amount": 0,
+            "total_length": 0, "total_weight": 0,
+            "max_length": coil.length, "min_length": coil.length,
+            "max_weight": coil.weight, "min_weight": coil.weight,
+        })
+        day["amount"] += 1
+        day["total_length"] += coil.length
+        day["total_weight"] += coil.weight
+        day["max_length"] = max(day["max_length"], coil.length)
+        day["min_length"] = min(day["min_length"], coil.length)
+        day["max_weight"] = max(day["max_weight"], coil.weight)
+        day["min_weight"] = min(day["min_weight"], coil.weight)
+
+    if not daily:
+        return
+
+    # days are locked in ascending order so concurrent batches cannot deadlock
+    statement = pg_insert(CoilDailyRollup).values(sorted(daily.values(), key=lambda day: day["day"]))
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[CoilDailyRollup.day],
+        set_={
+            "amount": CoilDailyRollup.amount + excluded.amount,
+            "total_length": CoilDailyRollup.total_length + excluded.total_length,
+            "total_weight": CoilDailyRollup.total_weight + excluded.total_weight,
+            "max_length": func.greatest(CoilDailyRollup.max_length, excluded.max_length),
+            "min_length": func.least(CoilDailyRollup.min_length, excluded.min_length),
+            "max_weight": func.greatest(CoilDailyRollup.max_weight, excluded.max_weight),
+            "min_weight": func.least(CoilDailyRollup.min_weight, excluded.min_weight),
+        }
+    )
+    await session.execute(statement)
+
+    # the rollup rows above are already locked, so the sketch rows of these days are not contended
+    created = func.unnest(
+        cast(literal([coil.created_at.date() for coil in coils]), ARRAY(Date)),
+        cast(literal([coil.length for coil in coils]), ARRAY(Integer)),
+        cast(literal([coil.weight for coil in coils]), ARRAY(Integer)),
+    ).table_valued(column("day", Date), column("length", Integer), column("weight", Integer)).render_derived(name="created")
+    statement = pg_insert(CoilDailySketch).from_select(
+        ["day", "metric", "bucket", "amount"], get_sketch_rows_query(created.c.day, created.c.length, created.c.weight)
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[CoilDailySketch.day, CoilDailySketch.metric, CoilDailySketch.bucket],
+        set_={"amount": CoilDailySketch.amount + statement.excluded.amount}
+    )
+    await session.execute(statement)
+
+@track_queries
+async def record_coil_deletions(created_at: Iterable[datetime], session: AsyncSession) -> None:
+    # created_at: creation timestamps of the coils soft-deleted in the caller's transaction
+    deleted_per_day = Counter(value.date() for value in created_at)
+
+    for day, amount in sorted(deleted_per_day.items()):
+        statement = update(CoilDailyRollup).where(CoilDailyRollup.day == day).values(
+            deleted_amount=CoilDailyRollup.deleted_amount + amount
+        )
+        await session.execute(statement)
+
+@track_queries
+async def rebuild_coil_daily_rollup(session: AsyncSession, from_day: date | None = None, to_day: date | None = None) -> int:
+    # writers wait for the rebuild instead of incrementing rows that are being recomputed
+    await session.execute(text(
+        f"LOCK TABLE {CoilDailyRollup.__tablename__}, {CoilDailySketch.__tablename__} IN EXCLUSIVE MODE"
+    ))
+
+    day = func.date(Coil.created_at)
+    rollup_filters, sketch_filters, coil_filters = [], [], [Coil.created_at.isnot(None)]
+    if from_day:
+        rollup_filters.append(CoilDailyRollup.day >= from_day)
+        sketch_filters.append(CoilDailySketch.day >= from_day)
+        coil_filters.append(day >= from_day)
+    if to_day:
+        rollup_filters.append(CoilDailyRollup.day <= to_day)
+        sketch_filters.append(CoilDailySketch.day <= to_day)
+        coil_filters.append(day <= to_day)
+
+    await session.execute(delete(CoilDailyRollup).where(*rollup_filters))
+    await session.execute(delete(CoilDailySketch).where(*sketch_filters))
+    await session.execute(insert(CoilDailySketch).from_select(
+        ["day", "metric", "bucket", "amount"], get_sketch_rows_query(day, Coil.length, Coil.weight, *coil_filters)
+    ))
+
+    daily = select(
+        day,
+        func.count(),
+        func.count().filter(Coil.deleted_at.isnot(None)),
+        func.sum(Coil.length),
+        func.sum(Coil.weight),
+        func.max(Coil.length),
+        func.min(Coil.length),
+        func.max(Coil.weight),
+        func.min(Coil.weight),
+    ).where(*coil_filters).group_by(day)
+
+    statement = insert(CoilDailyRollup).from_select(
+        ["day", "amount", "deleted_amount", "total_length", "total_weight",
+         "max_length", "min_length", "max_weight", "min_weight"],
+        daily
+    )
+    result = await session.execute(statement)
+
+    return result.rowcount
@@ -1,17 +1,36 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
 
-from sqlalchemy import insert, select, update, and_
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from src.database import get_async_session
+from src.config import config
+from src.database import (get_async_session, get_async_session_maker, get_async_read_session,
+                          get_async_read_session_maker, read_replica_router)
 
-from src.coil.models import Coil
-from src.coil.schemas import (CoilSchemaCreate, BaseCoilSchema, CoilSchemaRead,
-                              CoilSchemaGetParams, DateRangeSchema, CoilStatsSchema)
-from src.coil.servises import (coil_exists, get_coil_base_stats, get_coil_date_stats,
-                               is_coil_deleted, get_coil_daily_stats)
+from src.coil.schemas import (CoilSchemaCreate, BaseCoilSchema, CoilSchemaRead, CoilBatchSchema,
+                              CoilSchemaDeleteParams, CoilBatchDeleteSchema,
+                              CoilSchemaGetParams, DateRangeSchema, CoilStatsSchema, StatsCacheInfoSchema,
+                              CoilOccupancySchema, CoilStatsJobSchema, CoilStatsBatchParams, CoilStatsRangeSchema,
+                              CoilDistributionSchema, DistributionSchema, HistogramBucketSchema,
+                              CoilSnapshotParams, CoilSnapshotSchema)
+from src.coil.servises import (create_coils, soft_delete_coils, get_coil_stats_summary, get_coil_occupancy,
+                               get_coils, stream_coil_rows, make_coil_stats, get_coil_stats_for_ranges,
+                               get_coil_exact_distribution, get_coil_approximate_distribution, get_coil_snapshot_stats,
+                               get_coil_snapshot_coils, DISTRIBUTION_METRICS, COIL_READ_FIELDS)
+from src.coil.admission import RouteAdmission, RouteLimiter, estimate_coil_range_rows, estimate_coil_rows
+from src.coil.batcher import CoilWriteBatcher, CoilWriteQueueFull
+from src.coil.cache import StatsCache
+from src.coil.changes import CoilChangeFeed, get_coil_changes_bounds, get_coil_changes_watermark
+from src.coil.memory import CoilColumnStore
+from src.coil.jobs import create_stats_job, expire_stats_jobs, get_stats_job, run_stats_job
+from src.coil.dependencies import (admit, get_change_feed, get_coil_store, get_stats_cache, get_stats_job_limiter,
+                                   get_write_batcher)
+from src.coil.utils import (parse_coils_file, encode_ndjson_rows, encode_csv_rows, encode_cursor, encode_sse_event,
+                            make_etag, etag_matches, UnsupportedCoilsFile, CoilsFileError)
 
 
 router = APIRouter(
@@ -19,92 +38,443 @@ router = APIRouter(
     tags=["Coil"]
 )
 
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
 @router.post("", status_code=status.HTTP_201_CREATED)
-async def create_coil(new_coil: CoilSchemaCreate, session: AsyncSession = Depends(get_async_session)) -> BaseCoilSchema:
-    statement = insert(Coil).values(**new_coil.model_dump()).returning(Coil.id)
-    result = await session.execute(statement)
+async def create_coil(
+    new_coil: CoilSchemaCreate,
+    session: AsyncSession = Depends(get_async_session),
+    stats_cache: StatsCache = Depends(get_stats_cache),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store),
+    write_batcher: CoilWriteBatcher | None = Depends(get_write_batcher)
+) -> BaseCoilSchema:
+    if write_batcher is not None:
+        # committed together with the coils posted concurrently, the batcher invalidates the cache
+        try:
+            coil = await write_batcher.submit(new_coil)
+        except CoilWriteQueueFull:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={"msg": "Too many coils are waiting to be written, retry later"},
+                headers={"Retry-After": "1"},
+            )
+    else:
+        [coil] = await create_coils([new_coil], session)
+        await session.commit()
+        stats_cache.invalidate([coil.created_at])
+
+    if coil_store is not None:
+        await coil_store.sync(session)
+
+    return BaseCoilSchema(id=coil.id)
+
+@router.post("/batch", status_code=status.HTTP_201_CREATED)
+async def create_coil_batch(
+    new_coils: list[CoilSchemaCreate],
+    session: AsyncSession = Depends(get_async_session),
+    stats_cache: StatsCache = Depends(get_stats_cache),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store)
+) -> CoilBatchSchema:
+    if not new_coils:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"msg": "Batch is empty"})
+    if len(new_coils) > config.coil.BATCH_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"msg": f"No more than {config.coil.BATCH_MAX_ROWS} coils are allowed in a batch"}
+        )
+
+    coils = await create_coils(new_coils, session)
     await session.commit()
 
-    id = result.scalar()
+    stats_cache.invalidate(coil.created_at for coil in coils)
+    if coil_store is not None:
+        await coil_store.sync(session)
+
+    return CoilBatchSchema(ids=[coil.id for coil in coils])
 
-    return BaseCoilSchema(id=id)
+@router.post("/batch/file", status_code=status.HTTP_201_CREATED)
+async def create_coil_batch_from_file(
+    file: UploadFile,
+    session: AsyncSession = Depends(get_async_session),
+    stats_cache: StatsCache = Depends(get_stats_cache),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store)
+) -> CoilBatchSchema:
+    try:
+        records = parse_coils_file(await file.read(), file.filename, file.content_type, config.coil.BATCH_MAX_ROWS)
+    except UnsupportedCoilsFile as error:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail={"msg": str(error)})
+    except CoilsFileError as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"msg": str(error), "line": error.line}
+        )
+
+    new_coils, errors = [], []
+    for row_number, record in enumerate(records, start=1):
+        try:
+            new_coils.append(CoilSchemaCreate.model_validate(record))
+        except ValidationError as error:
+            errors.append({"row": row_number, "errors": error.errors(include_url=False)})
+
+    if errors or not new_coils:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"msg": "Batch contains invalid rows" if errors else "Batch is empty", "rows": errors}
+        )
+
+    coils = await create_coils(new_coils, session)
+    await session.commit()
+
+    stats_cache.invalidate(coil.created_at for coil in coils)
+    if coil_store is not None:
+        await coil_store.sync(session)
+
+    return CoilBatchSchema(ids=[coil.id for coil in coils])
+
+@router.post("/batch/delete")
+async def delete_coil_batch(
+    delete_params: CoilSchemaDeleteParams,
+    session: AsyncSession = Depends(get_async_session),
+    stats_cache: StatsCache = Depends(get_stats_cache),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store)
+) -> CoilBatchDeleteSchema:
+    deletion = await soft_delete_coils(delete_params, session)
+    await session.commit()
+
+    stats_cache.invalidate(deletion["created_at"])
+    if coil_store is not None:
+        await coil_store.sync(session)
+
+    return CoilBatchDeleteSchema(**deletion)
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_coil(id: int, session: AsyncSession = Depends(get_async_session)):
-    if not await coil_exists(id, session):
+async def delete_coil(
+    id: int,
+    session: AsyncSession = Depends(get_async_session),
+    stats_cache: StatsCache = Depends(get_stats_cache),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store)
+):
+    deletion = await soft_delete_coils(CoilSchemaDeleteParams.model_construct(ids=[id]), session)
+
+    if deletion["not_found"]:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"msg": f"Coil with {id=} not found"})
-    elif await is_coil_deleted(id, session):
+    elif deletion["already_deleted"]:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"msg": f"Coil with {id=} was already deleted"})
 
-    statement = update(Coil).where(Coil.id == id).values(deleted_at=datetime.utcnow())
-    await session.execute(statement)
     await session.commit()
 
-@router.get("")
+    stats_cache.invalidate(deletion["created_at"])
+    if coil_store is not None:
+        await coil_store.sync(session)
+
+@router.get("", response_model=list[CoilSchemaRead])
 async def get_coil(
+    request: Request,
     range_params: CoilSchemaGetParams = Depends(CoilSchemaGetParams),
-    session: AsyncSession = Depends(get_async_session)
-) -> list[CoilSchemaRead]:
-    range_params: dict = range_params.model_dump(exclude_none=True)
-    
-    filters = [
-        and_(
-            getattr(Coil, from_field.replace('from_', '', 1)) >= range_params[from_field],
-            getattr(Coil, to_field.replace('to_', '', 1)) <= range_params[to_field]
-        )
-        for from_field, to_field in CoilSchemaGetParams.dependant_fields.items() if range_params.get(from_field)
-    ]
-    
-    query = select(Coil).where(and_(*filters))
-    result = await session.execute(query)
-
-    coils = [
-        CoilSchemaRead(
-            id=coil[0].id,
-            length=coil[0].length,
-            weight=coil[0].weight,
-            created_at=coil[0].created_at,
-            deleted_at=coil[0].deleted_at,
+    format: Optional[Literal["json", "ndjson", "csv"]] = None,
+    layout: Literal["rows", "columns"] = "rows",
+    session: AsyncSession = Depends(get_async_read_session),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store),
+    admission: RouteAdmission = Depends(admit("list"))
+) -> Response:
+    if format is None:
+        accept = request.headers.get("accept", "")
+        format = next((name for name, media_type in STREAM_MEDIA_TYPES.items() if media_type in accept), "json")
+
+    # read before the coils, so the etag can only be older than the data it is sent with
+    watermark = coil_store.applied_seq if coil_store is not None else await get_coil_changes_watermark(session)
+    etag = make_etag(watermark, range_params.model_dump(), format, layout)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
+    if coil_store is None:
+        # a whole unpaginated result is built in memory, streams and pages are not
+        if format not in STREAM_MEDIA_TYPES and not range_params.limit:
+            admission.check_rows(
+                await estimate_coil_rows(range_params, session), "page through it with limit or use format=ndjson/csv"
+            )
+        await admission.enter(session)
+
+    if format in STREAM_MEDIA_TYPES:
+        return StreamingResponse(
+            stream_coils(range_params, format, session, coil_store),
+            media_type=STREAM_MEDIA_TYPES[format],
+            headers=headers
         )
-        for coil in result.all()
-    ]
 
-    return coils
+    # plain column tuples go straight to orjson: no ORM entities and no per-row pydantic models
+    if coil_store is not None:
+        rows = coil_store.get_coils(range_params, lookahead=1)
+    else:
+        rows = await get_coils(range_params, session, lookahead=1)
+
+    if range_params.limit and len(rows) > range_params.limit:
+        rows = rows[:range_params.limit]
+        next_cursor = encode_cursor(rows[-1].id)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+
+    if layout == "columns":
+        content = {field: [row[index] for row in rows] for index, field in enumerate(COIL_READ_FIELDS)}
+    else:
+        content = [dict(zip(COIL_READ_FIELDS, row)) for row in rows]
+
+    return ORJSONResponse(content, headers=headers)
+
+async def stream_coils(
+    range_params: CoilSchemaGetParams, format: str, session: AsyncSession, coil_store: CoilColumnStore | None
+):
+    if format == "csv":
+        yield encode_csv_rows([], COIL_READ_FIELDS)
+
+    if coil_store is not None:
+        chunks = coil_store.stream_coil_rows(range_params, config.coil.STREAM_CHUNK_SIZE)
+    else:
+        chunks = stream_coil_rows(range_params, session, config.coil.STREAM_CHUNK_SIZE)
+    async for rows in chunks:
+        yield encode_csv_rows(rows) if format == "csv" else encode_ndjson_rows(rows, COIL_READ_FIELDS)
+
+@router.get("/snapshot")
+async def get_coil_snapshot(
+    request: Request,
+    response: Response,
+    snapshot_params: CoilSnapshotParams = Depends(CoilSnapshotParams),
+    session: AsyncSession = Depends(get_async_read_session),
+    admission: RouteAdmission = Depends(admit("stats"))
+) -> CoilSnapshotSchema:
+    # coils on hand at `at`: created at or before it and not deleted by then
+    await admission.enter(session)
+    snapshot = await get_coil_snapshot_stats(snapshot_params, session)
+
+    coils = None
+    if snapshot_params.limit:
+        rows = await get_coil_snapshot_coils(snapshot_params, session, lookahead=1)
+        if len(rows) > snapshot_params.limit:
+            rows = rows[:snapshot_params.limit]
+            next_cursor = encode_cursor(rows[-1].id)
+            response.headers["X-Next-Cursor"] = next_cursor
+            response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+        coils = [CoilSchemaRead(**dict(zip(COIL_READ_FIELDS, row))) for row in rows]
+
+    return CoilSnapshotSchema(at=snapshot_params.at, coils=coils, **snapshot)
+
+@router.get("/changes")
+async def get_coil_changes_stream(
+    request: Request,
+    after: Optional[int] = Query(None, ge=0),
+    change_feed: CoilChangeFeed = Depends(get_change_feed),
+    session_maker: async_sessionmaker[AsyncSession] = Depends(get_async_session_maker)
+) -> StreamingResponse:
+    # EventSource resends the id of the last received event on reconnect
+    last_event_id = request.headers.get("last-event-id")
+    if after is None and last_event_id:
+        if not last_event_id.isdigit():
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail={"msg": "Invalid Last-Event-ID header"}
+            )
+        after = int(last_event_id)
+
+    oldest_seq = None
+    if after is not None:
+        async with session_maker() as session:
+            oldest_seq, _ = await get_coil_changes_bounds(session)
+
+    return StreamingResponse(
+        stream_coil_changes(change_feed, after, oldest_seq),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def stream_coil_changes(change_feed: CoilChangeFeed, after: int | None, oldest_seq: int | None):
+    # the changes after `after` were pruned: the client has to reload the coils before applying the events
+    if after is not None and oldest_seq is not None and after < oldest_seq - 1:
+        yield encode_sse_event("reset", {"oldest_seq": oldest_seq})
+
+    async for change in change_feed.subscribe(after, config.coil.CHANGES_HEARTBEAT):
+        if change is None:
+            yield b": keep-alive\n\n"
+            continue
+        yield encode_sse_event(change.kind, {
+            "id": change.coil_id, "length": change.length, "weight": change.weight,
+            "created_at": change.created_at, "deleted_at": change.deleted_at,
+        }, id=change.seq)
 
 @router.get("/stats")
 async def get_coil_stats(
+    request: Request,
+    response: Response,
     date_range: DateRangeSchema = Depends(DateRangeSchema),
-    session: AsyncSession = Depends(get_async_session)
+    session_maker: async_sessionmaker[AsyncSession] = Depends(get_async_read_session_maker),
+    stats_cache: StatsCache = Depends(get_stats_cache),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store),
+    change_feed: CoilChangeFeed = Depends(get_change_feed),
+    admission: RouteAdmission = Depends(admit("stats"))
 ) -> CoilStatsSchema:
-    
-    coil_stats = await get_coil_base_stats(date_range, session)
+    cache_key = (date_range.from_date, date_range.to_date)
+    if (cached := stats_cache.get(cache_key)) is not None:
+        stats, etag = cached
+    else:
+        stats, cache_version = None, stats_cache.version
+        # read before the stats, so the etag can only be older than the data it is sent with
+        if coil_store is not None:
+            watermark = coil_store.applied_seq
+        else:
+            async with session_maker() as session:
+                watermark = await get_coil_changes_watermark(session)
+        etag = make_etag(watermark, cache_key)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if stats is None:
+        if coil_store is not None:
+            coil_stats = coil_store.get_stats_summary(date_range)
+        else:
+            async with session_maker() as session:
+                admission.check_rows(
+                    await estimate_coil_range_rows(date_range, session), "use POST /api/coil/stats/jobs instead"
+                )
+            await admission.enter()
+            coil_stats = await get_coil_stats_summary(date_range, session_maker)
+
+        if coil_stats["amount"] == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"msg": f"No data was found between {date_range.from_date} and {date_range.to_date}"}
+            )
+
+        stats = make_coil_stats(coil_stats)
+
+        # closed ranges only change when one of their coils is deleted, so they can be kept longer
+        now = datetime.utcnow()
+        recent_deletion = now - timedelta(seconds=config.coil.STATS_CACHE_RECENT_DELETION)
+        long_lived = date_range.to_date < now and (
+            coil_stats["last_deleted_at"] is None or coil_stats["last_deleted_at"] < recent_deletion
+        )
+        # the replica may not have replayed a write whose invalidation already happened: a result read
+        # behind the changes this worker has seen is not cached, other replica results only for the short ttl
+        from_replica = coil_store is None and session_maker is read_replica_router.replica
+        if not from_replica or change_feed.last_seq is None or watermark >= change_feed.last_seq:
+            stats_cache.set(cache_key, (stats, etag), long_lived and not from_replica, cache_version)
+
+    response.headers.update(headers)
+    return stats
+
+@router.get("/stats/distribution")
+async def get_coil_stats_distribution(
+    date_range: DateRangeSchema = Depends(DateRangeSchema),
+    mode: Literal["exact", "approximate"] = "exact",
+    buckets: int = Query(10, ge=1, le=100),
+    session: AsyncSession = Depends(get_async_read_session),
+    admission: RouteAdmission = Depends(admit("stats"))
+) -> CoilDistributionSchema:
+    # approximate: merged per-day sketches, percentiles within 1% of the exact ones, for very wide ranges
+    if mode == "exact":
+        admission.check_rows(await estimate_coil_range_rows(date_range, session), "use mode=approximate instead")
+    await admission.enter(session)
+
+    if mode == "exact":
+        distribution = await get_coil_exact_distribution(date_range, buckets, session)
+    else:
+        distribution = await get_coil_approximate_distribution(date_range, buckets, session)
 
-    if coil_stats["amount"] == 0:
+    if distribution["amount"] == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail={"msg": f"No data was found between {date_range.from_date} and {date_range.to_date}"}
         )
-    
-    coil_date_stats = await get_coil_date_stats(date_range, session)
-    coil_daily_stats = await get_coil_daily_stats(date_range, session)
-
-    return CoilStatsSchema(
-        amount = coil_stats["amount"],
-        deleted_amount = coil_stats["deleted_amount"],
-        average_length = round(coil_stats["total_length"] / coil_stats["amount"], 2),
-        average_weight = round(coil_stats["total_weight"] / coil_stats["amount"], 2),
-        max_length = coil_stats["max_length"],
-        min_length = coil_stats["min_length"],
-        max_weight = coil_stats["max_weight"],
-        min_weight = coil_stats["min_weight"],
-        total_weight = coil_stats["total_weight"],
-        creation_max_time_gap = coil_date_stats["creation_max_time_gap"],
-        creation_min_time_gap = coil_date_stats["creation_min_time_gap"],
-        deletion_max_time_gap = coil_date_stats["deletion_max_time_gap"],
-        deletion_min_time_gap = coil_date_stats["deletion_min_time_gap"],
-        max_amount_day = max(coil_daily_stats, key=lambda x: x['amount'])['day'],
-        min_amount_day = min(coil_daily_stats, key=lambda x: x['amount'])['day'],
-        max_total_weight_day = max(coil_daily_stats, key=lambda x: x['total_weight'])['day'],
-        min_total_weight_day = min(coil_daily_stats, key=lambda x: x['total_weight'])['day'],
+
+    return CoilDistributionSchema(mode=mode, amount=distribution["amount"], **{
+        metric: DistributionSchema(
+            p50=distribution[metric]["p50"],
+            p90=distribution[metric]["p90"],
+            p99=distribution[metric]["p99"],
+            histogram=[
+                HistogramBucketSchema(from_value=from_value, to_value=to_value, amount=amount)
+                for from_value, to_value, amount in distribution[metric]["histogram"]
+            ],
+        )
+        for metric in DISTRIBUTION_METRICS
+    })
+
+@router.post("/stats/batch")
+async def get_coil_stats_batch(
+    batch_params: CoilStatsBatchParams,
+    session_maker: async_sessionmaker[AsyncSession] = Depends(get_async_read_session_maker),
+    admission: RouteAdmission = Depends(admit("stats"))
+) -> list[CoilStatsRangeSchema]:
+    # estimated over the span of all the ranges, one EXPLAIN instead of one per range
+    span = DateRangeSchema(
+        from_date=min(date_range.from_date for date_range in batch_params.ranges),
+        to_date=max(date_range.to_date for date_range in batch_params.ranges),
     )
+    async with session_maker() as session:
+        admission.check_rows(await estimate_coil_range_rows(span, session), "use POST /api/coil/stats/jobs instead")
+    await admission.enter()
+    coil_stats = await get_coil_stats_for_ranges(batch_params.ranges, session_maker)
+
+    return [
+        CoilStatsRangeSchema(
+            from_date=date_range.from_date,
+            to_date=date_range.to_date,
+            stats=make_coil_stats(range_stats) if range_stats else None,
+        )
+        for date_range, range_stats in zip(batch_params.ranges, coil_stats)
+    ]
+
+@router.post("/stats/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_coil_stats_job(
+    date_range: DateRangeSchema,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_async_session),
+    session_maker: async_sessionmaker[AsyncSession] = Depends(get_async_session_maker),
+    read_session_maker: async_sessionmaker[AsyncSession] = Depends(get_async_read_session_maker),
+    limiter: RouteLimiter = Depends(get_stats_job_limiter)
+) -> CoilStatsJobSchema:
+    # for ranges too wide to answer within the gateway timeout; poll GET /stats/jobs/{id}
+    limiter.check_queue("Too many stats jobs are queued, retry later")
+
+    await expire_stats_jobs(session, config.coil.STATS_JOB_RESULT_TTL, config.coil.STATS_JOB_TIMEOUT)
+    job, created = await create_stats_job(date_range, session, config.coil.STATS_JOB_RESULT_TTL)
+    await session.commit()
+
+    if created:
+        background_tasks.add_task(run_stats_job, job.id, date_range, session_maker, read_session_maker, limiter)
+
+    return CoilStatsJobSchema.model_validate(job, from_attributes=True)
+
+@router.get("/stats/jobs/{id}")
+async def get_coil_stats_job(
+    id: int,
+    session: AsyncSession = Depends(get_async_session)
+) -> CoilStatsJobSchema:
+    job = await get_stats_job(id, session, config.coil.STATS_JOB_RESULT_TTL)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"msg": f"Stats job with {id=} not found"})
+
+    return CoilStatsJobSchema.model_validate(job, from_attributes=True)
+
+@router.get("/stats/occupancy")
+async def get_coil_stats_occupancy(
+    date_range: DateRangeSchema = Depends(DateRangeSchema),
+    bucket: Literal["day", "hour"] = "day",
+    session: AsyncSession = Depends(get_async_read_session),
+    coil_store: CoilColumnStore | None = Depends(get_coil_store),
+    admission: RouteAdmission = Depends(admit("stats"))
+) -> list[CoilOccupancySchema]:
+    if coil_store is not None:
+        occupancy = coil_store.get_occupancy(date_range, bucket)
+    else:
+        admission.check_rows(await estimate_coil_range_rows(date_range, session), "narrow the range")
+        await admission.enter(session)
+        occupancy = await get_coil_occupancy(date_range, bucket, session)
+
+    return [CoilOccupancySchema(**point) for point in occupancy]
+
+@router.get("/stats/cache")
+async def get_coil_stats_cache_info(stats_cache: StatsCache = Depends(get_stats_cache)) -> StatsCacheInfoSchema:
+    return StatsCacheInfoSchema(**stats_cache.info())
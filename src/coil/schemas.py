@@ -1,11 +1,32 @@
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime, date, timedelta
 
 from pydantic import BaseModel, model_validator, PositiveInt
 
 from fastapi.exceptions import RequestValidationError
 
-from src.coil.utils import date_to_datetime
+from src.config import config
+from src.coil.utils import date_to_datetime, decode_cursor, split_date_range
+
+
+def validate_dependant_fields(field_values: BaseModel, dependant_fields: dict[str, str]) -> None:
+    data = dict(field_values)
+
+    for from_field, to_field in dependant_fields.items():
+        if any([data[from_field], data[to_field]]) and not all([data[from_field], data[to_field]]):
+            raise RequestValidationError(f"One of fields is missed: {from_field} or {to_field}")
+
+        if data[from_field] and data[to_field]:
+            if isinstance(data[from_field], date) and not isinstance(data[from_field], datetime):
+                data[from_field] = date_to_datetime(data[from_field], from_field.startswith("to_"))
+                setattr(field_values, from_field, data[from_field])
+
+            if isinstance(data[to_field], date) and not isinstance(data[to_field], datetime):
+                data[to_field] = date_to_datetime(data[to_field], to_field.startswith("to_"))
+                setattr(field_values, to_field, data[to_field])
+
+            if data[from_field] > data[to_field]:
+                raise RequestValidationError(f"{from_field} is greater than {to_field}")
 
 
 class BaseCoilSchema(BaseModel):
@@ -15,6 +36,14 @@ class CoilSchemaCreate(BaseModel):
     length: PositiveInt
     weight: PositiveInt
 
+class CoilBatchSchema(BaseModel):
+    ids: list[int]
+
+class CoilBatchDeleteSchema(BaseModel):
+    deleted: list[int]
+    already_deleted: list[int]
+    not_found: list[int]
+
 class CoilSchemaRead(CoilSchemaCreate, BaseCoilSchema):
     created_at: datetime
     deleted_at: Optional[datetime] = None
@@ -27,7 +56,7 @@ class DateRangeSchema(BaseModel):
     def validate_fields_dependency(cls, field_values):
         for field_name in cls.model_fields.keys():
             value = getattr(field_values, field_name)
-            if isinstance(value, date):
+            if isinstance(value, date) and not isinstance(value, datetime):
                 formated_date = date_to_datetime(value, field_name.startswith("to_"))
                 setattr(field_values, field_name, formated_date)
         if field_values.from_date > field_values.to_date:
@@ -46,6 +75,8 @@ class CoilSchemaGetParams(BaseModel):
     to_created_at: Optional[date | datetime] = None
     from_deleted_at: Optional[date | datetime] = None
     to_deleted_at: Optional[date | datetime] = None
+    limit: Optional[PositiveInt] = None
+    cursor: Optional[str] = None
 
 
     @classmethod
@@ -59,31 +90,106 @@ class CoilSchemaGetParams(BaseModel):
             "from_deleted_at": "to_deleted_at",
         }
 
+    @property
+    def after_id(self) -> int:
+        return decode_cursor(self.cursor) if self.cursor else 0
+
     @model_validator(mode='after')
     def validate_fields_dependency(cls, field_values):
         data = dict(field_values)
 
-        if not any(data.values()):
+        if not any(data[field] for field in (*cls.dependant_fields.keys(), *cls.dependant_fields.values())):
             raise RequestValidationError(f"None of fields is specified")
 
-        for from_field, to_field in cls.dependant_fields.items():
-            if any([data[from_field], data[to_field]]) and not all([data[from_field], data[to_field]]):
-                raise RequestValidationError(f"One of fields is missed: {from_field} or {to_field}")
-            
-            if data[from_field] and data[to_field]:
-                if isinstance(data[from_field], date):
-                    data[from_field] = date_to_datetime(data[from_field], from_field.startswith("to_"))
-                    setattr(field_values, from_field, data[from_field])
-
-                if isinstance(data[to_field], date):
-                    data[to_field] = date_to_datetime(data[to_field], to_field.startswith("to_"))
-                    setattr(field_values, to_field, data[to_field])
-
-                if data[from_field] > data[to_field]:
-                    raise RequestValidationError(f"{from_field} is greater than {to_field}")
-                
+        if data["cursor"]:
+            if not data["limit"]:
+                raise RequestValidationError("cursor requires limit")
+            try:
+                decode_cursor(data["cursor"])
+            except (ValueError, TypeError):
+                raise RequestValidationError(f"Invalid cursor: {data['cursor']}")
+
+        validate_dependant_fields(field_values, cls.dependant_fields)
+
         return field_values
 
+class CoilSnapshotParams(BaseModel):
+    at: date | datetime
+    from_weight: Optional[PositiveInt] = None
+    to_weight: Optional[PositiveInt] = None
+    from_length: Optional[PositiveInt] = None
+    to_length: Optional[PositiveInt] = None
+    limit: Optional[PositiveInt] = None
+    cursor: Optional[str] = None
+
+    @classmethod
+    @property
+    def dependant_fields(cls):
+        return {
+            "from_weight": "to_weight",
+            "from_length": "to_length",
+        }
+
+    @property
+    def after_id(self) -> int:
+        return decode_cursor(self.cursor) if self.cursor else 0
+
+    @model_validator(mode='after')
+    def validate_fields_dependency(cls, field_values):
+        data = dict(field_values)
+
+        if isinstance(data["at"], date) and not isinstance(data["at"], datetime):
+            field_values.at = date_to_datetime(data["at"], False)
+
+        if data["cursor"]:
+            if not data["limit"]:
+                raise RequestValidationError("cursor requires limit")
+            try:
+                decode_cursor(data["cursor"])
+            except (ValueError, TypeError):
+                raise RequestValidationError(f"Invalid cursor: {data['cursor']}")
+
+        validate_dependant_fields(field_values, cls.dependant_fields)
+
+        return field_values
+
+class CoilSchemaDeleteParams(BaseModel):
+    ids: Optional[list[PositiveInt]] = None
+    from_id: Optional[PositiveInt] = None
+    to_id: Optional[PositiveInt] = None
+    from_created_at: Optional[date | datetime] = None
+    to_created_at: Optional[date | datetime] = None
+
+    @classmethod
+    @property
+    def dependant_fields(cls):
+        return {
+            "from_id": "to_id",
+            "from_created_at": "to_created_at",
+        }
+
+    @model_validator(mode='after')
+    def validate_fields_dependency(cls, field_values):
+        data = dict(field_values)
+
+        if not data["ids"] and not any(data[field] for field in cls.dependant_fields.keys()):
+            raise RequestValidationError("Either ids or a range of id / created_at must be specified")
+
+        validate_dependant_fields(field_values, cls.dependant_fields)
+
+        return field_values
+
+class CoilOccupancySchema(BaseModel):
+    bucket: datetime
+    amount: int
+    total_weight: int
+
+class StatsCacheInfoSchema(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+
 class CoilStatsSchema(BaseModel):
     amount: int
     deleted_amount: int
@@ -111,3 +217,73 @@ class CoilStatsSchema(BaseModel):
                 setattr(field_values, field_name, str(value))
 
         return field_values
+
+class CoilStatsJobSchema(BaseModel):
+    id: int
+    status: Literal["pending", "running", "done", "failed"]
+    from_date: datetime
+    to_date: datetime
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    result: Optional[CoilStatsSchema] = None
+    error: Optional[str] = None
+
+class CoilStatsBatchParams(BaseModel):
+    # either explicit ranges or one range split into buckets
+    ranges: Optional[list[DateRangeSchema]] = None
+    from_date: Optional[date | datetime] = None
+    to_date: Optional[date | datetime] = None
+    bucket: Optional[Literal["day", "week", "month"]] = None
+
+    @model_validator(mode='after')
+    def validate_fields_dependency(cls, field_values):
+        data = dict(field_values)
+
+        if data["ranges"] is not None:
+            if any(data[field] for field in ("from_date", "to_date", "bucket")):
+                raise RequestValidationError("Either ranges or from_date, to_date and bucket must be specified")
+        else:
+            if not all(data[field] for field in ("from_date", "to_date", "bucket")):
+                raise RequestValidationError("Either ranges or from_date, to_date and bucket must be specified")
+            date_range = DateRangeSchema(from_date=data["from_date"], to_date=data["to_date"])
+            field_values.ranges = [
+                DateRangeSchema(from_date=from_date, to_date=to_date)
+                for from_date, to_date in split_date_range(date_range.from_date, date_range.to_date, data["bucket"])
+            ]
+
+        if not field_values.ranges:
+            raise RequestValidationError("ranges is empty")
+        if len(field_values.ranges) > config.coil.STATS_BATCH_MAX_RANGES:
+            raise RequestValidationError(f"No more than {config.coil.STATS_BATCH_MAX_RANGES} ranges are allowed")
+
+        return field_values
+
+class CoilStatsRangeSchema(BaseModel):
+    from_date: datetime
+    to_date: datetime
+    stats: Optional[CoilStatsSchema] = None
+
+class HistogramBucketSchema(BaseModel):
+    from_value: float
+    to_value: float
+    amount: int
+
+class DistributionSchema(BaseModel):
+    p50: float
+    p90: float
+    p99: float
+    histogram: list[HistogramBucketSchema]
+
+class CoilDistributionSchema(BaseModel):
+    mode: Literal["exact", "approximate"]
+    amount: int
+    length: DistributionSchema
+    weight: DistributionSchema
+
+class CoilSnapshotSchema(BaseModel):
+    at: datetime
+    amount: int
+    total_length: int
+    total_weight: int
+    # a page of the coils, when limit is given
+    coils: Optional[list[CoilSchemaRead]] = None
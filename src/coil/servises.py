@@ -1,80 +1,653 @@
-from sqlalchemy import exists, select, and_, func
-from sqlalchemy.orm import aliased
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator
 
-from src.coil.models import Coil
-from src.coil.schemas import DateRangeSchema
+from sqlalchemy import (CTE, TIMESTAMP, BigInteger, Date, Float, Row, Select, Subquery, cast, column, insert, literal,
+                        select, true, update, and_, or_, func, union_all)
+from sqlalchemy.dialects.postgresql import ARRAY, INTERVAL
+from sqlalchemy.sql.selectable import TableValuedAlias
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from src.metrics import track_queries
+
+from src.coil.models import Coil, CoilDailyRollup, CoilDailySketch
+from src.coil.changes import record_coil_changes
+from src.coil.rollup import get_sketch_rows_query, record_coil_creations, record_coil_deletions
+from src.coil.sketch import sketch_histogram, sketch_quantiles
+from src.coil.schemas import (CoilSchemaCreate, CoilSchemaDeleteParams, CoilSchemaGetParams, CoilSnapshotParams,
+                              CoilStatsSchema, DateRangeSchema)
+
+
+COIL_READ_COLUMNS = (Coil.id, Coil.length, Coil.weight, Coil.created_at, Coil.deleted_at)
+COIL_READ_FIELDS = tuple(column.key for column in COIL_READ_COLUMNS)
+
+DISTRIBUTION_METRICS = ("length", "weight")
+DISTRIBUTION_QUANTILES = (0.5, 0.9, 0.99)
+
+OCCUPANCY_BUCKETS = {
+    "day": timedelta(days=1),
+    "hour": timedelta(hours=1),
+}
+
+
+@track_queries
+async def create_coils(coils: list[CoilSchemaCreate], session: AsyncSession) -> list[Row]:
+    # executemany + RETURNING is sent as paged multi-row INSERTs; ids come back in input order
+    statement = insert(Coil).returning(
+        Coil.id, Coil.length, Coil.weight, Coil.created_at, sort_by_parameter_order=True
+    )
+    result = await session.execute(statement, [coil.model_dump() for coil in coils])
+    created_coils = result.all()
+
+    await record_coil_creations(created_coils, session)
+    await record_coil_changes("created", created_coils, session)
+
+    return created_coils
+
+@track_queries
+async def soft_delete_coils(delete_params: CoilSchemaDeleteParams, session: AsyncSession) -> dict:
+    params: dict = delete_params.model_dump(exclude_none=True)
+    filters = [
+        getattr(Coil, from_field.replace('from_', '', 1)).between(params[from_field], params[to_field])
+        for from_field, to_field in CoilSchemaDeleteParams.dependant_fields.items() if params.get(from_field)
+    ]
+    if delete_params.ids:
+        filters.append(Coil.id.in_(delete_params.ids))
+
+    # a single statement: the UPDATE only touches live coils, and the join with the matched rows tells
+    # deleted coils apart from already deleted ones, including those deleted concurrently
+    matched = select(Coil.id).where(*filters).cte("matched")
+    deleted = update(Coil).where(*filters, Coil.deleted_at.is_(None)).values(
+        deleted_at=datetime.utcnow()
+    ).returning(Coil.id, Coil.length, Coil.weight, Coil.created_at, Coil.deleted_at).cte("deleted")
+
+    query = select(
+        matched.c.id, deleted.c.length, deleted.c.weight, deleted.c.created_at, deleted.c.deleted_at
+    ).select_from(
+        matched.outerjoin(deleted, deleted.c.id == matched.c.id)
+    ).order_by(matched.c.id)
+    rows = (await session.execute(query)).all()
+
+    created_at = [row.created_at for row in rows if row.created_at is not None]
+    await record_coil_deletions(created_at, session)
+    await record_coil_changes("deleted", [row for row in rows if row.created_at is not None], session)
+
+    matched_ids = {row.id for row in rows}
+    return {
+        "deleted": [row.id for row in rows if row.created_at is not None],
+        "already_deleted": [row.id for row in rows if row.created_at is None],
+        "not_found": sorted(set(delete_params.ids or ()) - matched_ids),
+        "created_at": created_at,
+    }
+
+def get_coil_filters(range_params: CoilSchemaGetParams):
+    params: dict = range_params.model_dump(exclude_none=True)
+
+    return and_(*[
+        and_(
+            getattr(Coil, from_field.replace('from_', '', 1)) >= params[from_field],
+            getattr(Coil, to_field.replace('to_', '', 1)) <= params[to_field]
+        )
+        for from_field, to_field in CoilSchemaGetParams.dependant_fields.items() if params.get(from_field)
+    ])
+
+def paginate_coil_query(query: Select, range_params: CoilSchemaGetParams, lookahead: int = 0) -> Select:
+    # keyset pagination: every page is an index range scan on id, however deep the cursor is
+    if not range_params.limit:
+        return query
+
+    return query.where(Coil.id > range_params.after_id).order_by(Coil.id).limit(range_params.limit + lookahead)
+
+@track_queries
+async def get_coils(range_params: CoilSchemaGetParams, session: AsyncSession, lookahead: int = 0) -> list[Row]:
+    query = paginate_coil_query(select(*COIL_READ_COLUMNS).where(get_coil_filters(range_params)), range_params, lookahead)
+    result = await session.execute(query)
+
+    return result.all()
+
+@track_queries
+async def stream_coil_rows(
+    range_params: CoilSchemaGetParams,
+    session: AsyncSession,
+    chunk_size: int
+) -> AsyncIterator[list[Row]]:
+    # server-side cursor: only `chunk_size` rows are held in memory at a time
+    query = paginate_coil_query(select(*COIL_READ_COLUMNS).where(get_coil_filters(range_params)), range_params)
+    result = await session.stream(query.execution_options(yield_per=chunk_size))
+
+    async for rows in result.partitions():
+        yield rows
+
+def get_coil_snapshot_query(snapshot_params: CoilSnapshotParams, after_id: int = 0) -> Subquery:
+    # coils on hand at `at`: created by then and deleted after it or not at all. Both branches of the
+    # UNION ALL are index-only scans of the covering ix_coil_coils_deleted_at, created_at <= at prunes
+    # the later partitions
+    params: dict = snapshot_params.model_dump(exclude_none=True)
+    filters = [
+        Coil.created_at <= snapshot_params.at,
+        Coil.id > after_id,
+        *[
+            getattr(Coil, from_field.replace('from_', '', 1)).between(params[from_field], params[to_field])
+            for from_field, to_field in CoilSnapshotParams.dependant_fields.items() if params.get(from_field)
+        ]
+    ]
+
+    return union_all(
+        select(*COIL_READ_COLUMNS).where(Coil.deleted_at.is_(None), *filters),
+        select(*COIL_READ_COLUMNS).where(Coil.deleted_at > snapshot_params.at, *filters),
+    ).subquery("snapshot")
+
+@track_queries
+async def get_coil_snapshot_stats(snapshot_params: CoilSnapshotParams, session: AsyncSession) -> dict:
+    snapshot = get_coil_snapshot_query(snapshot_params)
+    query = select(
+        func.count().label("amount"),
+        cast(func.coalesce(func.sum(snapshot.c.length), 0), BigInteger).label("total_length"),
+        cast(func.coalesce(func.sum(snapshot.c.weight), 0), BigInteger).label("total_weight"),
+    )
 
-async def coil_exists(id: int, session: AsyncSession) -> bool:
-    query = select(exists().where(Coil.id == id))
     result = await session.execute(query)
-    
-    return result.scalar()
+    return dict(zip(result.keys(), result.first()))
+
+@track_queries
+async def get_coil_snapshot_coils(
+    snapshot_params: CoilSnapshotParams, session: AsyncSession, lookahead: int = 0
+) -> list[Row]:
+    snapshot = get_coil_snapshot_query(snapshot_params, snapshot_params.after_id)
+    query = select(snapshot).order_by(snapshot.c.id).limit(snapshot_params.limit + lookahead)
 
-async def is_coil_deleted(id: int, session: AsyncSession) -> bool:
-    query = select(exists().where(and_(Coil.id == id, Coil.deleted_at.isnot(None))))
     result = await session.execute(query)
-    
-    return result.scalar()
+    return result.all()
 
 def get_date_range_filter(model: Coil, date_range: DateRangeSchema):
     return and_(model.created_at >= date_range.from_date, model.created_at <= date_range.to_date)
 
+def get_whole_days(date_range: DateRangeSchema) -> tuple[date, date]:
+    first_day, last_day = date_range.from_date.date(), date_range.to_date.date()
+    if date_range.from_date.time() != datetime.min.time():
+        first_day += timedelta(days=1)
+    if date_range.to_date.time() != datetime.max.time():
+        last_day -= timedelta(days=1)
+
+    return first_day, last_day
+
+def get_edge_days_filter(first_day: date, last_day: date):
+    # coils created outside of the whole days [first_day, last_day] that the rollups cover
+    return or_(
+        Coil.created_at < datetime.combine(first_day, datetime.min.time()),
+        Coil.created_at >= datetime.combine(last_day + timedelta(days=1), datetime.min.time()),
+    )
+
+def get_coil_daily_query(date_range: DateRangeSchema) -> CTE:
+    # whole days come from the rollup, raw rows are read only for the partial days at the edges
+    first_day, last_day = get_whole_days(date_range)
+    day = func.date(Coil.created_at)
+    # the date() bounds let the planner use the ix_coil_coils_created_date expression index
+    raw_filter = and_(
+        day.between(date_range.from_date.date(), date_range.to_date.date()),
+        get_date_range_filter(Coil, date_range),
+    )
+    daily_parts = []
+
+    if first_day <= last_day:
+        daily_parts.append(
+            select(
+                CoilDailyRollup.day,
+                CoilDailyRollup.amount,
+                CoilDailyRollup.deleted_amount,
+                CoilDailyRollup.total_length,
+                CoilDailyRollup.total_weight,
+                CoilDailyRollup.max_length,
+                CoilDailyRollup.min_length,
+                CoilDailyRollup.max_weight,
+                CoilDailyRollup.min_weight,
+            ).where(CoilDailyRollup.day.between(first_day, last_day))
+        )
+        # and narrow it down to the partial edge days
+        edge_days = {date_range.from_date.date(), date_range.to_date.date()} - {first_day, last_day}
+        raw_filter = and_(raw_filter, day.in_(sorted(edge_days)), get_edge_days_filter(first_day, last_day))
+
+    daily_parts.append(
+        select(
+            day.label("day"),
+            func.count().label("amount"),
+            func.count().filter(Coil.deleted_at.isnot(None)).label("deleted_amount"),
+            func.sum(Coil.length).label("total_length"),
+            func.sum(Coil.weight).label("total_weight"),
+            func.max(Coil.length).label("max_length"),
+            func.min(Coil.length).label("min_length"),
+            func.max(Coil.weight).label("max_weight"),
+            func.min(Coil.weight).label("min_weight"),
+        ).where(raw_filter).group_by(day)
+    )
+
+    return union_all(*daily_parts).cte("daily")
+
+@track_queries
+async def get_coil_daily_stats(date_range: DateRangeSchema, session: AsyncSession) -> list[dict]:
+    daily = get_coil_daily_query(date_range)
+    query = select(daily).order_by(daily.c.day)
+
+    result = await session.execute(query)
+    coil_daily_stats = [dict(zip(result.keys(), row)) for row in result.all()]
+
+    return coil_daily_stats
+
+@track_queries
 async def get_coil_base_stats(date_range: DateRangeSchema, session: AsyncSession) -> dict:
-    date_filter = and_(Coil.created_at >= date_range.from_date, Coil.created_at <= date_range.to_date)
+    daily = get_coil_daily_query(date_range)
 
     query = select(
-                func.count().label("amount"),
-                func.sum(Coil.length).label("total_length"),
-                func.sum(Coil.weight).label("total_weight"),
-                func.max(Coil.length).label("max_length"),
-                func.min(Coil.length).label("min_length"),
-                func.max(Coil.weight).label("max_weight"),
-                func.min(Coil.weight).label("min_weight"),
-    ).select_from(Coil).where(get_date_range_filter(Coil, date_range))
+        func.coalesce(func.sum(daily.c.amount), 0).label("amount"),
+        func.coalesce(func.sum(daily.c.deleted_amount), 0).label("deleted_amount"),
+        cast(func.sum(daily.c.total_length), BigInteger).label("total_length"),
+        cast(func.sum(daily.c.total_weight), BigInteger).label("total_weight"),
+        func.max(daily.c.max_length).label("max_length"),
+        func.min(daily.c.min_length).label("min_length"),
+        func.max(daily.c.max_weight).label("max_weight"),
+        func.min(daily.c.min_weight).label("min_weight"),
+    )
 
     result = await session.execute(query)
     coil_stats = dict(zip(result.keys(), result.first()))
 
-    query = select(func.count()).select_from(Coil).where(and_(date_filter, Coil.deleted_at.isnot(None)))
-    deleted_amount = (await session.execute(query)).scalar()
-
-    coil_stats['deleted_amount'] = deleted_amount
-
     return coil_stats
 
+@track_queries
 async def get_coil_date_stats(date_range: DateRangeSchema, session: AsyncSession) -> dict:
-    coil1 = aliased(Coil, name='coil1')
-    coil2 = aliased(Coil, name='coil2')
+    # LAG() over the range gives the gaps between neighbouring creations and deletions in one pass
+    coils = select(
+        Coil.deleted_at,
+        (Coil.created_at - func.lag(Coil.created_at).over(order_by=Coil.created_at)).label("creation_gap"),
+        (Coil.deleted_at - func.lag(Coil.deleted_at).over(order_by=Coil.deleted_at)).label("deletion_gap"),
+    ).where(get_date_range_filter(Coil, date_range)).subquery("coils")
+
     query = select(
-        func.max(coil2.created_at - coil1.created_at).label("creation_max_time_gap"),
-        func.min(coil2.created_at - coil1.created_at).label("creation_min_time_gap"),
-        func.max(coil2.deleted_at - coil1.deleted_at).label("deletion_max_time_gap"),
-        func.min(coil2.deleted_at - coil1.deleted_at).label("deletion_min_time_gap"),
-    ).select_from(coil1, coil2).where(
-        and_(
-            get_date_range_filter(coil1, date_range),
-            get_date_range_filter(coil2, date_range),
-            coil1.id+1 == coil2.id
-        )
+        func.max(coils.c.creation_gap).label("creation_max_time_gap"),
+        func.min(coils.c.creation_gap).label("creation_min_time_gap"),
+        func.max(coils.c.deletion_gap).label("deletion_max_time_gap"),
+        func.min(coils.c.deletion_gap).label("deletion_min_time_gap"),
+        func.max(coils.c.deleted_at).label("last_deleted_at"),
     )
-    result = await session.execute(query)
 
+    result = await session.execute(query)
     date_stats = dict(zip(result.keys(), result.first()))
 
     return date_stats
 
-async def get_coil_daily_stats(date_range: DateRangeSchema, session: AsyncSession) -> list[dict]:
+@track_queries
+async def get_coil_occupancy(date_range: DateRangeSchema, bucket: str, session: AsyncSession) -> list[dict]:
+    # stock level = opening balance at from_date + running sum of +1/-1 create/delete events
+    from_date = literal(date_range.from_date, TIMESTAMP)
+    to_date = literal(date_range.to_date, TIMESTAMP)
+
+    opening = select(
+        func.count().label("amount"),
+        func.coalesce(func.sum(Coil.weight), 0).label("total_weight"),
+    ).where(
+        Coil.created_at < from_date,
+        or_(Coil.deleted_at.is_(None), Coil.deleted_at >= from_date)
+    ).cte("opening")
+
+    events = union_all(
+        select(
+            func.date_trunc(bucket, Coil.created_at).label("bucket"),
+            literal(1).label("amount"),
+            Coil.weight.label("weight"),
+        ).where(Coil.created_at.between(from_date, to_date)),
+        select(
+            func.date_trunc(bucket, Coil.deleted_at),
+            literal(-1),
+            -Coil.weight,
+        ).where(Coil.deleted_at.between(from_date, to_date)),
+    ).subquery("events")
+
+    deltas = select(
+        events.c.bucket,
+        func.sum(events.c.amount).label("amount"),
+        func.sum(events.c.weight).label("weight"),
+    ).group_by(events.c.bucket).subquery("deltas")
+
+    buckets = select(
+        func.generate_series(
+            func.date_trunc(bucket, from_date),
+            func.date_trunc(bucket, to_date),
+            literal(OCCUPANCY_BUCKETS[bucket], INTERVAL)
+        ).label("bucket")
+    ).subquery("buckets")
+
+    def running_total(delta):
+        return cast(func.sum(func.coalesce(delta, 0)).over(order_by=buckets.c.bucket), BigInteger)
+
     query = select(
-        func.date(Coil.created_at).label("day"),
+        buckets.c.bucket,
+        (opening.c.amount + running_total(deltas.c.amount)).label("amount"),
+        (opening.c.total_weight + running_total(deltas.c.weight)).label("total_weight"),
+    ).select_from(
+        buckets.outerjoin(deltas, deltas.c.bucket == buckets.c.bucket).join(opening, true())
+    ).order_by(buckets.c.bucket)
+
+    result = await session.execute(query)
+    occupancy = [dict(zip(result.keys(), row)) for row in result.all()]
+
+    return occupancy
+
+async def get_coil_occupancy_stats(date_range: DateRangeSchema, session: AsyncSession) -> dict:
+    return summarize_occupancy(await get_coil_occupancy(date_range, "day", session))
+
+def summarize_occupancy(occupancy: list[dict]) -> dict:
+    # min()/max() keep the earliest day on ties
+    return {
+        "max_amount_day": max(occupancy, key=lambda x: x["amount"])["bucket"].date(),
+        "min_amount_day": min(occupancy, key=lambda x: x["amount"])["bucket"].date(),
+        "max_total_weight_day": max(occupancy, key=lambda x: x["total_weight"])["bucket"].date(),
+        "min_total_weight_day": min(occupancy, key=lambda x: x["total_weight"])["bucket"].date(),
+    }
+
+async def get_coil_stats_summary(date_range: DateRangeSchema, session_maker: async_sessionmaker[AsyncSession]) -> dict:
+    # the statements are independent, so they run side by side on separate connections
+    async def run(stats_query):
+        async with session_maker() as session:
+            return await stats_query(date_range, session)
+
+    coil_stats, coil_date_stats, coil_occupancy_stats = await asyncio.gather(
+        run(get_coil_base_stats), run(get_coil_date_stats), run(get_coil_occupancy_stats)
+    )
+
+    return {**coil_stats, **coil_date_stats, **coil_occupancy_stats}
+
+def get_stats_ranges_query(date_ranges: list[DateRangeSchema]) -> TableValuedAlias:
+    # one row per range with its position (idx, from 1); arrays keep the statement the same for any number of ranges
+    whole_days = [get_whole_days(date_range) for date_range in date_ranges]
+    # whole days of a range are [first_day, end_day), empty when the range has none
+    first_days = [first_day for first_day, _ in whole_days]
+    end_days = [max(first_day, last_day + timedelta(days=1)) for first_day, last_day in whole_days]
+
+    return func.unnest(
+        cast(literal([date_range.from_date for date_range in date_ranges]), ARRAY(TIMESTAMP)),
+        cast(literal([date_range.to_date for date_range in date_ranges]), ARRAY(TIMESTAMP)),
+        cast(literal(first_days), ARRAY(Date)),
+        cast(literal(end_days), ARRAY(Date)),
+    ).table_valued(
+        column("from_date", TIMESTAMP),
+        column("to_date", TIMESTAMP),
+        column("first_day", Date),
+        column("end_day", Date),
+        with_ordinality="idx",
+    ).render_derived(name="ranges")
+
+def get_coil_ranges_daily_query(ranges: TableValuedAlias) -> CTE:
+    # get_coil_daily_query for every range at once, rows are tagged with the range idx
+    rollup = select(
+        ranges.c.idx,
+        CoilDailyRollup.day,
+        CoilDailyRollup.amount,
+        CoilDailyRollup.deleted_amount,
+        CoilDailyRollup.total_length,
+        CoilDailyRollup.total_weight,
+        CoilDailyRollup.max_length,
+        CoilDailyRollup.min_length,
+        CoilDailyRollup.max_weight,
+        CoilDailyRollup.min_weight,
+    ).join_from(
+        ranges, CoilDailyRollup,
+        and_(CoilDailyRollup.day >= ranges.c.first_day, CoilDailyRollup.day < ranges.c.end_day)
+    )
+
+    day = func.date(Coil.created_at)
+    raw = select(
+        ranges.c.idx,
+        day.label("day"),
         func.count().label("amount"),
-        func.sum(Coil.weight).label("total_weight")
-    ).select_from(Coil).where(
-        get_date_range_filter(Coil, date_range)
-    ).group_by(func.date(Coil.created_at))
+        func.count().filter(Coil.deleted_at.isnot(None)).label("deleted_amount"),
+        func.sum(Coil.length).label("total_length"),
+        func.sum(Coil.weight).label("total_weight"),
+        func.max(Coil.length).label("max_length"),
+        func.min(Coil.length).label("min_length"),
+        func.max(Coil.weight).label("max_weight"),
+        func.min(Coil.weight).label("min_weight"),
+    ).join_from(
+        ranges, Coil,
+        and_(
+            Coil.created_at.between(ranges.c.from_date, ranges.c.to_date),
+            or_(Coil.created_at < ranges.c.first_day, Coil.created_at >= ranges.c.end_day),
+        )
+    ).group_by(ranges.c.idx, day)
+
+    return union_all(rollup, raw).cte("daily")
+
+@track_queries
+async def get_coil_ranges_base_stats(date_ranges: list[DateRangeSchema], session: AsyncSession) -> dict[int, dict]:
+    daily = get_coil_ranges_daily_query(get_stats_ranges_query(date_ranges))
+
+    query = select(
+        daily.c.idx,
+        func.sum(daily.c.amount).label("amount"),
+        func.sum(daily.c.deleted_amount).label("deleted_amount"),
+        cast(func.sum(daily.c.total_length), BigInteger).label("total_length"),
+        cast(func.sum(daily.c.total_weight), BigInteger).label("total_weight"),
+        func.max(daily.c.max_length).label("max_length"),
+        func.min(daily.c.min_length).label("min_length"),
+        func.max(daily.c.max_weight).label("max_weight"),
+        func.min(daily.c.min_weight).label("min_weight"),
+    ).group_by(daily.c.idx)
 
     result = await session.execute(query)
-    coil_daily_stats = [dict(zip(result.keys(), row)) for row in result.all()]
+    return {row.idx: row._asdict() for row in result.all()}
 
-    return coil_daily_stats
+@track_queries
+async def get_coil_ranges_date_stats(date_ranges: list[DateRangeSchema], session: AsyncSession) -> dict[int, dict]:
+    ranges = get_stats_ranges_query(date_ranges)
+    coils = select(
+        ranges.c.idx,
+        (
+            Coil.created_at - func.lag(Coil.created_at).over(partition_by=ranges.c.idx, order_by=Coil.created_at)
+        ).label("creation_gap"),
+        (
+            Coil.deleted_at - func.lag(Coil.deleted_at).over(partition_by=ranges.c.idx, order_by=Coil.deleted_at)
+        ).label("deletion_gap"),
+    ).join_from(ranges, Coil, Coil.created_at.between(ranges.c.from_date, ranges.c.to_date)).subquery("coils")
+
+    query = select(
+        coils.c.idx,
+        func.max(coils.c.creation_gap).label("creation_max_time_gap"),
+        func.min(coils.c.creation_gap).label("creation_min_time_gap"),
+        func.max(coils.c.deletion_gap).label("deletion_max_time_gap"),
+        func.min(coils.c.deletion_gap).label("deletion_min_time_gap"),
+    ).group_by(coils.c.idx)
+
+    result = await session.execute(query)
+    return {row.idx: row._asdict() for row in result.all()}
+
+@track_queries
+async def get_coil_ranges_occupancy_stats(date_ranges: list[DateRangeSchema], session: AsyncSession) -> dict[int, dict]:
+    # the stock at a moment does not depend on where a range starts, so all ranges share one opening balance
+    # and one pass over the events; the stock is sampled at every day end and range end ("checkpoints")
+    def day_checkpoints(date_range):
+        day = date_range.from_date.date()
+        while day <= date_range.to_date.date():
+            yield day, min(datetime.combine(day, datetime.max.time()), date_range.to_date)
+            day += timedelta(days=1)
+
+    checkpoints = sorted({
+        checkpoint for date_range in date_ranges for _, checkpoint in day_checkpoints(date_range)
+    })
+    span_from = min(date_range.from_date for date_range in date_ranges)
+    span_to = checkpoints[-1]
+
+    opening = select(
+        func.count().label("amount"),
+        func.coalesce(func.sum(Coil.weight), 0).label("total_weight"),
+    ).where(
+        Coil.created_at < span_from,
+        or_(Coil.deleted_at.is_(None), Coil.deleted_at >= span_from)
+    )
+
+    events = union_all(
+        select(
+            Coil.created_at.label("at"),
+            literal(1).label("amount"),
+            Coil.weight.label("weight"),
+        ).where(Coil.created_at.between(span_from, span_to)),
+        select(
+            Coil.deleted_at,
+            literal(-1),
+            -Coil.weight,
+        ).where(Coil.deleted_at.between(span_from, span_to)),
+    ).subquery("events")
+
+    # width_bucket() over checkpoints shifted by 1us gives the position of the first checkpoint >= the event
+    bounds = cast(literal([checkpoint + timedelta(microseconds=1) for checkpoint in checkpoints]), ARRAY(TIMESTAMP))
+    position = func.width_bucket(events.c.at, bounds)
+    deltas = select(
+        position.label("position"),
+        func.sum(events.c.amount).label("amount"),
+        func.sum(events.c.weight).label("weight"),
+    ).group_by(position)
+
+    opening_stock = (await session.execute(opening)).first()
+    result = await session.execute(deltas)
+    delta_by_position = {row.position: row for row in result.all()}
+
+    stock, amount, total_weight = {}, opening_stock.amount, opening_stock.total_weight
+    for position, checkpoint in enumerate(checkpoints):
+        if (delta := delta_by_position.get(position)) is not None:
+            amount += delta.amount
+            total_weight += delta.weight
+        stock[checkpoint] = (amount, total_weight)
+
+    # min()/max() keep the earliest day on ties
+    occupancy_stats = {}
+    for idx, date_range in enumerate(date_ranges, start=1):
+        series = [(day, *stock[checkpoint]) for day, checkpoint in day_checkpoints(date_range)]
+        occupancy_stats[idx] = {
+            "max_amount_day": max(series, key=lambda x: x[1])[0],
+            "min_amount_day": min(series, key=lambda x: x[1])[0],
+            "max_total_weight_day": max(series, key=lambda x: x[2])[0],
+            "min_total_weight_day": min(series, key=lambda x: x[2])[0],
+        }
+
+    return occupancy_stats
+
+async def get_coil_stats_for_ranges(
+    date_ranges: list[DateRangeSchema], session_maker: async_sessionmaker[AsyncSession]
+) -> list[dict | None]:
+    # each kind of stats is computed for all ranges at once; None for ranges without coils
+    async def run(stats_query):
+        async with session_maker() as session:
+            return await stats_query(date_ranges, session)
+
+    base_stats, date_stats, occupancy_stats = await asyncio.gather(
+        run(get_coil_ranges_base_stats), run(get_coil_ranges_date_stats), run(get_coil_ranges_occupancy_stats)
+    )
+
+    return [
+        {**base_stats[idx], **date_stats[idx], **occupancy_stats[idx]} if idx in base_stats else None
+        for idx in range(1, len(date_ranges) + 1)
+    ]
+
+@track_queries
+async def get_coil_exact_distribution(date_range: DateRangeSchema, buckets: int, session: AsyncSession) -> dict:
+    coils = select(Coil.length, Coil.weight).where(get_date_range_filter(Coil, date_range)).cte("coils")
+    quantiles = cast(literal(list(DISTRIBUTION_QUANTILES)), ARRAY(Float))
+
+    summary_query = select(func.count().label("amount"), *[
+        expression
+        for metric in DISTRIBUTION_METRICS
+        for expression in (
+            func.percentile_cont(quantiles).within_group(coils.c[metric]).label(f"{metric}_quantiles"),
+            func.min(coils.c[metric]).label(f"{metric}_min"),
+            func.max(coils.c[metric]).label(f"{metric}_max"),
+        )
+    ])
+    summary = (await session.execute(summary_query)).first()._mapping
+    if summary["amount"] == 0:
+        return {"amount": 0}
+
+    # the largest value falls on the upper bound, least() keeps it in the last bucket
+    bounds = {
+        metric: (summary[f"{metric}_min"], max(summary[f"{metric}_max"], summary[f"{metric}_min"] + 1))
+        for metric in DISTRIBUTION_METRICS
+    }
+    histogram_parts = []
+    for metric, (low, high) in bounds.items():
+        bucket = func.least(func.width_bucket(coils.c[metric], low, high, buckets), buckets)
+        histogram_parts.append(
+            select(literal(metric).label("metric"), bucket.label("bucket"), func.count().label("amount")).group_by(bucket)
+        )
+    result = await session.execute(union_all(*histogram_parts))
+    histogram_amounts = {(row.metric, row.bucket): row.amount for row in result.all()}
+
+    distribution = {"amount": summary["amount"]}
+    for metric, (low, high) in bounds.items():
+        width = (high - low) / buckets
+        distribution[metric] = {
+            **dict(zip(("p50", "p90", "p99"), summary[f"{metric}_quantiles"])),
+            "histogram": [
+                (low + width * index, low + width * (index + 1), histogram_amounts.get((metric, index + 1), 0))
+                for index in range(buckets)
+            ],
+        }
+
+    return distribution
+
+@track_queries
+async def get_coil_approximate_distribution(date_range: DateRangeSchema, buckets: int, session: AsyncSession) -> dict:
+    # merges the per-day sketches of the whole days with sketches of the raw edge days,
+    # so the cost follows the number of days rather than the number of coils
+    first_day, last_day = get_whole_days(date_range)
+    raw_filter = get_date_range_filter(Coil, date_range)
+    parts = []
+
+    if first_day <= last_day:
+        parts.append(
+            select(CoilDailySketch.metric, CoilDailySketch.bucket, CoilDailySketch.amount)
+            .where(CoilDailySketch.day.between(first_day, last_day))
+        )
+        raw_filter = and_(raw_filter, get_edge_days_filter(first_day, last_day))
+
+    raw = get_sketch_rows_query(func.date(Coil.created_at), Coil.length, Coil.weight, raw_filter).subquery("raw")
+    parts.append(select(raw.c.metric, raw.c.bucket, raw.c.amount))
+
+    sketches = union_all(*parts).subquery("sketches")
+    query = select(
+        sketches.c.metric, sketches.c.bucket, cast(func.sum(sketches.c.amount), BigInteger).label("amount")
+    ).group_by(sketches.c.metric, sketches.c.bucket).order_by(sketches.c.metric, sketches.c.bucket)
+
+    result = await session.execute(query)
+    sketch = {metric: [] for metric in DISTRIBUTION_METRICS}
+    for row in result.all():
+        sketch[row.metric].append((row.bucket, row.amount))
+
+    amount = sum(amount for _, amount in sketch["length"])
+    if amount == 0:
+        return {"amount": 0}
+
+    return {"amount": amount, **{
+        metric: {
+            **dict(zip(("p50", "p90", "p99"), sketch_quantiles(sketch[metric], DISTRIBUTION_QUANTILES))),
+            "histogram": sketch_histogram(sketch[metric], buckets),
+        }
+        for metric in DISTRIBUTION_METRICS
+    }}
+
+def make_coil_stats(coil_stats: dict) -> CoilStatsSchema:
+    return CoilStatsSchema(
+        amount = coil_stats["amount"],
+        deleted_amount = coil_stats["deleted_amount"],
+        average_length = round(coil_stats["total_length"] / coil_stats["amount"], 2),
+        average_weight = round(coil_stats["total_weight"] / coil_stats["amount"], 2),
+        max_length = coil_stats["max_length"],
+        min_length = coil_stats["min_length"],
+        max_weight = coil_stats["max_weight"],
+        min_weight = coil_stats["min_weight"],
+        total_weight = coil_stats["total_weight"],
+        creation_max_time_gap = coil_stats["creation_max_time_gap"],
+        creation_min_time_gap = coil_stats["creation_min_time_gap"],
+        deletion_max_time_gap = coil_stats["deletion_max_time_gap"],
+        deletion_min_time_gap = coil_stats["deletion_min_time_gap"],
+        max_amount_day = coil_stats["max_amount_day"],
+        min_amount_day = coil_stats["min_amount_day"],
+        max_total_weight_day = coil_stats["max_total_weight_day"],
+        min_total_weight_day = coil_stats["min_total_weight_day"],
+    )
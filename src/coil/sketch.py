@@ -0,0 +1,46 @@
+import math
+from typing import Iterable
+
+from sqlalchemy import Integer, cast, func
+
+
+# DDSketch-style log buckets: bucket i holds the values in (gamma^(i-1), gamma^i], so any value
+# estimated from its bucket is within SKETCH_RELATIVE_ACCURACY of the true one. Buckets of different
+# days simply add up. Stored sketches depend on gamma: changing it needs a rollup rebuild.
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+
+
+def sketch_bucket(value):
+    # SQL expression of the bucket of a positive value
+    return cast(func.ceil(func.ln(func.greatest(value, 1)) / math.log(SKETCH_GAMMA)), Integer)
+
+def bucket_value(bucket: int) -> float:
+    return 2 * SKETCH_GAMMA ** bucket / (SKETCH_GAMMA + 1)
+
+def sketch_value_at(buckets: list[tuple[int, int]], rank: int) -> float:
+    seen = 0
+    for bucket, amount in buckets:
+        seen += amount
+        if seen > rank:
+            return bucket_value(bucket)
+    return bucket_value(buckets[-1][0])
+
+def sketch_quantiles(buckets: list[tuple[int, int]], quantiles: Iterable[float]) -> list[float]:
+    # buckets: (bucket, amount) sorted by bucket; interpolates between neighbouring ranks like percentile_cont
+    total = sum(amount for _, amount in buckets)
+    values = []
+    for quantile in quantiles:
+        rank = quantile * (total - 1)
+        lower, upper = sketch_value_at(buckets, math.floor(rank)), sketch_value_at(buckets, math.ceil(rank))
+        values.append(lower + (upper - lower) * (rank - math.floor(rank)))
+    return values
+
+def sketch_histogram(buckets: list[tuple[int, int]], size: int) -> list[tuple[float, float, int]]:
+    # equal-width bins between the smallest and the largest bucket, amounts assigned by bucket value
+    low, high = bucket_value(buckets[0][0]), bucket_value(buckets[-1][0])
+    width = (high - low) / size or 1
+    histogram = [[low + width * index, low + width * (index + 1), 0] for index in range(size)]
+    for bucket, amount in buckets:
+        histogram[min(int((bucket_value(bucket) - low) / width), size - 1)][2] += amount
+    return [tuple(row) for row in histogram]
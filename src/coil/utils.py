@@ -1,7 +1,118 @@
-from datetime import datetime, date
+import base64
+import csv
+import hashlib
+import io
+from datetime import datetime, date, timedelta
+from typing import Iterable, Sequence
+
+import orjson
 
 
 def date_to_datetime(field_value: date, to_max_time: bool = False) -> datetime:
     time = datetime.max.time() if to_max_time else datetime.min.time()
     field_value = datetime.combine(field_value, time)
     return field_value
+
+def split_date_range(from_date: datetime, to_date: datetime, bucket: str) -> list[tuple[datetime, datetime]]:
+    # calendar day / ISO week / month buckets, the first and the last one clipped to the range
+    start = datetime.combine(from_date.date(), datetime.min.time())
+    if bucket == "week":
+        start -= timedelta(days=start.weekday())
+    elif bucket == "month":
+        start = start.replace(day=1)
+
+    ranges = []
+    while start <= to_date:
+        if bucket == "day":
+            end = start + timedelta(days=1)
+        elif bucket == "week":
+            end = start + timedelta(weeks=1)
+        else:
+            end = (start + timedelta(days=32)).replace(day=1)
+        ranges.append((max(start, from_date), min(end - timedelta(microseconds=1), to_date)))
+        start = end
+
+    return ranges
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps({"id": last_id})).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    payload = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    if not isinstance(payload, dict) or not isinstance(payload.get("id"), int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return payload["id"]
+
+def make_etag(watermark: int, *params) -> str:
+    # the same parameters against the same change watermark give the same representation
+    digest = hashlib.blake2b(orjson.dumps(params, option=orjson.OPT_SORT_KEYS), digest_size=12).hexdigest()
+    return f'"{watermark}-{digest}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+class UnsupportedCoilsFile(ValueError):
+    pass
+
+class CoilsFileError(ValueError):
+    # content that cannot be read as coils, with the line of the file it was found on
+    def __init__(self, line: int, msg: str):
+        super().__init__(f"Line {line}: {msg}")
+        self.line = line
+
+def parse_coils_file(content: bytes, filename: str | None, content_type: str | None, max_rows: int) -> list[dict]:
+    filename = (filename or "").lower()
+    content_type = (content_type or "").lower()
+
+    if content_type == "text/csv" or filename.endswith(".csv"):
+        try:
+            text = content.decode("utf-8-sig")
+        except UnicodeDecodeError as error:
+            raise CoilsFileError(content[:error.start].count(b"\n") + 1, "invalid UTF-8") from None
+
+        reader = csv.DictReader(io.StringIO(text))
+        records = []
+        try:
+            for row in reader:
+                if len(records) == max_rows:
+                    raise CoilsFileError(reader.line_num, f"no more than {max_rows} coils are allowed")
+                records.append(dict(row))
+        except csv.Error as error:
+            raise CoilsFileError(reader.line_num, str(error)) from None
+        return records
+
+    if content_type in ("application/x-ndjson", "application/jsonl") or filename.endswith((".ndjson", ".jsonl")):
+        records = []
+        for line_number, line in enumerate(content.splitlines(), start=1):
+            if not line.strip():
+                continue
+            if len(records) == max_rows:
+                raise CoilsFileError(line_number, f"no more than {max_rows} coils are allowed")
+            try:
+                records.append(orjson.loads(line))
+            except orjson.JSONDecodeError as error:
+                raise CoilsFileError(line_number, str(error)) from None
+        return records
+
+    raise UnsupportedCoilsFile(f"Unsupported file type: {filename or content_type}")
+
+def encode_ndjson_rows(rows: Iterable[Sequence], fields: Sequence[str]) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+def encode_sse_event(event: str, data: dict, id: int | None = None) -> bytes:
+    prefix = f"id: {id}\n".encode() if id is not None else b""
+    return prefix + f"event: {event}\n".encode() + b"data: " + orjson.dumps(data) + b"\n\n"
+
+def encode_csv_rows(rows: Iterable[Sequence], fields: Sequence[str] | None = None) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if fields:
+        writer.writerow(fields)
+    writer.writerows(
+        [value.isoformat() if isinstance(value, datetime) else value for value in row] for row in rows
+    )
+    return buffer.getvalue().encode()
@@ -12,13 +12,66 @@ class DBConfig:
     PASSWORD: str
     USER: str
     NAME: str
+    POOL_SIZE: int = 5
+    MAX_OVERFLOW: int = 10
+    POOL_RECYCLE: int = -1
+    POOL_TIMEOUT: float = 30
+    POOL_PRE_PING: bool = False
+    STATEMENT_CACHE_SIZE: int = 100
+    PGBOUNCER: bool = False
+    SLOW_QUERY_THRESHOLD_MS: float | None = None
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.01
+    SLOW_QUERY_LOG_SIZE: int = 100
+    REPLICA_HOST: str | None = None
+    REPLICA_PORT: int | None = None
+    REPLICA_MAX_LAG: float = 5
+    REPLICA_CHECK_INTERVAL: float = 5
+    LISTEN_HOST: str | None = None
+    LISTEN_PORT: int | None = None
 
     def __post_init__(self):
         self.URL: str = f"postgresql+asyncpg://{self.USER}:{self.PASSWORD}@{self.HOST}:{self.PORT}/{self.NAME}"
+        self.REPLICA_URL: str | None = None
+        if self.REPLICA_HOST:
+            self.REPLICA_URL = (
+                f"postgresql+asyncpg://{self.USER}:{self.PASSWORD}@{self.REPLICA_HOST}:{self.REPLICA_PORT or self.PORT}/{self.NAME}"
+            )
+
+@dataclass
+class CoilConfig:
+    STREAM_CHUNK_SIZE: int
+    STATS_CACHE_SIZE: int
+    STATS_CACHE_TTL: float
+    STATS_CACHE_LONG_TTL: float
+    STATS_CACHE_RECENT_DELETION: float
+    STATS_JOB_RESULT_TTL: float
+    STATS_JOB_TIMEOUT: float
+    STATS_JOB_MAX_CONCURRENCY: int
+    STATS_JOB_QUEUE_SIZE: int
+    STATS_BATCH_MAX_RANGES: int
+    BATCH_MAX_ROWS: int
+    CHANGES_SUBSCRIBER_BUFFER: int
+    CHANGES_HEARTBEAT: float
+    CHANGES_RETENTION_DAYS: int
+    CHANGES_PRUNE_INTERVAL: float
+    MEMORY_STORE: bool
+    WRITE_BATCH: bool
+    WRITE_BATCH_MAX_SIZE: int
+    WRITE_BATCH_MAX_DELAY: float
+    WRITE_BATCH_QUEUE_SIZE: int
+    STATS_MAX_CONCURRENCY: int
+    LIST_MAX_CONCURRENCY: int
+    ADMISSION_QUEUE_SIZE: int
+    ADMISSION_QUEUE_TIMEOUT: float
+    STATS_STATEMENT_TIMEOUT: float
+    LIST_STATEMENT_TIMEOUT: float
+    STATS_MAX_ROWS: int
+    LIST_MAX_ROWS: int
 
 @dataclass
 class Config:
     db: DBConfig
+    coil: CoilConfig
 
 config = Config(
     db=DBConfig(
@@ -26,6 +79,54 @@ config = Config(
         PORT=os.environ.get("DB_PORT"),
         PASSWORD=os.environ.get("DB_PASS"),
         USER=os.environ.get("DB_USER"),
-        NAME=os.environ.get("DB_NAME")
+        NAME=os.environ.get("DB_NAME"),
+        POOL_SIZE=int(os.environ.get("DB_POOL_SIZE", 5)),
+        MAX_OVERFLOW=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        POOL_RECYCLE=int(os.environ.get("DB_POOL_RECYCLE", -1)),
+        POOL_TIMEOUT=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        POOL_PRE_PING=os.environ.get("DB_POOL_PRE_PING", "false").lower() == "true",
+        STATEMENT_CACHE_SIZE=int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100)),
+        PGBOUNCER=os.environ.get("DB_PGBOUNCER", "false").lower() == "true",
+        SLOW_QUERY_THRESHOLD_MS=(
+            float(os.environ["DB_SLOW_QUERY_THRESHOLD_MS"]) if os.environ.get("DB_SLOW_QUERY_THRESHOLD_MS") else None
+        ),
+        SLOW_QUERY_EXPLAIN_SAMPLE_RATE=float(os.environ.get("DB_SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0.01)),
+        SLOW_QUERY_LOG_SIZE=int(os.environ.get("DB_SLOW_QUERY_LOG_SIZE", 100)),
+        REPLICA_HOST=os.environ.get("DB_REPLICA_HOST"),
+        REPLICA_PORT=os.environ.get("DB_REPLICA_PORT"),
+        REPLICA_MAX_LAG=float(os.environ.get("DB_REPLICA_MAX_LAG", 5)),
+        REPLICA_CHECK_INTERVAL=float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 5)),
+        LISTEN_HOST=os.environ.get("DB_LISTEN_HOST"),
+        LISTEN_PORT=os.environ.get("DB_LISTEN_PORT"),
+    ),
+    coil=CoilConfig(
+        STREAM_CHUNK_SIZE=int(os.environ.get("COIL_STREAM_CHUNK_SIZE", 1000)),
+        STATS_CACHE_SIZE=int(os.environ.get("COIL_STATS_CACHE_SIZE", 256)),
+        STATS_CACHE_TTL=float(os.environ.get("COIL_STATS_CACHE_TTL", 10)),
+        STATS_CACHE_LONG_TTL=float(os.environ.get("COIL_STATS_CACHE_LONG_TTL", 3600)),
+        STATS_CACHE_RECENT_DELETION=float(os.environ.get("COIL_STATS_CACHE_RECENT_DELETION", 3600)),
+        STATS_JOB_RESULT_TTL=float(os.environ.get("COIL_STATS_JOB_RESULT_TTL", 3600)),
+        STATS_JOB_TIMEOUT=float(os.environ.get("COIL_STATS_JOB_TIMEOUT", 3600)),
+        STATS_JOB_MAX_CONCURRENCY=int(os.environ.get("COIL_STATS_JOB_MAX_CONCURRENCY", 1)),
+        STATS_JOB_QUEUE_SIZE=int(os.environ.get("COIL_STATS_JOB_QUEUE_SIZE", 16)),
+        STATS_BATCH_MAX_RANGES=int(os.environ.get("COIL_STATS_BATCH_MAX_RANGES", 400)),
+        BATCH_MAX_ROWS=int(os.environ.get("COIL_BATCH_MAX_ROWS", 100000)),
+        CHANGES_SUBSCRIBER_BUFFER=int(os.environ.get("COIL_CHANGES_SUBSCRIBER_BUFFER", 1000)),
+        CHANGES_HEARTBEAT=float(os.environ.get("COIL_CHANGES_HEARTBEAT", 15)),
+        CHANGES_RETENTION_DAYS=int(os.environ.get("COIL_CHANGES_RETENTION_DAYS", 7)),
+        CHANGES_PRUNE_INTERVAL=float(os.environ.get("COIL_CHANGES_PRUNE_INTERVAL", 3600)),
+        MEMORY_STORE=os.environ.get("COIL_MEMORY_STORE", "false").lower() == "true",
+        WRITE_BATCH=os.environ.get("COIL_WRITE_BATCH", "false").lower() == "true",
+        WRITE_BATCH_MAX_SIZE=int(os.environ.get("COIL_WRITE_BATCH_MAX_SIZE", 100)),
+        WRITE_BATCH_MAX_DELAY=float(os.environ.get("COIL_WRITE_BATCH_MAX_DELAY", 0.005)),
+        WRITE_BATCH_QUEUE_SIZE=int(os.environ.get("COIL_WRITE_BATCH_QUEUE_SIZE", 1000)),
+        STATS_MAX_CONCURRENCY=int(os.environ.get("COIL_STATS_MAX_CONCURRENCY", 2)),
+        LIST_MAX_CONCURRENCY=int(os.environ.get("COIL_LIST_MAX_CONCURRENCY", 4)),
+        ADMISSION_QUEUE_SIZE=int(os.environ.get("COIL_ADMISSION_QUEUE_SIZE", 16)),
+        ADMISSION_QUEUE_TIMEOUT=float(os.environ.get("COIL_ADMISSION_QUEUE_TIMEOUT", 10)),
+        STATS_STATEMENT_TIMEOUT=float(os.environ.get("COIL_STATS_STATEMENT_TIMEOUT", 30)),
+        LIST_STATEMENT_TIMEOUT=float(os.environ.get("COIL_LIST_STATEMENT_TIMEOUT", 60)),
+        STATS_MAX_ROWS=int(os.environ.get("COIL_STATS_MAX_ROWS", 2000000)),
+        LIST_MAX_ROWS=int(os.environ.get("COIL_LIST_MAX_ROWS", 200000)),
     )
 )
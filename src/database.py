@@ -1,19 +1,300 @@
-from typing import AsyncGenerator
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import AsyncGenerator, Callable
+from uuid import uuid4
 
-from sqlalchemy import MetaData
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase
+from fastapi import Depends
+from sqlalchemy import MetaData, event, exc, func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from src.config import config
+from src.config import DBConfig, config
+
+logger = logging.getLogger(__name__)
 
 metadata = MetaData()
 
+# service function issuing the statement and ASGI scope of the request, read by the engine event handlers
+query_source: ContextVar[str] = ContextVar("query_source", default="unknown")
+request_scope: ContextVar[dict | None] = ContextVar("request_scope", default=None)
+# statement_timeout (seconds) of the transactions begun by the current request, set by admission control
+statement_timeout: ContextVar[float | None] = ContextVar("statement_timeout", default=None)
+
 class Base(DeclarativeBase):
     metadata = metadata
 
-engine = create_async_engine(config.db.URL)
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    # queue pool that also records how long checkouts wait for a connection
+    wait_listeners: list[Callable[[float], None]] = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started_at
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            for listener in self.wait_listeners:
+                listener(wait)
+
+    def metrics(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_total_seconds": round(self.wait_total, 6),
+            "wait_max_seconds": round(self.wait_max, 6),
+        }
+
+def create_engine(db_config: DBConfig, url: str | None = None) -> AsyncEngine:
+    connect_args = {
+        "statement_cache_size": db_config.STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": db_config.STATEMENT_CACHE_SIZE,
+    }
+    if db_config.PGBOUNCER:
+        # PgBouncer in transaction mode cannot keep named prepared statements between transactions
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid4()}__",
+        )
+
+    return create_async_engine(
+        url or db_config.URL,
+        poolclass=MonitoredQueuePool,
+        pool_size=db_config.POOL_SIZE,
+        max_overflow=db_config.MAX_OVERFLOW,
+        pool_recycle=db_config.POOL_RECYCLE,
+        pool_timeout=db_config.POOL_TIMEOUT,
+        pool_pre_ping=db_config.POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+def get_statement_timeout_query(timeout: float):
+    # local to the transaction, so it neither outlives the request on a pooled connection nor leaks through pgbouncer
+    return select(func.set_config("statement_timeout", str(int(timeout * 1000)), True))
+
+async def apply_statement_timeout(session: AsyncSession, timeout: float) -> None:
+    await session.execute(get_statement_timeout_query(timeout))
+
+@event.listens_for(Session, "after_begin")
+def _set_statement_timeout(session, transaction, connection):
+    if (timeout := statement_timeout.get()) is not None:
+        connection.execute(get_statement_timeout_query(timeout))
+
+# data-modifying CTEs (WITH ... UPDATE ... RETURNING) are not plain reads
+DATA_MODIFYING_CTE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+
+def is_read_only(statement: str) -> bool:
+    keyword = statement.split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword == "SELECT" or (keyword == "WITH" and not DATA_MODIFYING_CTE.search(statement))
+
+class SlowQueryLog:
+    # statements over the threshold are logged with their parameters and calling route,
+    # a sample of the slow SELECTs is re-run under EXPLAIN (ANALYZE, BUFFERS) and kept in a ring buffer
+    def __init__(self, threshold_ms: float, explain_sample_rate: float, size: int):
+        self.threshold = threshold_ms / 1000
+        self.explain_sample_rate = explain_sample_rate
+        self.entries: deque[dict] = deque(maxlen=size)
+        # engines the listeners are installed on, with the name of their database
+        self._engines: dict[Engine, str] = {}
+
+    def install(self, engine: Engine, database: str = "primary") -> None:
+        self._engines[engine] = database
+        event.listen(engine, "before_cursor_execute", self._start_timer)
+        event.listen(engine, "after_cursor_execute", self._check_statement)
+
+    def uninstall(self) -> None:
+        for engine in self._engines:
+            event.remove(engine, "before_cursor_execute", self._start_timer)
+            event.remove(engine, "after_cursor_execute", self._check_statement)
+        self._engines.clear()
+
+    def _start_timer(self, conn, cursor, statement, parameters, context, executemany):
+        # on the execution context, like the statement metrics: failed statements never reach _check_statement
+        if context is not None:
+            context._slow_query_started_at = time.perf_counter()
+
+    def _check_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if (started_at := getattr(context, "_slow_query_started_at", None)) is None:
+            return
+        duration = time.perf_counter() - started_at
+        if duration < self.threshold or conn.info.get("slow_query_explaining"):
+            return
+
+        scope = request_scope.get()
+        route = scope.get("route") if scope else None
+        entry = {
+            "at": datetime.utcnow(),
+            "database": self._engines.get(conn.engine, "primary"),
+            "duration_ms": round(duration * 1000, 3),
+            "route": f"{scope['method']} {route.path if route else scope['path']}" if scope else None,
+            "source": query_source.get(),
+            "statement": statement,
+            "parameters": repr(parameters)[:2000],
+            "plan": None,
+        }
+        logger.warning(
+            "slow query (%.1f ms, %s, route %s, source %s): %s %s",
+            entry["duration_ms"], entry["database"], entry["route"], entry["source"], statement, entry["parameters"],
+        )
+
+        # server-side cursors still hold the connection, executemany has no single plan
+        streaming = context is not None and context.execution_options.get("stream_results", False)
+        if is_read_only(statement) and not executemany and not streaming and random.random() < self.explain_sample_rate:
+            entry["plan"] = self._explain(conn, statement, parameters)
+
+        self.entries.append(entry)
+
+    def _explain(self, conn, statement, parameters) -> list[str] | None:
+        # EXPLAIN ANALYZE executes the statement again; it always runs in a savepoint that is rolled back,
+        # so neither a failure nor whatever the second run changed ends up in the caller's transaction
+        conn.info["slow_query_explaining"] = True
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                return [row[0] for row in cursor.fetchall()]
+            except Exception:
+                logger.exception("could not capture the plan of a slow query")
+                return None
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        finally:
+            cursor.close()
+            conn.info["slow_query_explaining"] = False
+
+def create_slow_query_log(
+    db_config: DBConfig, engine: AsyncEngine, replica_engine: AsyncEngine | None = None
+) -> SlowQueryLog | None:
+    if db_config.SLOW_QUERY_THRESHOLD_MS is None:
+        return None
+
+    slow_query_log = SlowQueryLog(
+        threshold_ms=db_config.SLOW_QUERY_THRESHOLD_MS,
+        explain_sample_rate=db_config.SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+        size=db_config.SLOW_QUERY_LOG_SIZE,
+    )
+    slow_query_log.install(engine.sync_engine)
+    if replica_engine is not None:
+        slow_query_log.install(replica_engine.sync_engine, "replica")
+    return slow_query_log
+
+class ReadReplicaRouter:
+    # hands out the replica session maker while the replica answers and is not lagging
+    # past max_lag seconds, the primary one otherwise; the check result is reused for check_interval
+    LAG_QUERY = text("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+        END
+    """)
+
+    def __init__(
+        self,
+        primary: async_sessionmaker[AsyncSession],
+        replica: async_sessionmaker[AsyncSession] | None,
+        max_lag: float,
+        check_interval: float,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.healthy = False
+        self.lag: float | None = None
+        self.checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def measure_lag(self) -> float:
+        async with self.replica() as session:
+            return float(await session.scalar(self.LAG_QUERY))
+
+    async def check(self) -> bool:
+        async with self._lock:
+            if time.monotonic() - self.checked_at < self.check_interval:
+                return self.healthy
+
+            try:
+                self.lag = await asyncio.wait_for(self.measure_lag(), timeout=self.check_interval)
+                self.healthy = self.lag <= self.max_lag
+            except Exception:
+                # connection errors of asyncpg are not wrapped into DBAPIError
+                logger.warning("read replica is unavailable, reading from the primary", exc_info=True)
+                self.lag = None
+                self.healthy = False
+            else:
+                if not self.healthy:
+                    logger.warning("read replica lags %.1f s behind, reading from the primary", self.lag)
+            self.checked_at = time.monotonic()
+            return self.healthy
+
+    def mark_unavailable(self) -> None:
+        self.healthy = False
+        self.checked_at = time.monotonic()
+
+    async def get_session_maker(self) -> async_sessionmaker[AsyncSession]:
+        if self.replica is not None and await self.check():
+            return self.replica
+        return self.primary
+
+engine = create_engine(config.db)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+replica_engine = create_engine(config.db, config.db.REPLICA_URL) if config.db.REPLICA_URL else None
+slow_query_log = create_slow_query_log(config.db, engine, replica_engine)
+read_replica_router = ReadReplicaRouter(
+    primary=async_session_maker,
+    replica=async_sessionmaker(replica_engine, expire_on_commit=False) if replica_engine else None,
+    max_lag=config.db.REPLICA_MAX_LAG,
+    check_interval=config.db.REPLICA_CHECK_INTERVAL,
+)
+
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+async def get_async_session_maker() -> async_sessionmaker[AsyncSession]:
+    return async_session_maker
+
+async def get_async_read_session_maker() -> async_sessionmaker[AsyncSession]:
+    # read-only queries that tolerate the replica lag
+    return await read_replica_router.get_session_maker()
+
+async def get_async_read_session(
+    session_maker: async_sessionmaker[AsyncSession] = Depends(get_async_read_session_maker)
+) -> AsyncGenerator[AsyncSession, None]:
+    async with session_maker() as session:
+        try:
+            yield session
+        except (OSError, exc.InterfaceError):
+            # the replica went away between two checks, later requests go to the primary
+            if session_maker is read_replica_router.replica:
+                read_replica_router.mark_unavailable()
+            raise
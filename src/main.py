@@ -1,14 +1,108 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
+from fastapi import FastAPI, Request, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import DBAPIError
+
+from src.config import config
+from src.database import async_session_maker
+from src.coil.admission import AdmissionControl, RouteLimits
+from src.coil.batcher import CoilWriteBatcher
+from src.coil.cache import StatsCache
+from src.coil.changes import CoilChangeFeed
+from src.coil.memory import CoilColumnStore
 from src.coil.router import router as coil_router
+from src.admin.router import router as admin_router
+from src.metrics import PrometheusMiddleware, router as metrics_router
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # listening from the start keeps the stats cache in step with writes made through other workers
+    app.state.change_feed.start()
+    if app.state.coil_store is not None:
+        app.state.coil_store.start()
+    yield
+    if app.state.write_batcher is not None:
+        await app.state.write_batcher.stop()
+    if app.state.coil_store is not None:
+        await app.state.coil_store.stop()
+    await app.state.change_feed.stop()
 
 app = FastAPI(
     title="Warehouse metal coil app",
+    lifespan=lifespan,
 )
 
+app.state.stats_cache = StatsCache(
+    max_size=config.coil.STATS_CACHE_SIZE,
+    ttl=config.coil.STATS_CACHE_TTL,
+    long_ttl=config.coil.STATS_CACHE_LONG_TTL,
+)
+app.state.change_feed = CoilChangeFeed(
+    db_config=config.db,
+    session_maker=async_session_maker,
+    stats_cache=app.state.stats_cache,
+    buffer_size=config.coil.CHANGES_SUBSCRIBER_BUFFER,
+    retention_days=config.coil.CHANGES_RETENTION_DAYS,
+    prune_interval=config.coil.CHANGES_PRUNE_INTERVAL,
+)
+# reads are served from it once it is loaded, until then they go to the database
+app.state.coil_store = CoilColumnStore(
+    session_maker=async_session_maker,
+    change_feed=app.state.change_feed,
+    heartbeat=config.coil.CHANGES_HEARTBEAT,
+) if config.coil.MEMORY_STORE else None
+# single-coil POSTs of a worker are grouped into multi-row inserts with one commit
+app.state.write_batcher = CoilWriteBatcher(
+    session_maker=async_session_maker,
+    stats_cache=app.state.stats_cache,
+    max_size=config.coil.WRITE_BATCH_MAX_SIZE,
+    max_delay=config.coil.WRITE_BATCH_MAX_DELAY,
+    queue_size=config.coil.WRITE_BATCH_QUEUE_SIZE,
+) if config.coil.WRITE_BATCH else None
+# heavy reads are limited per route, so they cannot take every pooled connection away from the writes
+app.state.admission = AdmissionControl({
+    "stats": RouteLimits(
+        max_concurrency=config.coil.STATS_MAX_CONCURRENCY,
+        queue_size=config.coil.ADMISSION_QUEUE_SIZE,
+        queue_timeout=config.coil.ADMISSION_QUEUE_TIMEOUT,
+        statement_timeout=config.coil.STATS_STATEMENT_TIMEOUT,
+        max_rows=config.coil.STATS_MAX_ROWS,
+    ),
+    "list": RouteLimits(
+        max_concurrency=config.coil.LIST_MAX_CONCURRENCY,
+        queue_size=config.coil.ADMISSION_QUEUE_SIZE,
+        queue_timeout=config.coil.ADMISSION_QUEUE_TIMEOUT,
+        statement_timeout=config.coil.LIST_STATEMENT_TIMEOUT,
+        max_rows=config.coil.LIST_MAX_ROWS,
+    ),
+    # pending jobs wait for a slot until they would time out anyway
+    "jobs": RouteLimits(
+        max_concurrency=config.coil.STATS_JOB_MAX_CONCURRENCY,
+        queue_size=config.coil.STATS_JOB_QUEUE_SIZE,
+        queue_timeout=config.coil.STATS_JOB_TIMEOUT,
+        statement_timeout=config.coil.STATS_JOB_TIMEOUT,
+        max_rows=0,
+    ),
+})
+
+@app.exception_handler(DBAPIError)
+async def handle_statement_timeout(request: Request, error: DBAPIError):
+    # query_canceled: the statement_timeout of a heavy route ran out
+    if getattr(error.orig, "sqlstate", None) != "57014":
+        raise error
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": {"msg": "The query ran longer than allowed and was cancelled"}},
+    )
+
 routers = (
     coil_router,
+    admin_router,
+    metrics_router,
 )
 
 [app.include_router(router) for router in routers]
+
+app.add_middleware(PrometheusMiddleware)
@@ -0,0 +1,133 @@
+import inspect
+import os
+import time
+from functools import wraps
+
+from fastapi import APIRouter, Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from src.database import MonitoredQueuePool, query_source, request_scope
+
+
+# with gunicorn, PROMETHEUS_MULTIPROC_DIR makes every worker write its samples to shared files
+# and /metrics aggregates them, whichever worker serves the scrape
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+)
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds", "Database statement latency", ["source", "operation"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections", "Connections checked out of the pool", multiprocess_mode="livesum",
+)
+ADMISSION_REJECTIONS = Counter(
+    "http_admission_rejections_total", "Requests of heavy routes turned away", ["route", "reason"],
+)
+
+def track_queries(function):
+    # labels the statements issued by a service function with its name
+    name = function.__name__
+
+    if inspect.isasyncgenfunction(function):
+        @wraps(function)
+        async def generator_wrapper(*args, **kwargs):
+            generator = function(*args, **kwargs)
+            try:
+                while True:
+                    token = query_source.set(name)
+                    try:
+                        item = await generator.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        query_source.reset(token)
+                    yield item
+            finally:
+                await generator.aclose()
+
+        return generator_wrapper
+
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = query_source.set(name)
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            query_source.reset(token)
+
+    return wrapper
+
+# the start time lives on the execution context: after_cursor_execute does not fire for failed or
+# cancelled statements, anything kept on the pooled connection would be left behind by them
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._statement_started_at = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _observe_statement(conn, cursor, statement, parameters, context, executemany):
+    if (started_at := getattr(context, "_statement_started_at", None)) is None:
+        return
+    duration = time.perf_counter() - started_at
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    DB_STATEMENT_LATENCY.labels(query_source.get(), operation).observe(duration)
+
+@event.listens_for(Pool, "checkout")
+def _connection_checked_out(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKED_OUT.inc()
+
+@event.listens_for(Pool, "checkin")
+def _connection_checked_in(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+MonitoredQueuePool.wait_listeners.append(DB_POOL_WAIT.observe)
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        scope_token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_scope.reset(scope_token)
+            # the route template keeps label cardinality bounded (/api/coil/{id}, not every id)
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], route.path if route else "unmatched", str(status_code)
+            ).observe(time.perf_counter() - started_at)
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
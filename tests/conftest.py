@@ -1,17 +1,21 @@
 import asyncio
+from datetime import datetime
 from typing import AsyncGenerator
 
 import pytest
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
 
+from sqlalchemy import insert, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
 from src.main import app
-from src.database import get_async_session, metadata
+from src.database import get_async_session, get_async_session_maker, get_async_read_session_maker, metadata
 from src.config import config
+from src.coil.models import Coil, CoilDailyRollup, CoilDailySketch, CoilStatsJob
+from src.coil.rollup import rebuild_coil_daily_rollup
 
 
 engine_test = create_async_engine(config.db.URL, poolclass=NullPool)
@@ -22,7 +26,12 @@ async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
+async def override_get_async_session_maker() -> sessionmaker:
+    return async_session_maker
+
 app.dependency_overrides[get_async_session] = override_get_async_session
+app.dependency_overrides[get_async_session_maker] = override_get_async_session_maker
+app.dependency_overrides[get_async_read_session_maker] = override_get_async_session_maker
 
 @pytest.fixture(autouse=True, scope='session')
 async def prepare_database():
@@ -46,3 +55,31 @@ client = TestClient(app)
 async def async_client() -> AsyncGenerator[AsyncClient, None]:
     async with AsyncClient(app=app, base_url="http://test") as async_client:
         yield async_client
+
+
+@pytest.fixture
+async def clear_coils_table():
+    async with async_session_maker() as session:
+        query = text(
+            f"TRUNCATE TABLE {Coil.__tablename__}, {CoilDailyRollup.__tablename__}, {CoilDailySketch.__tablename__}, "
+            f"{CoilStatsJob.__tablename__} "
+            "RESTART IDENTITY;"
+        )
+        await session.execute(query)
+        await session.commit()
+
+    app.state.stats_cache.clear()
+
+@pytest.fixture
+async def create_dated_coils():
+    async with async_session_maker() as session:
+        coils = [
+            {"length": 10, "weight": 100, "created_at": datetime(2023, 3, 1, 10), "deleted_at": datetime(2023, 3, 5, 10)},
+            {"length": 20, "weight": 200, "created_at": datetime(2023, 3, 1, 12), "deleted_at": None},
+            {"length": 30, "weight": 300, "created_at": datetime(2023, 3, 2, 12), "deleted_at": datetime(2023, 3, 4, 10)},
+            {"length": 40, "weight": 400, "created_at": datetime(2023, 3, 4, 12), "deleted_at": None},
+        ]
+        query = insert(Coil).values(coils)
+        await session.execute(query)
+        await rebuild_coil_daily_rollup(session)
+        await session.commit()
@@ -0,0 +1,119 @@
+from fastapi import Response
+from httpx import AsyncClient
+
+from sqlalchemy import text
+
+from src.admin import router as admin_router
+from src.config import config
+from src.database import SlowQueryLog, create_engine, engine
+from conftest import async_session_maker, engine_test
+
+
+async def test_pool_metrics(async_client: AsyncClient):
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+        response: Response = await async_client.get("/api/admin/db/pool")
+        assert response.status_code == 200
+
+        metrics = response.json()
+        assert metrics["checked_out"] == 1
+        assert metrics["checkouts"] >= 1
+        assert metrics["replica"] is None
+
+    await engine.dispose()
+
+async def test_replica_pool_metrics(async_client: AsyncClient, monkeypatch):
+    replica_engine = create_engine(config.db)
+    monkeypatch.setattr(admin_router, "replica_engine", replica_engine)
+    try:
+        async with replica_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+            response: Response = await async_client.get("/api/admin/db/pool")
+            assert response.status_code == 200
+
+            replica = response.json()["replica"]
+            assert replica["checked_out"] == 1
+            assert replica["checkouts"] == 1
+    finally:
+        await replica_engine.dispose()
+
+async def test_slow_queries(async_client: AsyncClient, clear_coils_table, monkeypatch):
+    response: Response = await async_client.get("/api/admin/db/slow-queries")
+    assert response.status_code == 404
+
+    slow_query_log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1, size=6)
+    slow_query_log.install(engine_test.sync_engine)
+    monkeypatch.setattr(admin_router, "slow_query_log", slow_query_log)
+    try:
+        await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+        await async_client.get("/api/coil", params={"from_weight": 50, "to_weight": 150})
+    finally:
+        slow_query_log.uninstall()
+
+    response = await async_client.get("/api/admin/db/slow-queries")
+    assert response.status_code == 200
+
+    entries = response.json()
+    assert len(entries) == 6
+    select = next(entry for entry in entries if entry["source"] == "get_coils")
+    assert select["route"] == "GET /api/coil"
+    assert select["source"] == "get_coils"
+    assert "150" in select["parameters"]
+    assert any("Buffers" in line or "Scan" in line for line in select["plan"])
+    # the POST ends with the change feed INSERT and NOTIFY
+    insert = next(entry for entry in entries if entry["statement"].startswith("INSERT"))
+    assert insert["plan"] is None
+
+async def test_slow_query_explain_is_rolled_back():
+    slow_query_log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1, size=6)
+    slow_query_log.install(engine_test.sync_engine)
+    try:
+        async with async_session_maker() as session:
+            # a statement with a side effect: the EXPLAIN ANALYZE re-run must not apply it a second time
+            await session.execute(text(
+                "SELECT set_config('coil.explained', "
+                "(coalesce(nullif(current_setting('coil.explained', true), ''), '0')::int + 1)::text, true)"
+            ))
+            assert await session.scalar(text("SHOW coil.explained")) == "1"
+    finally:
+        slow_query_log.uninstall()
+
+    assert slow_query_log.entries[0]["plan"] is not None
+
+async def test_slow_query_explain_skips_data_modifying_ctes(async_client: AsyncClient, clear_coils_table):
+    response: Response = await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+    id = response.json()["id"]
+
+    slow_query_log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1, size=20)
+    slow_query_log.install(engine_test.sync_engine)
+    try:
+        assert (await async_client.delete(f"/api/coil/{id}")).status_code == 204
+        await async_client.get("/api/coil/stats", params={"from_date": "2023-03-01", "to_date": "2023-03-05"})
+    finally:
+        slow_query_log.uninstall()
+
+    statements = [entry for entry in slow_query_log.entries if entry["statement"].startswith("WITH")]
+    # the soft delete is WITH ... UPDATE ... RETURNING, the stats queries read-only CTEs
+    assert any("UPDATE" in entry["statement"] and entry["plan"] is None for entry in statements)
+    assert any("UPDATE" not in entry["statement"] and entry["plan"] for entry in statements)
+
+async def test_slow_queries_of_the_replica():
+    replica_engine = create_engine(config.db)
+    slow_query_log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1, size=6)
+    slow_query_log.install(engine_test.sync_engine)
+    slow_query_log.install(replica_engine.sync_engine, "replica")
+    try:
+        async with replica_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        async with engine_test.connect() as connection:
+            await connection.execute(text("SELECT 2"))
+    finally:
+        slow_query_log.uninstall()
+        await replica_engine.dispose()
+
+    databases = {entry["statement"]: entry["database"] for entry in slow_query_log.entries}
+    assert databases["SELECT 1"] == "replica"
+    assert databases["SELECT 2"] == "primary"
+    assert all(entry["plan"] for entry in slow_query_log.entries if entry["statement"] == "SELECT 1")
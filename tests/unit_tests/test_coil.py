@@ -6,21 +6,14 @@ from contextlib import nullcontext as does_not_raise
 from fastapi import Response
 from httpx import AsyncClient
 
-from sqlalchemy import insert, text
+from sqlalchemy import insert
 
 from conftest import client, async_session_maker
 
+from src.config import config
 from src.coil.models import Coil
 
 
-@pytest.fixture
-async def clear_coils_table():
-    async with async_session_maker() as session:
-        query = text(f"TRUNCATE TABLE {Coil.__tablename__} RESTART IDENTITY;")
-        await session.execute(query)
-        await session.commit()
-        
-        
 @pytest.fixture
 async def create_coils():
     async with async_session_maker() as session:
@@ -145,3 +138,123 @@ async def test_get_coil_stats(from_date, to_date, expected_status_code, expected
         
         for key, value in expected_values.items():
             assert response_data[key] == value
+
+
+async def test_coil_batch_creation(async_client: AsyncClient, clear_coils_table):
+    data = [{"length": 10, "weight": 100}, {"length": 20, "weight": 200}, {"length": 30, "weight": 300}]
+    response: Response = await async_client.post("/api/coil/batch", json=data)
+
+    assert response.status_code == 201
+    assert response.json()["ids"] == [1, 2, 3]
+
+
+@pytest.mark.parametrize(
+    "filename, content, content_type, expected_status_code, expected_ids",
+    [
+        ("coils.csv", "length,weight\n10,100\n20,200\n", "text/csv", 201, [1, 2]),
+        ("coils.ndjson", '{"length": 10, "weight": 100}\n{"length": 20, "weight": 200}\n', "application/x-ndjson", 201, [1, 2]),
+        ("coils.csv", "length,weight\n10,100\n0,200\n", "text/csv", 422, None),
+        ("coils.xml", "<coils/>", "application/xml", 415, None),
+        # unreadable content of a supported type is not an unsupported media type
+        ("coils.ndjson", '{"length": 10, "weight": 100}\n{"length": 20,\n', "application/x-ndjson", 422, None),
+        ("coils.csv", b"length,weight\n10,100\n\xff,200\n", "text/csv", 422, None),
+    ]
+)
+async def test_coil_batch_creation_from_file(filename, content, content_type, expected_status_code, expected_ids, async_client: AsyncClient, clear_coils_table):
+    response: Response = await async_client.post("/api/coil/batch/file", files={"file": (filename, content, content_type)})
+
+    assert response.status_code == expected_status_code
+
+    if expected_ids:
+        assert response.json()["ids"] == expected_ids
+
+async def test_coil_batch_creation_from_file_errors(async_client: AsyncClient, clear_coils_table, monkeypatch):
+    content = '{"length": 10, "weight": 100}\n\n{"length": 20,\n'
+    response: Response = await async_client.post("/api/coil/batch/file", files={"file": ("coils.ndjson", content)})
+    assert response.status_code == 422
+    assert response.json()["detail"]["line"] == 3
+
+    monkeypatch.setattr(config.coil, "BATCH_MAX_ROWS", 1)
+    content = "length,weight\n10,100\n20,200\n"
+    response = await async_client.post("/api/coil/batch/file", files={"file": ("coils.csv", content)})
+    assert response.status_code == 422
+    assert response.json()["detail"]["line"] == 3
+
+    response = await async_client.post("/api/coil/batch", json=[{"length": 10, "weight": 100}] * 2)
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "query_params, headers, expected_content_type, expected_lines",
+    [
+        ({"from_id": 1, "to_id": 3, "format": "ndjson"}, {}, "application/x-ndjson", 3),
+        ({"from_id": 1, "to_id": 3}, {"Accept": "application/x-ndjson"}, "application/x-ndjson", 3),
+        ({"from_id": 1, "to_id": 2, "format": "csv"}, {}, "text/csv", 3),
+        ({"from_id": 100, "to_id": 500, "format": "csv"}, {}, "text/csv", 1),
+    ]
+)
+async def test_get_coil_streaming(query_params, headers, expected_content_type, expected_lines, async_client: AsyncClient, clear_coils_table, create_coils):
+    response: Response = await async_client.get("/api/coil", params=query_params, headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(expected_content_type)
+    assert len(response.text.splitlines()) == expected_lines
+
+
+async def test_get_coil_keyset_pagination(async_client: AsyncClient, clear_coils_table, create_coils):
+    params = {"from_weight": 1, "to_weight": 1000, "limit": 2}
+
+    response: Response = await async_client.get("/api/coil", params=params)
+    assert response.status_code == 200
+    assert [coil["id"] for coil in response.json()] == [1, 2]
+
+    cursor = response.headers["X-Next-Cursor"]
+    response: Response = await async_client.get("/api/coil", params={**params, "cursor": cursor})
+    assert response.status_code == 200
+    assert [coil["id"] for coil in response.json()] == [3]
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.parametrize(
+    "query_params",
+    [
+        ({"from_id": 1, "to_id": 3, "cursor": "not-a-cursor", "limit": 2}),
+        ({"from_id": 1, "to_id": 3, "cursor": "eyJpZCI6IDF9"}),
+        ({"limit": 2}),
+    ]
+)
+async def test_get_coil_pagination_with_wrong_params(query_params, async_client: AsyncClient):
+    response: Response = await async_client.get("/api/coil", params=query_params)
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "delete_params, expected_status_code, expected_result",
+    [
+        ({"ids": [1, 3, 100]}, 200, {"deleted": [1, 3], "already_deleted": [], "not_found": [100]}),
+        ({"ids": [2]}, 200, {"deleted": [], "already_deleted": [2], "not_found": []}),
+        ({"from_id": 1, "to_id": 3}, 200, {"deleted": [1, 3], "already_deleted": [2], "not_found": []}),
+        ({"from_id": 1}, 422, None),
+        ({}, 422, None),
+    ]
+)
+async def test_coil_batch_deletion(delete_params, expected_status_code, expected_result, async_client: AsyncClient, clear_coils_table, create_coils):
+    await async_client.delete("/api/coil/2")
+
+    response: Response = await async_client.post("/api/coil/batch/delete", json=delete_params)
+    assert response.status_code == expected_status_code
+
+    if expected_result:
+        assert response.json() == expected_result
+
+
+async def test_get_coil_columnar_layout(async_client: AsyncClient, clear_coils_table, create_coils):
+    rows_response: Response = await async_client.get("/api/coil", params={"from_id": 1, "to_id": 3})
+    columns_response: Response = await async_client.get("/api/coil", params={"from_id": 1, "to_id": 3, "layout": "columns"})
+
+    assert columns_response.status_code == 200
+
+    rows, columns = rows_response.json(), columns_response.json()
+    assert columns["id"] == [1, 2, 3]
+    assert columns["weight"] == [100, 50, 1000]
+    assert [dict(zip(columns, values)) for values in zip(*columns.values())] == rows
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from src.main import app
+from src.database import statement_timeout
+from src.coil import jobs as coil_jobs, router as coil_router
+from src.coil.admission import AdmissionControl, RouteLimits
+from conftest import async_session_maker
+
+
+STATS_PARAMS = {"from_date": "2023-03-01", "to_date": "2023-03-05"}
+
+
+@pytest.fixture
+async def admission(request):
+    limits = RouteLimits(**request.param)
+    previous = app.state.admission
+    app.state.admission = AdmissionControl({"stats": limits, "list": limits, "jobs": limits})
+    yield app.state.admission
+    app.state.admission = previous
+
+async def test_statement_timeout_is_local():
+    token = statement_timeout.set(0.25)
+    try:
+        async with async_session_maker() as session:
+            assert await session.scalar(text("SHOW statement_timeout")) == "250ms"
+    finally:
+        statement_timeout.reset(token)
+
+    async with async_session_maker() as session:
+        assert await session.scalar(text("SHOW statement_timeout")) == "0"
+
+@pytest.mark.parametrize("admission", [
+    {"max_concurrency": 1, "queue_size": 0, "queue_timeout": 1, "statement_timeout": 0, "max_rows": 0}
+], indirect=True)
+async def test_stats_queue_full(async_client: AsyncClient, clear_coils_table, create_dated_coils, admission, monkeypatch):
+    get_coil_stats_summary = coil_router.get_coil_stats_summary
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_stats_summary(date_range, session_maker):
+        started.set()
+        await release.wait()
+        return await get_coil_stats_summary(date_range, session_maker)
+
+    monkeypatch.setattr(coil_router, "get_coil_stats_summary", slow_stats_summary)
+
+    running = asyncio.create_task(async_client.get("/api/coil/stats", params=STATS_PARAMS))
+    await started.wait()
+    # another range, a cached one would not need a slot
+    response = await async_client.get("/api/coil/stats", params={**STATS_PARAMS, "to_date": "2023-03-04"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    release.set()
+    assert (await running).status_code == 200
+    assert admission.get_limiter("stats", "/api/coil/stats").running == 0
+
+@pytest.mark.parametrize("admission", [
+    {"max_concurrency": 1, "queue_size": 1, "queue_timeout": 1, "statement_timeout": 0.05, "max_rows": 0}
+], indirect=True)
+async def test_stats_statement_timeout(async_client: AsyncClient, clear_coils_table, create_dated_coils, admission, monkeypatch):
+    async def slow_stats_summary(date_range, session_maker):
+        async with session_maker() as session:
+            await session.execute(text("SELECT pg_sleep(1)"))
+
+    monkeypatch.setattr(coil_router, "get_coil_stats_summary", slow_stats_summary)
+
+    response = await async_client.get("/api/coil/stats", params=STATS_PARAMS)
+    assert response.status_code == 503
+    assert response.json()["detail"]["msg"] == "The query ran longer than allowed and was cancelled"
+
+@pytest.mark.parametrize("admission", [
+    {"max_concurrency": 1, "queue_size": 1, "queue_timeout": 1, "statement_timeout": 0, "max_rows": 1}
+], indirect=True)
+async def test_cost_guard(async_client: AsyncClient, clear_coils_table, create_dated_coils, admission):
+    async with async_session_maker() as session:
+        await session.execute(text("ANALYZE coil_coils"))
+        await session.commit()
+
+    params = {"from_weight": 1, "to_weight": 1000}
+    response = await async_client.get("/api/coil", params=params)
+    assert response.status_code == 422
+    assert "page through it with limit" in response.json()["detail"]["msg"]
+
+    # pages and streams do not hold the whole result
+    response = await async_client.get("/api/coil", params={**params, "limit": 2})
+    assert response.status_code == 200
+    response = await async_client.get("/api/coil", params={**params, "format": "ndjson"})
+    assert response.status_code == 200
+
+    response = await async_client.get("/api/coil/stats", params=STATS_PARAMS)
+    assert response.status_code == 422
+    assert "/api/coil/stats/jobs" in response.json()["detail"]["msg"]
+
+    response = await async_client.post("/api/coil/stats/batch", json={**STATS_PARAMS, "bucket": "day"})
+    assert response.status_code == 422
+    assert "/api/coil/stats/jobs" in response.json()["detail"]["msg"]
+
+@pytest.mark.parametrize("admission", [
+    {"max_concurrency": 1, "queue_size": 1, "queue_timeout": 1, "statement_timeout": 0, "max_rows": 0}
+], indirect=True)
+async def test_stats_jobs_are_bounded(async_client: AsyncClient, clear_coils_table, create_dated_coils, admission, monkeypatch):
+    get_coil_stats_summary = coil_jobs.get_coil_stats_summary
+    started, release = asyncio.Event(), asyncio.Event()
+    running_jobs = max_running_jobs = 0
+
+    async def slow_stats_summary(date_range, session_maker):
+        nonlocal running_jobs, max_running_jobs
+        running_jobs += 1
+        max_running_jobs = max(max_running_jobs, running_jobs)
+        started.set()
+        await release.wait()
+        try:
+            return await get_coil_stats_summary(date_range, session_maker)
+        finally:
+            running_jobs -= 1
+
+    monkeypatch.setattr(coil_jobs, "get_coil_stats_summary", slow_stats_summary)
+    limiter = admission.get_limiter("jobs", "/api/coil/stats/jobs")
+
+    # the requests return once their job has run, so they are sent as tasks
+    running = asyncio.create_task(async_client.post("/api/coil/stats/jobs", json=STATS_PARAMS))
+    await started.wait()
+    queued = asyncio.create_task(async_client.post("/api/coil/stats/jobs", json={**STATS_PARAMS, "to_date": "2023-03-04"}))
+    while limiter.waiting == 0:
+        await asyncio.sleep(0.01)
+
+    # one job runs and one waits for its slot, another one is not accepted
+    response = await async_client.post("/api/coil/stats/jobs", json={**STATS_PARAMS, "to_date": "2023-03-03"})
+    assert response.status_code == 503
+    assert response.json()["detail"]["msg"] == "Too many stats jobs are queued, retry later"
+
+    release.set()
+    for request in (running, queued):
+        job = (await request).json()
+        response = await async_client.get(f"/api/coil/stats/jobs/{job['id']}")
+        assert response.json()["status"] == "done"
+
+    assert max_running_jobs == 1
+    assert limiter.running == 0 and limiter.waiting == 0
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from httpx import AsyncClient
+from sqlalchemy import select, text
+
+from src.main import app
+from src.coil.batcher import CoilWriteBatcher
+from src.coil.models import Coil
+from conftest import async_session_maker
+
+
+@pytest.fixture
+async def write_batcher(request):
+    max_size, max_delay, queue_size = request.param
+    write_batcher = CoilWriteBatcher(
+        async_session_maker, app.state.stats_cache, max_size=max_size, max_delay=max_delay, queue_size=queue_size
+    )
+    app.state.write_batcher = write_batcher
+    yield write_batcher
+    await write_batcher.stop()
+    app.state.write_batcher = None
+
+async def post_coils(async_client: AsyncClient, count: int) -> list:
+    return await asyncio.gather(*[
+        async_client.post("/api/coil", json={"length": i + 1, "weight": (i + 1) * 10}) for i in range(count)
+    ])
+
+@pytest.mark.parametrize("write_batcher", [(8, 0.05, 100)], indirect=True)
+async def test_create_coil_batched(async_client: AsyncClient, clear_coils_table, write_batcher):
+    responses = await post_coils(async_client, 20)
+    assert [response.status_code for response in responses] == [201] * 20
+
+    async with async_session_maker() as session:
+        coils = {coil.id: coil for coil in await session.scalars(select(Coil))}
+        # rows inserted by one transaction share xmin
+        transactions = (await session.execute(
+            text(f"SELECT xmin::text, count(*) FROM {Coil.__tablename__} GROUP BY 1")
+        )).all()
+
+    # every caller gets the id of its own coil
+    for i, response in enumerate(responses):
+        coil = coils[response.json()["id"]]
+        assert (coil.length, coil.weight) == (i + 1, (i + 1) * 10)
+    assert len(coils) == 20
+    assert 3 <= len(transactions) < 20
+    assert max(count for _, count in transactions) <= 8
+
+@pytest.mark.parametrize("write_batcher", [(1, 0, 1)], indirect=True)
+async def test_create_coil_queue_full(async_client: AsyncClient, clear_coils_table, write_batcher):
+    responses = await post_coils(async_client, 10)
+    statuses = [response.status_code for response in responses]
+
+    assert 503 in statuses
+    assert set(statuses) == {201, 503}
+    rejected = next(response for response in responses if response.status_code == 503)
+    assert rejected.headers["retry-after"] == "1"
+
+    async with async_session_maker() as session:
+        created = len((await session.scalars(select(Coil))).all())
+    assert created == statuses.count(201)
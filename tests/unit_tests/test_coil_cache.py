@@ -0,0 +1,84 @@
+import time
+from datetime import datetime
+
+from fastapi import Response
+from httpx import AsyncClient
+
+from src.main import app
+from src.database import read_replica_router
+from src.coil.cache import StatsCache
+from conftest import async_session_maker
+
+
+MARCH = (datetime(2023, 3, 1), datetime(2023, 3, 31, 23, 59, 59))
+APRIL = (datetime(2023, 4, 1), datetime(2023, 4, 30, 23, 59, 59))
+
+
+def test_stats_cache_lru_eviction():
+    cache = StatsCache(max_size=1, ttl=60, long_ttl=60)
+
+    cache.set(MARCH, "march", long_lived=False, version=cache.version)
+    cache.set(APRIL, "april", long_lived=False, version=cache.version)
+
+    assert cache.get(MARCH) is None
+    assert cache.get(APRIL) == "april"
+    assert cache.info() == {"size": 1, "max_size": 1, "hits": 1, "misses": 1}
+
+
+def test_stats_cache_ttl():
+    cache = StatsCache(max_size=10, ttl=-1, long_ttl=60)
+
+    cache.set(MARCH, "march", long_lived=False, version=cache.version)
+    cache.set(APRIL, "april", long_lived=True, version=cache.version)
+
+    assert cache.get(MARCH) is None
+    assert cache.get(APRIL) == "april"
+
+
+def test_stats_cache_invalidation():
+    cache = StatsCache(max_size=10, ttl=60, long_ttl=60)
+    version = cache.version
+
+    cache.set(MARCH, "march", long_lived=False, version=version)
+    cache.set(APRIL, "april", long_lived=False, version=version)
+    cache.invalidate([datetime(2023, 3, 15)])
+
+    assert cache.get(MARCH) is None
+    assert cache.get(APRIL) == "april"
+
+    # results computed before the write must not be stored
+    cache.set(MARCH, "stale march", long_lived=False, version=version)
+    assert cache.get(MARCH) is None
+
+
+async def test_stats_endpoint_cache(async_client: AsyncClient, clear_coils_table):
+    today = datetime.utcnow().date()
+    await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+
+    for _ in range(2):
+        response: Response = await async_client.get(f"/api/coil/stats?from_date={today}&to_date={today}")
+        assert response.json()["amount"] == 1
+
+    await async_client.post("/api/coil", json={"length": 20, "weight": 200})
+    response: Response = await async_client.get(f"/api/coil/stats?from_date={today}&to_date={today}")
+    assert response.json()["amount"] == 2
+
+    response: Response = await async_client.get("/api/coil/stats/cache")
+    assert response.json()["hits"] >= 1
+
+async def test_stats_from_replica_are_not_kept_long(async_client: AsyncClient, clear_coils_table, create_dated_coils, monkeypatch):
+    # the read session maker of the tests plays the replica
+    monkeypatch.setattr(read_replica_router, "replica", async_session_maker)
+    stats_cache = app.state.stats_cache
+    params = {"from_date": "2023-03-01", "to_date": "2023-03-31"}
+
+    # a replica that has not replayed the changes this worker has seen
+    monkeypatch.setattr(app.state.change_feed, "last_seq", 10 ** 9)
+    assert (await async_client.get("/api/coil/stats", params=params)).status_code == 200
+    assert len(stats_cache) == 0
+
+    # a caught up one: a closed range, but only the short ttl
+    monkeypatch.setattr(app.state.change_feed, "last_seq", 0)
+    assert (await async_client.get("/api/coil/stats", params=params)).status_code == 200
+    [entry] = stats_cache._entries.values()
+    assert entry.expires_at - time.monotonic() <= stats_cache.ttl
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from fastapi import Response
+from httpx import AsyncClient
+
+from src.config import config
+from src.coil.cache import StatsCache
+from src.coil.changes import CoilChangeFeed, get_coil_changes_bounds
+from src.coil.router import stream_coil_changes
+from conftest import async_session_maker
+
+
+@pytest.fixture
+async def change_feed():
+    # a feed of its own stands for another worker; polling is slow so events have to come from NOTIFY
+    change_feed = CoilChangeFeed(
+        config.db, async_session_maker, StatsCache(max_size=10, ttl=60, long_ttl=60), buffer_size=10, poll_interval=30
+    )
+    yield change_feed
+    await change_feed.stop()
+
+async def get_last_seq() -> int:
+    async with async_session_maker() as session:
+        _, last_seq = await get_coil_changes_bounds(session)
+    return last_seq
+
+async def next_change(changes):
+    while (change := await asyncio.wait_for(anext(changes), timeout=3)) is None:
+        pass
+    return change
+
+
+async def test_change_feed_streams_writes(async_client: AsyncClient, clear_coils_table, change_feed: CoilChangeFeed):
+    changes = change_feed.subscribe(None, heartbeat=0.1)
+    assert await asyncio.wait_for(anext(changes), timeout=3) is None
+
+    response: Response = await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+    coil_id = response.json()["id"]
+    created = await next_change(changes)
+    assert (created.kind, created.coil_id, created.length, created.weight) == ("created", coil_id, 10, 100)
+
+    response = await async_client.delete(f"/api/coil/{coil_id}")
+    assert response.status_code == 204
+    deleted = await next_change(changes)
+    assert (deleted.kind, deleted.coil_id) == ("deleted", coil_id)
+    assert deleted.seq > created.seq and deleted.deleted_at is not None
+
+    await changes.aclose()
+
+async def test_change_feed_resumes_after_seq(async_client: AsyncClient, clear_coils_table, change_feed: CoilChangeFeed):
+    after = await get_last_seq()
+    response: Response = await async_client.post(
+        "/api/coil/batch", json=[{"length": length, "weight": 100} for length in (10, 20, 30)]
+    )
+    ids = response.json()["ids"]
+
+    # the backlog comes from the table, the batch is larger than the subscriber buffer
+    changes = change_feed.subscribe(after, heartbeat=0.1)
+    assert [(await next_change(changes)).coil_id for _ in ids] == ids
+
+    response = await async_client.post("/api/coil/batch", json=[{"length": 40, "weight": 100}] * 15)
+    assert [(await next_change(changes)).length for _ in range(15)] == [40] * 15
+
+    await changes.aclose()
+
+async def test_change_feed_invalidates_stats_cache(async_client: AsyncClient, clear_coils_table, change_feed: CoilChangeFeed):
+    key = (datetime(2000, 1, 1), datetime(2100, 1, 1))
+    change_feed.stats_cache.set(key, "stats", long_lived=False, version=change_feed.stats_cache.version)
+
+    changes = change_feed.subscribe(None, heartbeat=0.1)
+    assert await asyncio.wait_for(anext(changes), timeout=3) is None
+    await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+    await next_change(changes)
+
+    assert change_feed.stats_cache.get(key) is None
+    await changes.aclose()
+
+async def test_change_stream_events(async_client: AsyncClient, clear_coils_table, change_feed: CoilChangeFeed):
+    after = await get_last_seq()
+    response: Response = await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+
+    events = stream_coil_changes(change_feed, after, oldest_seq=1)
+    event = await asyncio.wait_for(anext(events), timeout=3)
+    assert event.startswith(f"id: {after + 1}\nevent: created\ndata: ".encode())
+    assert f'"id":{response.json()["id"]},"length":10'.encode() in event
+    await events.aclose()
+
+    events = stream_coil_changes(change_feed, 0, oldest_seq=10)
+    assert await asyncio.wait_for(anext(events), timeout=3) == b'event: reset\ndata: {"oldest_seq":10}\n\n'
+    await events.aclose()
+
+async def test_change_stream_invalid_last_event_id(async_client: AsyncClient):
+    response: Response = await async_client.get("/api/coil/changes", headers={"Last-Event-ID": "abc"})
+    assert response.status_code == 422
+
+async def test_change_feed_prunes_every_change(async_client: AsyncClient, clear_coils_table, change_feed: CoilChangeFeed):
+    await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+    last_seq = await get_last_seq()
+
+    change_feed.retention_days = 0
+    await change_feed._prune()
+    async with async_session_maker() as session:
+        # nothing is kept, the feed still knows where it ended
+        assert await get_coil_changes_bounds(session) == (last_seq + 1, last_seq)
+
+    # the next prune waits for prune_interval
+    await async_client.post("/api/coil", json={"length": 20, "weight": 200})
+    await change_feed._prune()
+    assert await get_last_seq() == last_seq + 1
+
+    events = stream_coil_changes(change_feed, last_seq - 1, oldest_seq=last_seq + 1)
+    assert await asyncio.wait_for(anext(events), timeout=3) == (
+        f'event: reset\ndata: {{"oldest_seq":{last_seq + 1}}}\n\n'.encode()
+    )
+    await events.aclose()
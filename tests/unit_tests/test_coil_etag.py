@@ -0,0 +1,61 @@
+from fastapi import Response
+from httpx import AsyncClient
+
+from src.main import app
+from src.coil import router as coil_router
+from src.coil.utils import etag_matches
+
+
+COILS_PARAMS = {"from_weight": 50, "to_weight": 500}
+STATS_PARAMS = {"from_date": "2023-03-01", "to_date": "2023-03-31"}
+
+
+async def test_get_coil_not_modified(async_client: AsyncClient, clear_coils_table):
+    await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+
+    response: Response = await async_client.get("/api/coil", params=COILS_PARAMS)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = await async_client.get("/api/coil", params=COILS_PARAMS, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag and response.content == b""
+
+    response = await async_client.get("/api/coil", params={**COILS_PARAMS, "format": "ndjson"})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+    # any write moves the watermark
+    await async_client.post("/api/coil", json={"length": 20, "weight": 200})
+    response = await async_client.get("/api/coil", params=COILS_PARAMS, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag and len(response.json()) == 2
+
+async def test_get_coil_stats_not_modified(async_client: AsyncClient, clear_coils_table, create_dated_coils, monkeypatch):
+    response: Response = await async_client.get("/api/coil/stats", params=STATS_PARAMS)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = await async_client.get("/api/coil/stats", params=STATS_PARAMS, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # without the cached entry the etag is still answered from the watermark alone
+    app.state.stats_cache.clear()
+    async def fail_get_coil_stats_summary(*args):
+        raise AssertionError("stats were computed")
+    monkeypatch.setattr(coil_router, "get_coil_stats_summary", fail_get_coil_stats_summary)
+    response = await async_client.get("/api/coil/stats", params=STATS_PARAMS, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    monkeypatch.undo()
+
+    response = await async_client.delete("/api/coil/2")
+    assert response.status_code == 204
+    response = await async_client.get("/api/coil/stats", params=STATS_PARAMS, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+def test_etag_matches():
+    assert etag_matches('"1-a"', '"1-a"')
+    assert etag_matches('"0-b", W/"1-a"', '"1-a"')
+    assert etag_matches("*", '"1-a"')
+    assert not etag_matches('"1-b"', '"1-a"')
+    assert not etag_matches(None, '"1-a"')
@@ -0,0 +1,115 @@
+import re
+from datetime import date, datetime
+
+import pytest
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql
+
+from conftest import async_session_maker, engine_test
+
+from src.coil.models import Coil
+from src.coil.partitions import create_coil_partitions
+from src.coil.schemas import CoilSchemaGetParams, CoilSnapshotParams, DateRangeSchema
+from src.coil.servises import get_coil_daily_query, get_coil_filters, get_coil_snapshot_query
+
+
+async def explain(query, disabled_scans: tuple[str, ...] = ()) -> str:
+    compiled = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+
+    async with async_session_maker() as session:
+        # the test table is tiny, so force the planner off sequential scans
+        for scan in ("seqscan", *disabled_scans):
+            await session.execute(text(f"SET LOCAL enable_{scan} = off"))
+        result = await session.execute(text(f"EXPLAIN {compiled}"))
+        plan = "\n".join(row[0] for row in result.all())
+
+        # coil_coils is partitioned, plans name the per-partition indexes
+        result = await session.execute(text("""
+            SELECT child.relname, parent.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = inhrelid
+            JOIN pg_class parent ON parent.oid = inhparent
+            WHERE child.relkind = 'i'
+        """))
+        for partition_index, index in result.all():
+            plan = re.sub(rf"\b{partition_index}\b", index, plan)
+        return plan
+
+
+@pytest.mark.parametrize(
+    "range_params, expected_indexes",
+    [
+        ({"from_created_at": "2023-01-01", "to_created_at": "2023-12-31"}, ("ix_coil_coils_created_at", "ix_coil_coils_created_at_brin")),
+        ({"from_deleted_at": "2023-01-01", "to_deleted_at": "2023-12-31"}, ("ix_coil_coils_deleted_at",)),
+        ({"from_weight": 10, "to_weight": 100}, ("ix_coil_coils_weight",)),
+        ({"from_length": 10, "to_length": 100}, ("ix_coil_coils_length",)),
+    ]
+)
+async def test_get_coil_filters_use_indexes(range_params, expected_indexes):
+    query = select(Coil.id).where(get_coil_filters(CoilSchemaGetParams(**range_params)))
+    # off full index-only scans of the covering deleted_at index too, it holds every column the filters read
+    plan = await explain(query, disabled_scans=("indexonlyscan",))
+
+    assert any(index in plan for index in expected_indexes), plan
+
+
+async def test_daily_stats_use_expression_index():
+    # whole days come from the rollup, raw rows only from the partial edge days
+    date_range = DateRangeSchema(from_date="2023-01-01T12:00:00", to_date="2023-12-31T06:00:00")
+    plan = await explain(select(get_coil_daily_query(date_range)))
+
+    assert "ix_coil_coils_created_date" in plan, plan
+
+
+async def test_on_hand_coils_use_partial_index():
+    query = select(func.count()).select_from(Coil).where(
+        Coil.deleted_at.is_(None),
+        Coil.created_at <= datetime(2023, 12, 31)
+    )
+    plan = await explain(query)
+
+    assert "ix_coil_coils_on_hand" in plan, plan
+
+
+async def test_snapshot_is_index_only(clear_coils_table):
+    # ten months of coils shaped like production, most of them deleted a month after arriving, in monthly
+    # partitions, vacuumed and analyzed: on a page of rows with no visibility map a bitmap or plain index
+    # scan always wins
+    async with async_session_maker() as session:
+        await session.execute(text("""
+            INSERT INTO coil_coils (length, weight, created_at, deleted_at)
+            SELECT n % 100 + 1, n % 1000 + 1, created_at,
+                   CASE WHEN n % 16 <> 0 THEN created_at + interval '30 days' END
+            FROM generate_series(1, 17500) n,
+                 LATERAL (SELECT timestamp '2023-01-01' + n * interval '25 minutes' AS created_at) dates
+        """))
+        await create_coil_partitions(session, date(2023, 1, 1), date(2023, 10, 1))
+        await session.commit()
+
+    try:
+        async with engine_test.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM ANALYZE coil_coils"))
+
+        # after the last month, so that each branch keeps only part of every month
+        snapshot = get_coil_snapshot_query(CoilSnapshotParams(at="2023-11-15"))
+        plan = await explain(select(func.count(), func.sum(snapshot.c.weight)))
+    finally:
+        async with async_session_maker() as session:
+            partitions = await session.scalars(text(
+                "SELECT inhrelid::regclass::text FROM pg_inherits "
+                "WHERE inhparent = 'coil_coils'::regclass AND inhrelid <> 'coil_coils_default'::regclass"
+            ))
+            for partition in partitions.all():
+                await session.execute(text(f"DROP TABLE {partition}"))
+            await session.execute(text("TRUNCATE TABLE coil_coils RESTART IDENTITY"))
+            await session.commit()
+
+    # neither branch of the UNION ALL reads the table in any of the ten months; the default partition
+    # is empty, but never pruned
+    scans = [
+        line.strip() for line in plan.splitlines()
+        if " Scan " in line and "Subquery Scan" not in line and "coil_coils_default" not in line
+    ]
+    assert len(scans) == 20, plan
+    assert all(scan.startswith("->  Index Only Scan using ix_coil_coils_deleted_at") for scan in scans), plan
@@ -0,0 +1,163 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from httpx import AsyncClient
+from sqlalchemy import delete, insert, select, update
+
+from src.config import config
+from src.coil.cache import StatsCache
+from src.coil.changes import CoilChangeFeed
+from src.coil.memory import CoilColumnStore
+from src.coil.models import Coil, CoilChange
+from src.coil.rollup import rebuild_coil_daily_rollup
+from src.coil.schemas import CoilSchemaGetParams, DateRangeSchema
+from src.coil.servises import get_coil_occupancy, get_coil_stats_summary, get_coils
+from src.coil.utils import encode_cursor
+from conftest import async_session_maker
+
+
+GET_PARAMS = [
+    {"from_weight": 100, "to_weight": 5000},
+    {"from_length": 10, "to_length": 500, "from_created_at": "2023-03-01", "to_created_at": "2023-06-30"},
+    {"from_deleted_at": "2023-01-01", "to_deleted_at": "2023-12-31"},
+    {"from_created_at": "2023-02-01", "to_created_at": "2023-02-01"},
+    {"from_id": 5, "to_id": 200, "limit": 20},
+    {"from_weight": 1, "to_weight": 100000, "limit": 50, "cursor": encode_cursor(30)},
+    {"from_created_at": "2000-01-01T00:00:00", "to_created_at": "2100-01-01T00:00:00"},
+]
+DATE_RANGES = [
+    {"from_date": "2023-01-01", "to_date": "2023-12-31"},
+    {"from_date": "2023-03-05T10:30:00", "to_date": "2023-07-20T12:00:00"},
+    {"from_date": "2022-01-01", "to_date": "2027-12-31"},
+    {"from_date": "2000-01-01", "to_date": "2000-12-31"},
+]
+
+
+@pytest.fixture
+async def create_random_coils():
+    rng = random.Random(22)
+    coils = []
+    for _ in range(300):
+        created_at = datetime(2023, 1, 1) + timedelta(seconds=rng.randrange(365 * 86400))
+        deleted_at = created_at + timedelta(seconds=rng.randrange(60 * 86400)) if rng.random() < 0.4 else None
+        coils.append({
+            "length": rng.randint(1, 1000), "weight": rng.randint(1, 10000),
+            "created_at": created_at, "deleted_at": deleted_at,
+        })
+
+    async with async_session_maker() as session:
+        await session.execute(insert(Coil).values(coils))
+        await rebuild_coil_daily_rollup(session)
+        await session.commit()
+
+@pytest.fixture
+async def coil_store():
+    change_feed = CoilChangeFeed(
+        config.db, async_session_maker, StatsCache(max_size=10, ttl=60, long_ttl=60), buffer_size=100
+    )
+    coil_store = CoilColumnStore(async_session_maker, change_feed, heartbeat=0.1)
+    yield coil_store
+    await coil_store.stop()
+    await change_feed.stop()
+
+async def assert_consistent(coil_store: CoilColumnStore):
+    async with async_session_maker() as session:
+        for params in GET_PARAMS:
+            range_params = CoilSchemaGetParams(**params)
+            rows = sorted(map(tuple, await get_coils(range_params, session, lookahead=1)))
+            assert sorted(coil_store.get_coils(range_params, lookahead=1)) == rows, params
+
+            rows = sorted(map(tuple, await get_coils(range_params, session)))
+            chunks = [rows async for rows in coil_store.stream_coil_rows(range_params, 7)]
+            assert sorted(row for chunk in chunks for row in chunk) == rows, params
+
+        for params in DATE_RANGES:
+            date_range = DateRangeSchema(**params)
+            assert coil_store.get_occupancy(date_range, "day") == await get_coil_occupancy(date_range, "day", session)
+
+    for params in DATE_RANGES:
+        date_range = DateRangeSchema(**params)
+        assert coil_store.get_stats_summary(date_range) == await get_coil_stats_summary(date_range, async_session_maker), params
+
+    date_range = DateRangeSchema(from_date="2023-05-01T10:00:00", to_date="2023-05-12T18:00:00")
+    async with async_session_maker() as session:
+        assert coil_store.get_occupancy(date_range, "hour") == await get_coil_occupancy(date_range, "hour", session)
+
+
+async def test_coil_store_matches_sql(clear_coils_table, create_dated_coils, create_random_coils, coil_store: CoilColumnStore):
+    await coil_store.load()
+    assert len(coil_store) == 304
+
+    await assert_consistent(coil_store)
+
+async def test_coil_store_follows_changes(
+    async_client: AsyncClient, clear_coils_table, create_random_coils, coil_store: CoilColumnStore
+):
+    coil_store.start()
+    async with async_session_maker() as session:
+        assert await coil_store.sync(session, timeout=5)
+
+    response = await async_client.post(
+        "/api/coil/batch", json=[{"length": length, "weight": length * 10} for length in range(1, 30)]
+    )
+    ids = response.json()["ids"]
+    await async_client.post("/api/coil/batch/delete", json={"ids": [ids[0], ids[5], 3, 40]})
+    await async_client.delete(f"/api/coil/{ids[7]}")
+
+    async with async_session_maker() as session:
+        assert await coil_store.sync(session, timeout=5)
+    assert len(coil_store) == 329
+
+    await assert_consistent(coil_store)
+
+async def test_coil_store_merges_out_of_order_changes(clear_coils_table, create_random_coils, coil_store: CoilColumnStore):
+    async with async_session_maker() as session:
+        await session.execute(delete(Coil).where(Coil.id.between(100, 120)))
+        await rebuild_coil_daily_rollup(session)
+        await session.commit()
+    await coil_store.load()
+    seq = coil_store.applied_seq
+
+    # ids of transactions that committed late, created and deleted in the middle of the arrays;
+    # a coil that is deleted already gets a new deletion time
+    coils = [
+        {"id": id, "length": id, "weight": id * 10, "created_at": datetime(2023, 2, 1) + timedelta(hours=id),
+         "deleted_at": None}
+        for id in (105, 101, 110)
+    ]
+    deletions = {5: datetime(2023, 3, 1), 101: datetime(2023, 2, 20), 250: datetime(2024, 1, 1)}
+    async with async_session_maker() as session:
+        deleted = (await session.execute(select(Coil.id).where(Coil.deleted_at.is_not(None)).limit(1))).scalar()
+    deletions[deleted] = datetime(2023, 12, 31)
+    async with async_session_maker() as session:
+        await session.execute(insert(Coil).values(coils))
+        for id, deleted_at in deletions.items():
+            await session.execute(update(Coil).where(Coil.id == id).values(deleted_at=deleted_at))
+        await rebuild_coil_daily_rollup(session)
+        await session.commit()
+
+    for coil in coils:
+        seq += 1
+        coil_store.apply(CoilChange(seq=seq, kind="created", coil_id=coil["id"], length=coil["length"],
+                                    weight=coil["weight"], created_at=coil["created_at"], deleted_at=None))
+    assert len(coil_store) == 282
+    for id, deleted_at in deletions.items():
+        seq += 1
+        coil_store.apply(CoilChange(seq=seq, kind="deleted", coil_id=id, length=0, weight=0,
+                                    created_at=datetime(2023, 1, 1), deleted_at=deleted_at))
+
+    await assert_consistent(coil_store)
+
+    # a stream started before a merge reads the arrays as they were
+    chunks = coil_store.stream_coil_rows(CoilSchemaGetParams(from_id=1, to_id=400), 7)
+    rows = await anext(chunks)
+    seq += 1
+    coil_store.apply(CoilChange(seq=seq, kind="deleted", coil_id=300, length=0, weight=0,
+                                created_at=datetime(2023, 1, 1), deleted_at=datetime(2025, 1, 1)))
+    assert len(coil_store) == 282
+    rows += [row async for chunk in chunks for row in chunk]
+    assert next(row for row in rows if row.id == 300).deleted_at != datetime(2025, 1, 1)
+    assert coil_store.deleted_at[-1] == np.datetime64(datetime(2025, 1, 1))
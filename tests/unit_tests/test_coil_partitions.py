@@ -0,0 +1,37 @@
+from datetime import date, datetime
+
+from sqlalchemy import insert, select, text
+
+from conftest import async_session_maker
+
+from src.coil.models import Coil
+from src.coil.partitions import add_months, create_coil_partitions
+
+
+async def test_create_coil_partitions(clear_coils_table):
+    async with async_session_maker() as session:
+        await session.execute(insert(Coil), [
+            {"length": 10, "weight": 100, "created_at": datetime(2023, 5, 10)},
+            {"length": 20, "weight": 200, "created_at": datetime(2023, 6, 20)},
+        ])
+        # rows written before their month has a partition wait in the default one
+        assert await session.scalar(text("SELECT count(*) FROM coil_coils_default")) == 2
+
+        assert await create_coil_partitions(session, date(2023, 5, 1), date(2023, 6, 1)) == 2
+        assert await create_coil_partitions(session, date(2023, 5, 1), date(2023, 6, 1)) == 0
+
+        result = await session.execute(select(text("tableoid::regclass::text"), Coil.weight).order_by(Coil.id))
+        assert result.all() == [("coil_coils_2023_05", 100), ("coil_coils_2023_06", 200)]
+
+        plan = await session.execute(text(
+            "EXPLAIN SELECT * FROM coil_coils WHERE created_at >= '2023-06-01' AND created_at < '2023-07-01'"
+        ))
+        plan = "\n".join(row[0] for row in plan.all())
+        assert "coil_coils_2023_06" in plan
+        assert "coil_coils_2023_05" not in plan and "coil_coils_default" not in plan
+
+        await session.rollback()
+
+def test_add_months():
+    assert add_months(date(2023, 11, 15), 3) == date(2024, 2, 1)
+    assert add_months(date(2023, 1, 1), 0) == date(2023, 1, 1)
@@ -0,0 +1,45 @@
+import pytest
+
+from fastapi import Response
+from httpx import AsyncClient
+
+
+@pytest.mark.parametrize("at, ids", [
+    ("2023-02-01", []),
+    ("2023-03-01T11:00:00", [1]),
+    ("2023-03-03", [1, 2, 3]),
+    # a coil deleted exactly at `at` is no longer on hand, one created later is not yet
+    ("2023-03-04T10:00:00", [1, 2]),
+    ("2023-03-05", [1, 2, 4]),
+    ("2023-03-06", [2, 4]),
+])
+async def test_get_coil_snapshot(async_client: AsyncClient, clear_coils_table, create_dated_coils, at, ids):
+    response: Response = await async_client.get("/api/coil/snapshot", params={"at": at})
+    assert response.status_code == 200
+
+    snapshot = response.json()
+    # the fixture coils have lengths 10, 20, 30, 40 in the order of their ids
+    assert snapshot["amount"] == len(ids)
+    assert snapshot["total_length"] == sum(10 * i for i in ids)
+    assert snapshot["total_weight"] == sum(100 * i for i in ids)
+    assert snapshot["coils"] is None
+
+    response = await async_client.get("/api/coil/snapshot", params={"at": at, "from_weight": 150, "to_weight": 350})
+    assert response.json()["amount"] == len([i for i in ids if i in (2, 3)])
+
+async def test_get_coil_snapshot_pages(async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    params = {"at": "2023-03-03", "limit": 2}
+    response: Response = await async_client.get("/api/coil/snapshot", params=params)
+    assert response.status_code == 200
+    first_page = response.json()
+    assert first_page["amount"] == 3
+    assert [coil["length"] for coil in first_page["coils"]] == [10, 20]
+
+    response = await async_client.get(
+        "/api/coil/snapshot", params={**params, "cursor": response.headers["x-next-cursor"]}
+    )
+    assert [coil["length"] for coil in response.json()["coils"]] == [30]
+    assert "x-next-cursor" not in response.headers
+
+    response = await async_client.get("/api/coil/snapshot", params={"at": "2023-03-03", "cursor": "MQ"})
+    assert response.status_code == 422
@@ -0,0 +1,109 @@
+import pytest
+
+from fastapi import Response
+from httpx import AsyncClient
+
+from sqlalchemy import select
+
+from conftest import async_session_maker
+
+from src.coil.models import CoilDailyRollup
+from src.coil.rollup import rebuild_coil_daily_rollup
+
+
+@pytest.mark.parametrize(
+    "from_date, to_date, expected_status_code, expected_values",
+    [
+        ("2023-03-01", "2023-03-31", 200, {
+            "amount": 4,
+            "deleted_amount": 2,
+            "average_length": 25.0,
+            "average_weight": 250.0,
+            "max_length": 40,
+            "min_length": 10,
+            "max_weight": 400,
+            "min_weight": 100,
+            "total_weight": 1000,
+            "creation_max_time_gap": "2 days, 0:00:00",
+            "creation_min_time_gap": "2:00:00",
+            "deletion_max_time_gap": "1 day, 0:00:00",
+            "deletion_min_time_gap": "1 day, 0:00:00",
+            "max_amount_day": "2023-03-02",
+            "min_amount_day": "2023-03-01",
+            "max_total_weight_day": "2023-03-04",
+            "min_total_weight_day": "2023-03-01",
+        }),
+        ("2023-03-02", "2023-03-02", 200, {
+            "amount": 1,
+            "deleted_amount": 1,
+            "creation_max_time_gap": None,
+            "deletion_max_time_gap": None,
+            "max_amount_day": "2023-03-02",
+            "min_amount_day": "2023-03-02",
+        }),
+        ("2023-03-01T11:00:00", "2023-03-04T11:00:00", 200, {
+            "amount": 2,
+            "deleted_amount": 1,
+            "total_weight": 500,
+            "max_weight": 300,
+            "min_weight": 200,
+        }),
+        ("2000-01-01", "2000-12-31", 404, None),
+    ]
+)
+async def test_get_coil_stats(from_date, to_date, expected_status_code, expected_values, async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    response: Response = await async_client.get(f"/api/coil/stats?from_date={from_date}&to_date={to_date}")
+    assert response.status_code == expected_status_code
+
+    if expected_values:
+        response_data = response.json()
+
+        for key, value in expected_values.items():
+            assert response_data[key] == value
+
+
+async def test_daily_rollup_is_maintained_by_writes(async_client: AsyncClient, clear_coils_table):
+    await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+    await async_client.post("/api/coil/batch", json=[{"length": 20, "weight": 200}, {"length": 5, "weight": 50}])
+    await async_client.delete("/api/coil/2")
+
+    async with async_session_maker() as session:
+        query = select(CoilDailyRollup)
+        maintained = [row.__dict__ for row in (await session.execute(query)).scalars()]
+
+        await rebuild_coil_daily_rollup(session)
+        session.expire_all()
+        rebuilt = [row.__dict__ for row in (await session.execute(query)).scalars()]
+
+    fields = ("day", "amount", "deleted_amount", "total_length", "total_weight",
+              "max_length", "min_length", "max_weight", "min_weight")
+    assert [{field: row[field] for field in fields} for row in maintained] == \
+           [{field: row[field] for field in fields} for row in rebuilt]
+    assert maintained[0]["amount"] == 3
+    assert maintained[0]["deleted_amount"] == 1
+
+
+@pytest.mark.parametrize(
+    "query_params, expected_series",
+    [
+        ({"from_date": "2023-03-01", "to_date": "2023-03-05", "bucket": "day"}, [
+            ("2023-03-01T00:00:00", 2, 300),
+            ("2023-03-02T00:00:00", 3, 600),
+            ("2023-03-03T00:00:00", 3, 600),
+            ("2023-03-04T00:00:00", 3, 700),
+            ("2023-03-05T00:00:00", 2, 600),
+        ]),
+        ({"from_date": "2023-03-04T09:00:00", "to_date": "2023-03-04T12:59:59", "bucket": "hour"}, [
+            ("2023-03-04T09:00:00", 3, 600),
+            ("2023-03-04T10:00:00", 2, 300),
+            ("2023-03-04T11:00:00", 2, 300),
+            ("2023-03-04T12:00:00", 3, 700),
+        ]),
+    ]
+)
+async def test_get_coil_occupancy(query_params, expected_series, async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    response: Response = await async_client.get("/api/coil/stats/occupancy", params=query_params)
+    assert response.status_code == 200
+
+    series = [(point["bucket"], point["amount"], point["total_weight"]) for point in response.json()]
+    assert series == expected_series
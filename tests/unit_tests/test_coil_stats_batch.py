@@ -0,0 +1,66 @@
+import pytest
+
+from fastapi import Response
+from httpx import AsyncClient
+
+from src.coil.utils import split_date_range
+from src.coil.schemas import DateRangeSchema
+
+
+RANGES = [
+    {"from_date": "2023-03-01", "to_date": "2023-03-31"},
+    {"from_date": "2023-03-02", "to_date": "2023-03-02"},
+    {"from_date": "2023-03-01T11:00:00", "to_date": "2023-03-04T11:00:00"},
+    {"from_date": "2000-01-01", "to_date": "2000-12-31"},
+]
+
+
+async def test_stats_batch_matches_stats(async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    response: Response = await async_client.post("/api/coil/stats/batch", json={"ranges": RANGES})
+    assert response.status_code == 200
+
+    batch = response.json()
+    assert len(batch) == len(RANGES)
+    for date_range, range_stats in zip(RANGES, batch):
+        stats_response = await async_client.get("/api/coil/stats", params=date_range)
+        expected = stats_response.json() if stats_response.status_code == 200 else None
+        assert range_stats["stats"] == expected, date_range
+
+async def test_stats_batch_buckets(async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    response: Response = await async_client.post(
+        "/api/coil/stats/batch", json={"from_date": "2023-02-27", "to_date": "2023-03-05", "bucket": "day"}
+    )
+    assert response.status_code == 200
+
+    batch = response.json()
+    assert [range_stats["from_date"] for range_stats in batch][:3] == [
+        "2023-02-27T00:00:00", "2023-02-28T00:00:00", "2023-03-01T00:00:00"
+    ]
+    assert [range_stats["stats"] and range_stats["stats"]["amount"] for range_stats in batch] == [
+        None, None, 2, 1, None, 1, None
+    ]
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {},
+        {"ranges": []},
+        {"ranges": RANGES, "bucket": "day"},
+        {"from_date": "2023-03-01", "to_date": "2023-03-31"},
+    ]
+)
+async def test_stats_batch_validation(body, async_client: AsyncClient):
+    response: Response = await async_client.post("/api/coil/stats/batch", json=body)
+    assert response.status_code == 422
+
+def test_split_date_range():
+    date_range = DateRangeSchema(from_date="2023-01-15", to_date="2023-03-10")
+
+    assert split_date_range(date_range.from_date, date_range.to_date, "month") == [
+        (date_range.from_date, DateRangeSchema(from_date="2023-01-01", to_date="2023-01-31").to_date),
+        (DateRangeSchema(from_date="2023-02-01", to_date="2023-02-28").from_date,
+         DateRangeSchema(from_date="2023-02-01", to_date="2023-02-28").to_date),
+        (DateRangeSchema(from_date="2023-03-01", to_date="2023-03-10").from_date, date_range.to_date),
+    ]
+    weeks = split_date_range(date_range.from_date, date_range.to_date, "week")
+    assert len(weeks) == 9 and weeks[1][0].weekday() == 0
@@ -0,0 +1,60 @@
+import pytest
+
+from fastapi import Response
+from httpx import AsyncClient
+
+
+RANGE = {"from_date": "2023-03-01", "to_date": "2023-03-31"}
+
+
+async def test_exact_distribution(async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    response: Response = await async_client.get(
+        "/api/coil/stats/distribution", params={**RANGE, "mode": "exact", "buckets": 3}
+    )
+    assert response.status_code == 200
+
+    distribution = response.json()
+    assert distribution["amount"] == 4
+    assert distribution["length"]["p50"] == 25
+    assert distribution["weight"]["p90"] == pytest.approx(370)
+    assert [bucket["amount"] for bucket in distribution["length"]["histogram"]] == [1, 1, 2]
+    assert distribution["length"]["histogram"][0]["from_value"] == 10
+    assert distribution["length"]["histogram"][-1]["to_value"] == 40
+
+@pytest.mark.parametrize(
+    "date_range",
+    [
+        RANGE,
+        {"from_date": "2023-03-01T11:00:00", "to_date": "2023-03-04T11:00:00"},
+    ]
+)
+async def test_approximate_distribution(date_range, async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    exact = (await async_client.get("/api/coil/stats/distribution", params={**date_range, "mode": "exact"})).json()
+    approximate = (await async_client.get(
+        "/api/coil/stats/distribution", params={**date_range, "mode": "approximate"}
+    )).json()
+
+    assert approximate["amount"] == exact["amount"]
+    for metric in ("length", "weight"):
+        for quantile in ("p50", "p90", "p99"):
+            assert approximate[metric][quantile] == pytest.approx(exact[metric][quantile], rel=0.02)
+        assert sum(bucket["amount"] for bucket in approximate[metric]["histogram"]) == exact["amount"]
+
+async def test_sketch_follows_writes(async_client: AsyncClient, clear_coils_table):
+    for length in (10, 20, 30):
+        response: Response = await async_client.post("/api/coil", json={"length": length, "weight": 100})
+        assert response.status_code == 201
+
+    response = await async_client.get(
+        "/api/coil/stats/distribution",
+        params={"from_date": "2000-01-01", "to_date": "2100-01-01", "mode": "approximate"}
+    )
+    assert response.status_code == 200
+    assert response.json()["amount"] == 3
+    assert response.json()["length"]["p50"] == pytest.approx(20, rel=0.02)
+
+async def test_distribution_not_found(async_client: AsyncClient, clear_coils_table):
+    response: Response = await async_client.get(
+        "/api/coil/stats/distribution", params={"from_date": "2000-01-01", "to_date": "2000-12-31"}
+    )
+    assert response.status_code == 404
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from fastapi import Response
+from httpx import AsyncClient
+
+from sqlalchemy import insert, update
+
+from conftest import async_session_maker
+
+from src.coil.models import CoilStatsJob
+
+
+DATE_RANGE = {"from_date": "2023-03-01", "to_date": "2023-03-31"}
+
+
+async def test_stats_job(async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    response: Response = await async_client.post("/api/coil/stats/jobs", json=DATE_RANGE)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "pending"
+
+    response = await async_client.get(f"/api/coil/stats/jobs/{job['id']}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+
+    stats_response = await async_client.get("/api/coil/stats", params=DATE_RANGE)
+    assert response.json()["result"] == stats_response.json()
+
+    # a finished result is shared until it expires
+    response = await async_client.post("/api/coil/stats/jobs", json=DATE_RANGE)
+    assert response.json()["id"] == job["id"]
+    assert response.json()["status"] == "done"
+
+async def test_stats_job_without_data(async_client: AsyncClient, clear_coils_table):
+    response: Response = await async_client.post("/api/coil/stats/jobs", json={"from_date": "2000-01-01", "to_date": "2000-12-31"})
+    job_id = response.json()["id"]
+
+    response = await async_client.get(f"/api/coil/stats/jobs/{job_id}")
+    assert response.json()["status"] == "failed"
+    assert response.json()["error"].startswith("No data was found")
+
+async def test_in_flight_stats_job_is_shared(async_client: AsyncClient, clear_coils_table):
+    async with async_session_maker() as session:
+        job_id = await session.scalar(insert(CoilStatsJob).values(
+            from_date=datetime(2023, 3, 1), to_date=datetime(2023, 3, 31, 23, 59, 59, 999999), status="running",
+        ).returning(CoilStatsJob.id))
+        await session.commit()
+
+    response: Response = await async_client.post("/api/coil/stats/jobs", json=DATE_RANGE)
+    assert response.json()["id"] == job_id
+    assert response.json()["status"] == "running"
+
+async def test_stats_job_expires(async_client: AsyncClient, clear_coils_table, create_dated_coils):
+    response: Response = await async_client.post("/api/coil/stats/jobs", json=DATE_RANGE)
+    job_id = response.json()["id"]
+
+    async with async_session_maker() as session:
+        await session.execute(update(CoilStatsJob).values(finished_at=datetime.utcnow() - timedelta(days=1)))
+        await session.commit()
+
+    response = await async_client.get(f"/api/coil/stats/jobs/{job_id}")
+    assert response.status_code == 404
+
+    response = await async_client.post("/api/coil/stats/jobs", json=DATE_RANGE)
+    assert response.json()["id"] != job_id
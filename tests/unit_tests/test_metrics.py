@@ -0,0 +1,45 @@
+import pytest
+
+from fastapi import Response
+from httpx import AsyncClient
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from conftest import engine_test
+
+from src.database import SlowQueryLog
+
+
+async def test_metrics_endpoint(async_client: AsyncClient, clear_coils_table):
+    await async_client.post("/api/coil", json={"length": 10, "weight": 100})
+    await async_client.get("/api/coil", params={"from_id": 1, "to_id": 10})
+    await async_client.delete("/api/coil/1")
+
+    response: Response = await async_client.get("/metrics")
+    assert response.status_code == 200
+
+    metrics = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/coil",status="200"}' in metrics
+    assert 'http_request_duration_seconds_count{method="DELETE",route="/api/coil/{id}",status="204"}' in metrics
+    assert 'db_statement_duration_seconds_count{operation="INSERT",source="create_coils"}' in metrics
+    assert 'db_statement_duration_seconds_count{operation="SELECT",source="get_coils"}' in metrics
+    assert 'db_statement_duration_seconds_count{operation="WITH",source="soft_delete_coils"}' in metrics
+
+async def test_failed_statements_leave_no_timers():
+    slow_query_log = SlowQueryLog(threshold_ms=0, explain_sample_rate=0, size=10)
+    slow_query_log.install(engine_test.sync_engine)
+    try:
+        async with engine_test.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(DBAPIError):
+                    await connection.execute(text("SELECT 1 / 0"))
+                await connection.rollback()
+            await connection.execute(text("SELECT 1"))
+
+            # nothing of the failed statements stays on the connection for the next ones to pick up
+            assert connection.info == {}
+    finally:
+        slow_query_log.uninstall()
+
+    assert [entry["statement"] for entry in slow_query_log.entries] == ["SELECT 1"]
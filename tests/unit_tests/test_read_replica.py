@@ -0,0 +1,47 @@
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from conftest import async_session_maker, engine_test
+
+from src.config import config
+from src.database import ReadReplicaRouter
+
+
+def make_router(replica: async_sessionmaker[AsyncSession], max_lag: float = 5) -> ReadReplicaRouter:
+    return ReadReplicaRouter(primary=async_session_maker, replica=replica, max_lag=max_lag, check_interval=60)
+
+async def test_replica_is_used_while_healthy():
+    # the test database is a primary, so it reports no lag
+    replica = async_sessionmaker(engine_test, expire_on_commit=False)
+    router = make_router(replica)
+
+    assert await router.get_session_maker() is replica
+    assert router.lag == 0
+
+async def test_falls_back_when_replica_is_unavailable():
+    unavailable = create_async_engine(
+        config.db.URL.replace(f":{config.db.PORT}/", ":1/"), poolclass=NullPool
+    )
+    router = make_router(async_sessionmaker(unavailable))
+
+    assert await router.get_session_maker() is async_session_maker
+    assert router.healthy is False and router.lag is None
+
+async def test_falls_back_when_replica_lags(monkeypatch):
+    router = make_router(async_sessionmaker(engine_test), max_lag=5)
+
+    async def measure_lag():
+        return 30.0
+    monkeypatch.setattr(router, "measure_lag", measure_lag)
+
+    assert await router.get_session_maker() is async_session_maker
+    assert router.lag == 30.0
+
+    # the result is reused until check_interval passes
+    async def measure_lag():
+        return 0.0
+    monkeypatch.setattr(router, "measure_lag", measure_lag)
+    assert await router.get_session_maker() is async_session_maker
+
+    router.checked_at -= 60
+    assert await router.get_session_maker() is router.replica